@@ -1,17 +1,32 @@
 import os
 import time
 import asyncio
+import functools
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from dotenv import load_dotenv
-from yt_dlp import YoutubeDL
+from ydl_pool import YDLPool
 import logging
 import logging
 import database as db
 import random
-import requests
+from http_client import HttpClient
 import re 
+import threading
+from collections import deque
+from datetime import datetime
+from cache import LRUCache, StreamCache, stream_expiry, video_id_from_url
+from autoplay import AutoplayEngine
+import audio
+from loudness import LoudnessNormalizer
+from disk_cache import DiskCache
+from audio_workers import AudioWorkers
+from now_playing import NowPlayingScheduler, UNCHANGED
+from render import NowPlayingRenderer
+from message_registry import MessageRegistry
+from favorites import FavoritesIndex
+from resolver import AudioResolver, ResolveCancelled, PRIORITY_INTERACTIVE, PRIORITY_PLAYBACK, PRIORITY_BACKGROUND
 
 
 load_dotenv()
@@ -54,11 +69,64 @@ YDL_OPTIONS = { # Opciones de YoutubeDL
     "http_chunk_size": 10485760, # 10MB chunk para evitar throttling
     "force_generic_extractor": False,
 }
+YDL_FLAT_OPTIONS = {**YDL_OPTIONS, "extract_flat": True, "noplaylist": False} # Playlists (solo info básica)
+YDL_SEARCH_OPTIONS = {"extract_flat": "in_playlist", "quiet": True, "no_warnings": True} # Autoplay (búsqueda flat)
+
 FFMPEG_OPTIONS = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_at_eof 1",
     "options": "-vn"
 }
 FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+# Arranque rápido: ffmpeg usa el formato que ya conoce yt-dlp en vez de sondear el stream
+FFMPEG_FAST_START = os.getenv("FFMPEG_FAST_START", "1") != "0"
+
+# Reproducción: "opus" manda los paquetes Opus tal cual cuando se puede, "pcm" siempre decodifica
+AUDIO_MODE = os.getenv("AUDIO_MODE", audio.MODE_OPUS).lower()
+PLAYBACK_VOLUME = float(os.getenv("PLAYBACK_VOLUME", "0.5")) # Volumen de las pistas aún sin medir (1.0 = sin ganancia)
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-20")) # LUFS objetivo de la normalización
+LOUDNESS_ENABLED = os.getenv("LOUDNESS_ENABLED", "1") != "0"
+
+# Workers de audio: decodificación/ganancia/codificación en procesos ffmpeg fijados a núcleos
+# "auto" = todos los núcleos, un número = ese máximo, 0 = desactivado (PCM en el proceso del bot)
+AUDIO_WORKERS = os.getenv("AUDIO_WORKERS", "auto").lower()
+
+# Relevo entre canciones: la siguiente se arranca unos segundos antes de que acabe la actual
+HANDOFF_LEAD = float(os.getenv("HANDOFF_LEAD", "5")) # Segundos antes del final
+HANDOFF_PREBUFFER_FRAMES = int(os.getenv("HANDOFF_PREBUFFER_FRAMES", "50")) # Frames de 20 ms leídos por adelantado
+HANDOFF_CROSSFADE_MS = int(os.getenv("HANDOFF_CROSSFADE_MS", "0")) # 0 = corte seco (solo se mezcla PCM con PCM)
+
+# Renovación de URLs de stream (googlevideo caduca a las ~6 h: pistas largas, directos, pausas largas)
+STREAM_REFRESH_LEAD = int(os.getenv("STREAM_REFRESH_LEAD", "600")) # Segundos antes de expire= en que se renueva
+STREAM_RECOVERY_TIMEOUT = 15 # Segundos de silencio máximos mientras se recupera un stream cortado
+MAX_STREAM_RECOVERIES = 3 # Recuperaciones seguidas por pista antes de darla por terminada
+
+# Directos (radio 24/7, directos de YouTube/Twitch)
+LIVE_BUFFER_MS = int(os.getenv("LIVE_BUFFER_MS", "5000")) # Tope del buffer: distancia máxima al directo
+LIVE_STALL_TIMEOUT = float(os.getenv("LIVE_STALL_TIMEOUT", "10")) # Segundos sin datos antes de reconectar
+LIVE_MAX_RECOVERIES = int(os.getenv("LIVE_MAX_RECOVERIES", "10")) # Reconexiones seguidas antes de rendirse
+
+# Limpieza del chat: se borran los mensajes del bot (menos el reproductor) pasado un minuto
+CHAT_CLEAN_AFTER = 60 # Segundos
+CHAT_CLEAN_SLOTS = 12 # Cada canal se limpia en una de 12 franjas de 5 s dentro del minuto
+
+FAVORITES_INDEX_USERS = int(os.getenv("FAVORITES_INDEX_USERS", "1000")) # Usuarios con sus favoritos en memoria
+
+# Caché en disco de las pistas más repetidas (opcional: sin DISK_CACHE_DIR está desactivada)
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR")
+DISK_CACHE_MAX_MB = int(os.getenv("DISK_CACHE_MAX_MB", "2048"))
+DISK_CACHE_MIN_PLAYS = int(os.getenv("DISK_CACHE_MIN_PLAYS", "3")) # Reproducciones antes de guardarla
+
+# Pool de búsquedas (yt-dlp fuera del event loop)
+RESOLVER_WORKERS = int(os.getenv("RESOLVER_WORKERS", "4"))
+RESOLVER_TIMEOUT = float(os.getenv("RESOLVER_TIMEOUT", "30"))
+STREAM_CACHE_SIZE = int(os.getenv("STREAM_CACHE_SIZE", "512")) # Máx. streams resueltos en memoria
+
+# Instancias YoutubeDL reutilizables (una por hilo del resolver como máximo)
+ydl_pool = YDLPool({
+    "track": YDL_OPTIONS,
+    "flat": YDL_FLAT_OPTIONS,
+    "search": YDL_SEARCH_OPTIONS,
+}, size=max(2, RESOLVER_WORKERS))
 
 # Configuración Spotify (Opcional)
 import spotipy
@@ -89,97 +157,187 @@ def is_valid_youtube_url(url: str) -> bool:
     ]
     return any(re.match(pattern, url) for pattern in youtube_patterns)
 
-def get_spotify_queries(url: str):
-    """Devuelve lista de búsquedas (texto) para YouTube a partir de una URL de Spotify."""
+def spotify_entry(track: dict):
+    """Convierte un track de la API de Spotify en {"query", "spotify_id"}."""
+    name = track["name"]
+    artists = track.get("artists", [])
+    artist = artists[0]["name"] if artists else ""
+    return {"query": f"{name} {artist}".strip(), "spotify_id": track.get("id")}
+
+def spotify_placeholder(entry: dict):
+    """Track ligero para la cola: se resuelve (búsqueda en YouTube) al llegar su turno."""
+    return {
+        "title": entry["query"],
+        "webpage_url": f"ytsearch:{entry['query']}",
+        "duration": 0,
+        "thumbnail": None,
+        "spotify_id": entry.get("spotify_id"),
+    }
+
+SPOTIFY_PAGE_CONCURRENCY = 8 # Páginas de Spotify pedidas a la vez
+SPOTIFY_PLAYLIST_PAGE = 100 # Máximo que permite la API para playlist_items
+SPOTIFY_ALBUM_PAGE = 50 # Máximo que permite la API para album_tracks
+SPOTIFY_ITEM_FIELDS = "items(track(id,name,artists(name)))" # Solo lo que usa spotify_entry
+
+# playlist_id -> (snapshot_id, entries). Un snapshot igual = playlist sin cambios
+spotify_playlist_cache = LRUCache(maxsize=128)
+# album_id -> entries (los álbumes no cambian, caducan en un día por si acaso)
+spotify_album_cache = LRUCache(maxsize=128, ttl=86400)
+
+def spotify_id_from_url(url: str, kind: str):
+    """Saca el ID de una URL/URI de Spotify (open.spotify.com/playlist/ID o spotify:playlist:ID)."""
+    match = re.search(rf"{kind}[/:]([A-Za-z0-9]+)", url)
+    return match.group(1) if match else None
+
+async def _spotify_call(fn, *args, **kwargs):
+    """Las llamadas de spotipy son bloqueantes: se ejecutan fuera del event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+async def _spotify_pages(fetch_page, total, page_size, first_offset):
+    """Pide en paralelo (acotado) todas las páginas desde first_offset hasta total."""
+    sem = asyncio.Semaphore(SPOTIFY_PAGE_CONCURRENCY)
+
+    async def one(offset):
+        async with sem:
+            return await fetch_page(offset)
+
+    offsets = range(first_offset, total, page_size)
+    return await asyncio.gather(*(one(o) for o in offsets))
+
+async def get_spotify_tracks(url: str):
+    """Devuelve lista de {"query", "spotify_id"} (búsquedas para YouTube) a partir de una URL de Spotify."""
     if spotify is None:
+        # Sin API: para tracks sueltos basta con el scraping de la página
+        if "track" in url:
+            query = await spotify_track_query(url)
+            if query:
+                return [{"query": query, "spotify_id": spotify_id_from_url(url, "track")}]
         raise RuntimeError(
             "Spotify no está configurado. Revisa SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET en .env"
         )
 
     # Canción individual
     if "track" in url:
-        track = spotify.track(url)
-        name = track["name"]
-        artists = track.get("artists", [])
-        artist = artists[0]["name"] if artists else ""
-        return [f"{name} {artist}".strip()]
+        track = await _spotify_call(spotify.track, url)
+        return [spotify_entry(track)]
 
     # Playlist completa
     if "playlist" in url:
+        playlist_id = spotify_id_from_url(url, "playlist") or url
+        # 1 petición ligera: snapshot y total
+        meta = await _spotify_call(spotify.playlist, playlist_id, fields="snapshot_id,tracks.total")
+        snapshot = meta.get("snapshot_id")
+        total = meta.get("tracks", {}).get("total", 0)
+
+        cached = spotify_playlist_cache.get(playlist_id)
+        if cached and cached[0] == snapshot:
+            print(f"[SPOTIFY] Playlist {playlist_id} sin cambios (snapshot en caché): {len(cached[1])} canciones")
+            return list(cached[1])
+
+        async def fetch_page(offset):
+            return await _spotify_call(
+                spotify.playlist_items, playlist_id, offset=offset, limit=SPOTIFY_PLAYLIST_PAGE,
+                fields=SPOTIFY_ITEM_FIELDS, additional_types=["track"]
+            )
+
+        t0 = time.perf_counter()
+        pages = await _spotify_pages(fetch_page, total, SPOTIFY_PLAYLIST_PAGE, 0)
         queries = []
-        results = spotify.playlist_items(url, additional_types=["track"])
-        while True:
-            for item in results["items"]:
+        for page in pages: # gather mantiene el orden de los offsets
+            for item in page.get("items", []):
                 track = item.get("track")
-                if not track:
+                if not track or not track.get("name"):
                     continue
-                name = track["name"]
-                artists = track.get("artists", [])
-                artist = artists[0]["name"] if artists else ""
-                queries.append(f"{name} {artist}".strip())
-
-            # Paginación de Spotify
-            if results.get("next"):
-                results = spotify.next(results)
-            else:
-                break
-        return queries
+                queries.append(spotify_entry(track))
+        print(f"[SPOTIFY] Playlist {playlist_id}: {len(queries)} canciones en {len(pages)} páginas ({time.perf_counter() - t0:.2f}s)")
+        spotify_playlist_cache.put(playlist_id, (snapshot, queries))
+        return list(queries)
     
     # Album
     if "album" in url:
+        album_id = spotify_id_from_url(url, "album") or url
+        cached = spotify_album_cache.get(album_id)
+        if cached is not None:
+            return list(cached)
+
+        first = await _spotify_call(spotify.album_tracks, album_id, limit=SPOTIFY_ALBUM_PAGE)
+        total = first.get("total", len(first["items"]))
+
+        async def fetch_page(offset):
+            return await _spotify_call(spotify.album_tracks, album_id, limit=SPOTIFY_ALBUM_PAGE, offset=offset)
+
+        pages = [first] + await _spotify_pages(fetch_page, total, SPOTIFY_ALBUM_PAGE, SPOTIFY_ALBUM_PAGE)
         queries = []
-        results = spotify.album_tracks(url)
-        while True:
-            for item in results["items"]: # Album tracks are simpler
-                name = item["name"]
-                artists = item.get("artists", [])
-                artist = artists[0]["name"] if artists else ""
-                queries.append(f"{name} {artist}".strip())
-                
-            if results.get("next"):
-                results = spotify.next(results)
-            else:
-                break
-        return queries
+        for page in pages:
+            for item in page["items"]: # Album tracks are simpler
+                queries.append(spotify_entry(item))
+        spotify_album_cache.put(album_id, queries)
+        return list(queries)
 
     raise ValueError("Solo se soportan URLs de track, playlist o álbum de Spotify.")
 
 
 
-def buscar_audio(url: str): # Busca el audio en Youtube
+SPOTIFY_MATCH_MIN_CONFIDENCE = 0.5 # Por debajo, el mapeo guardado no se usa y se vuelve a buscar
+SPOTIFY_MATCH_REVERIFY_DAYS = 7 # Cada cuánto se refresca last_verified de un mapeo usado
+
+def match_confidence(query: str, title: str) -> float:
+    """Proporción de palabras de la búsqueda que aparecen en el título encontrado."""
+    q_words = set(re.findall(r"\w+", query.lower()))
+    t_words = set(re.findall(r"\w+", (title or "").lower()))
+    if not q_words:
+        return 0.0
+    return round(len(q_words & t_words) / len(q_words), 2)
+
+def buscar_audio(url: str, spotify_id=None): # Busca el audio en Youtube
+    """
+    Extrae la info de audio (BLOQUEANTE, se ejecuta en el pool del resolver).
+    Devuelve dict con url (stream), title, duration, thumbnail, webpage_url, id,
+    datos del formato y gain_db (normalización guardada).
+    Las búsquedas "ytsearch:" (Spotify) consultan antes la tabla de mapeo.
+    """
     print(f"\n[YT-DLP] Buscando audio para: {url}")
     
-    # 🟢 SOPORTE SPOTIFY (Scraping básico)
-    if "open.spotify.com" in url and "track" in url:
-        try:
-            print("[SPOTIFY] Enlace detectado. Intentando extraer info...")
-            # Headers para evitar bloqueos
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
-            r = requests.get(url, headers=headers)
-            
-            if r.status_code == 200:
-                # Buscamos og:title (Título - Artista)
-                # Suele ser: <meta property="og:title" content="Canción" />
-                # y <meta property="og:description" content="Artista · Song · 2023" />
-                
-                title_match = re.search(r'<meta property="og:title" content="(.*?)"', r.text)
-                desc_match = re.search(r'<meta property="og:description" content="(.*?)"', r.text)
-                
-                if title_match:
-                    sp_title = title_match.group(1)
-                    sp_artist = ""
-                    if desc_match:
-                        # La descripción suele ser "Artist · Song · Year"
-                        sp_artist = desc_match.group(1).split("·")[0].strip()
-                    
-                    search_query = f"{sp_title} {sp_artist} audio"
-                    print(f"[SPOTIFY] Encontrado: {sp_title} - {sp_artist}")
-                    print(f"[SPOTIFY] Buscando en YouTube: {search_query}")
-                    url = f"ytsearch:{search_query}" # Cambiamos la URL a búsqueda de YT
-        except Exception as e:
-            print(f"[SPOTIFY] Error al procesar enlace: {e}")
+    # 🟢 MAPEO SPOTIFY -> YOUTUBE: si ya sabemos qué vídeo es, nos saltamos la búsqueda
+    search_query = url[len("ytsearch:"):] if url.startswith("ytsearch:") else None
+    if search_query:
+        match = db.get_spotify_match(search_query, spotify_id)
+        if match and match["confidence"] >= SPOTIFY_MATCH_MIN_CONFIDENCE:
+            try:
+                info = extraer_info(f"https://www.youtube.com/watch?v={match['video_id']}")
+                print(f"[MAPEO] '{search_query}' -> {match['video_id']} (sin búsqueda)")
+                if match["last_verified"] and (datetime.now() - match["last_verified"]).days >= SPOTIFY_MATCH_REVERIFY_DAYS:
+                    db.save_spotify_match(search_query, info["id"], info["title"], info["duration"], info["thumbnail"], match["confidence"], spotify_id)
+                return with_stored_gain(info)
+            except Exception as e:
+                print(f"[MAPEO] El vídeo guardado ya no está disponible ({e}). Buscando de nuevo...")
+
+    info = extraer_info(url)
+    if search_query and info.get("id"):
+        confidence = match_confidence(search_query, info["title"])
+        db.save_spotify_match(search_query, info["id"], info["title"], info["duration"], info["thumbnail"], confidence, spotify_id)
+    return with_stored_gain(info)
+
+def with_stored_gain(info: dict):
+    """Añade a la info la ganancia de normalización guardada en la BD (gain_db, o None)."""
+    row = db.get_loudness(info["id"]) if LOUDNESS_ENABLED and info.get("id") else None
+    info["gain_db"] = row["gain_db"] if row else None
+    return info
+
+FORMAT_FIELDS = ("format_id", "url", "acodec", "ext", "abr", "asr", "protocol")
+
+def audio_formats(info: dict):
+    """Formatos de solo audio de una info de yt-dlp (solo los campos que usa el bot)."""
+    return [
+        {k: f.get(k) for k in FORMAT_FIELDS}
+        for f in info.get("formats") or []
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none") and f.get("url")
+    ]
 
-    with YoutubeDL(YDL_OPTIONS) as ydl: # YoutubeDL con opciones
+def extraer_info(url: str):
+    """Extracción con yt-dlp (bloqueante). Devuelve el dict de info que usa el bot."""
+    with ydl_pool.get("track") as ydl: # YoutubeDL reutilizado del pool
         info = ydl.extract_info(url, download=False) # Extrae la información del video
         if "entries" in info: # Si es playlist (o resultado de búsqueda), coge el primer ítem
             info = info["entries"][0]
@@ -191,32 +349,191 @@ def buscar_audio(url: str): # Busca el audio en Youtube
         print(f"[YT-DLP] Duración: {duration}s")
         print(f"[YT-DLP] URL obtenida: {stream_url[:80]}...")
         thumbnail = info.get("thumbnail") # Obtener miniatura
-        return stream_url, title, duration, thumbnail, webpage_url
+        return {
+            "url": stream_url,
+            "title": title,
+            "duration": duration or 0,
+            "thumbnail": thumbnail,
+            "webpage_url": webpage_url,
+            "id": info.get("id"),
+            # Formato elegido por yt-dlp (para decidir si se puede hacer passthrough Opus)
+            "acodec": info.get("acodec"),
+            "ext": info.get("ext"),
+            "abr": info.get("abr"),
+            "asr": info.get("asr"),
+            "extractor": info.get("extractor_key"),
+            "protocol": info.get("protocol"),
+            "format_id": info.get("format_id"),
+            "formats": audio_formats(info), # Alternativas de solo audio (selección por bitrate del canal)
+            "is_live": bool(info.get("is_live")),
+        }
+
+audio_workers = AudioWorkers(None if AUDIO_WORKERS == "auto" else int(AUDIO_WORKERS)) if AUDIO_WORKERS != "0" else None
+
+# Normalización de volumen (medida en segundo plano, una vez por vídeo)
+loudness = LoudnessNormalizer(executable=FFMPEG_PATH, target=LOUDNESS_TARGET)
+
+disk_cache = DiskCache(DISK_CACHE_DIR, DISK_CACHE_MAX_MB * 1024 * 1024, min_plays=DISK_CACHE_MIN_PLAYS, executable=FFMPEG_PATH) if DISK_CACHE_DIR else None
+
+# Caché de streams: seeks, "anterior" y repeticiones no vuelven a pasar por yt-dlp
+stream_cache = StreamCache(maxsize=STREAM_CACHE_SIZE)
+
+# Resolver asíncrono: `await resolver.resolve(url)` en vez de llamar a buscar_audio directamente
+resolver = AudioResolver(buscar_audio, workers=RESOLVER_WORKERS, timeout=RESOLVER_TIMEOUT, cache=stream_cache)
+
+def buscar_recomendaciones(query: str, n=10):
+    """Búsqueda flat en YouTube para el autoplay (BLOQUEANTE). Sin extraer streams."""
+    print(f"[AUTOPLAY] Buscando: ytsearch{n}:{query}")
+    with ydl_pool.get("search") as ydl:
+        info = ydl.extract_info(f"ytsearch{n}:{query}", download=False)
+        return [e for e in info.get("entries") or [] if e]
+
+autoplay = AutoplayEngine(resolver, buscar_recomendaciones)
+
+def autoplay_exclusions(queue):
+    """IDs de vídeo que el autoplay no debe repetir (cola + historial)."""
+    ids = set()
+    for t in queue.get("tracks", []):
+        vid = video_id_from_url(t.get("webpage_url"))
+        if vid: ids.add(vid)
+    for h in queue.get("history", []):
+        vid = video_id_from_url(h.get("url"))
+        if vid: ids.add(vid)
+    return ids
+
+# Cliente HTTP compartido (scraping de og:meta de Spotify)
+http = HttpClient(timeout=5.0, retries=2)
+spotify_meta_cache = LRUCache(maxsize=512) # track_id -> búsqueda para YouTube
+
+async def spotify_track_query(url: str):
+    """
+    🟢 SOPORTE SPOTIFY (Scraping básico, sin API): lee og:title/og:description
+    de la página del track y devuelve la búsqueda para YouTube (o None).
+    """
+    key = spotify_id_from_url(url, "track") or url
+    cached = spotify_meta_cache.get(key)
+    if cached is not None:
+        return cached
 
-def buscar_playlist(url: str):
-    """Busca una playlist en YouTube y devuelve lista de videos (flat)."""
+    try:
+        print("[SPOTIFY] Enlace detectado. Intentando extraer info...")
+        status, html = await http.get_text(url)
+        if status != 200:
+            print(f"[SPOTIFY] La página devolvió {status}")
+            return None
+    except Exception as e:
+        print(f"[SPOTIFY] Error al procesar enlace: {e}")
+        return None
+
+    # Buscamos og:title (Título - Artista)
+    # Suele ser: <meta property="og:title" content="Canción" />
+    # y <meta property="og:description" content="Artista · Song · 2023" />
+    title_match = re.search(r'<meta property="og:title" content="(.*?)"', html)
+    desc_match = re.search(r'<meta property="og:description" content="(.*?)"', html)
+    if not title_match:
+        return None
+
+    sp_title = title_match.group(1)
+    sp_artist = ""
+    if desc_match:
+        # La descripción suele ser "Artist · Song · Year"
+        sp_artist = desc_match.group(1).split("·")[0].strip()
+
+    search_query = f"{sp_title} {sp_artist} audio"
+    print(f"[SPOTIFY] Encontrado: {sp_title} - {sp_artist}")
+    print(f"[SPOTIFY] Buscando en YouTube: {search_query}")
+    spotify_meta_cache.put(key, search_query)
+    return search_query
+
+async def resolve_audio(url: str, priority=PRIORITY_INTERACTIVE, guild_id=None, spotify_id=None, **kwargs):
+    """resolver.resolve + conversión previa (asíncrona) de enlaces de track de Spotify."""
+    if "open.spotify.com" in url and "track" in url:
+        query = await spotify_track_query(url)
+        if query:
+            spotify_id = spotify_id or spotify_id_from_url(url, "track")
+            url = f"ytsearch:{query}" # Cambiamos la URL a búsqueda de YT
+    return await resolver.resolve(url, priority=priority, guild_id=guild_id, spotify_id=spotify_id, **kwargs)
+
+def buscar_playlist(url: str, emit, cancel_event):
+    """
+    Lee una playlist de YouTube (flat) página a página (BLOQUEANTE).
+    Llama a emit(("title", str)) y luego emit(("track", dict)) por cada vídeo
+    en cuanto se conoce, sin esperar a tener la lista completa.
+    Se corta en cuanto cancel_event está activo (/stop).
+    """
     print(f"\n[YT-DLP] Buscando playlist: {url}")
     
-    opts = YDL_OPTIONS.copy()
-    opts['extract_flat'] = True # Solo sacar info básica, no stream
-    opts['noplaylist'] = False # Permitir playlists
-    
-    with YoutubeDL(opts) as ydl:
-        info = ydl.extract_info(url, download=False)
+    # Perfil "flat": solo info básica, sin stream, permitiendo playlists
+    with ydl_pool.get("flat") as ydl:
+        # process=False: "entries" es un generador que va pidiendo páginas según se consume
+        info = ydl.extract_info(url, download=False, process=False)
+        while info.get("_type") == "url": # Redirección (ej: watch?v=...&list=...)
+            info = ydl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
         if "entries" not in info:
-            return None, "No se encontraron canciones o no es una playlist."
-            
-        tracks = []
+            raise ValueError("No se encontraron canciones o no es una playlist.")
+
+        emit(("title", info.get("title", "Playlist")))
+        count = 0
         for entry in info["entries"]:
+            if cancel_event.is_set():
+                print(f"[YT-DLP] Carga de playlist cancelada tras {count} entradas.")
+                return
             # A veces extract_flat devuelve entradas que no son videos
-            if entry.get("ie_key") == "Youtube":
-               tracks.append({
-                   "title": entry.get("title", "Audio"),
-                   "webpage_url": entry.get("url"),
-                   "duration": entry.get("duration", 0) # Puede ser None
-               })
-        
-        return tracks, info.get("title", "Playlist")
+            if not entry or entry.get("ie_key") != "Youtube":
+                continue
+            page_url = entry.get("url") or ""
+            if not page_url.startswith("http"):
+                page_url = f"https://www.youtube.com/watch?v={entry.get('id') or page_url}"
+            emit(("track", {
+                "title": entry.get("title", "Audio"),
+                "webpage_url": page_url,
+                "duration": entry.get("duration") or 0 # Puede ser None
+            }))
+            count += 1
+        print(f"[YT-DLP] Playlist leída: {count} entradas.")
+
+playlist_loads = {} # guild_id -> threading.Event (cargas de playlist en curso)
+
+async def stream_playlist(url: str, guild_id: int):
+    """
+    Async iterator sobre buscar_playlist: devuelve ("title", str) y ("track", dict)
+    según van llegando. Se puede cancelar con cancel_playlist_load(guild_id).
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    cancel_event = threading.Event()
+    cancel_playlist_load(guild_id) # Solo una carga por servidor
+    playlist_loads[guild_id] = cancel_event
+
+    def emit(item):
+        loop.call_soon_threadsafe(items.put_nowait, item)
+
+    def reader():
+        try:
+            buscar_playlist(url, emit, cancel_event)
+        except Exception as e:
+            emit(("error", e))
+        finally:
+            emit(("end", None))
+
+    loop.run_in_executor(None, reader)
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == "end" or cancel_event.is_set():
+                break
+            if kind == "error":
+                raise value
+            yield kind, value
+    finally:
+        cancel_event.set() # Si el consumidor sale antes, parar el hilo lector
+        if playlist_loads.get(guild_id) is cancel_event:
+            del playlist_loads[guild_id]
+
+def cancel_playlist_load(guild_id):
+    event = playlist_loads.pop(guild_id, None)
+    if event:
+        event.set()
 
 
 def create_progress_bar(elapsed, total, length=15):
@@ -238,153 +555,99 @@ def create_progress_bar(elapsed, total, length=15):
         
     return f"`{bar}` **{fmt(elapsed)} / {fmt(total)}**"
 
-def create_minimal_embed(title, url, duration, elapsed, thumbnail, requester=None, channel_name=None):
+def create_minimal_embed(title, url, duration, elapsed, thumbnail, requester=None, channel_name=None, paused=False):
     """Genera un Embed estilo Rythm (Minimalista)"""
-    
-    # 1. Calcular barra
-    length = 20
-    if duration > 0:
-        percent = min(1, max(0, elapsed / duration))
-        progress = int(length * percent)
-    else:
-        progress = 0
-        
-    bar = "▬" * progress + "🔘" + "─" * (length - progress)
-    
-    # 2. Formatear tiempo
-    def fmt(s):
-        m, s = divmod(int(s), 60)
-        h, m = divmod(m, 60)
-        if h > 0: return f"{h:02d}:{m:02d}:{s:02d}"
-        return f"{m:02d}:{s:02d}"
-
-    time_str = f"`{fmt(elapsed)} / {fmt(duration)}`"
-
-    # 3. Construir Embed
-    embed = discord.Embed(color=0x2b2d31)
-    
-    # Author = "Now Playing"
-    embed.set_author(name="Tune Flow", icon_url="https://media0.giphy.com/media/v1.Y2lkPTc5MGI3NjExYmVmNDQ4d210cjNxczNleXJ4ODI2bDJ1OGMwdHE5YnhmdWVmdmVyZyZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9Zw/yZ7Xya4covzN1WhOAa/giphy.gif")
-    
-    # Description: Title + Meta + Bar
-    desc = f"**[{title}]({url})**\n"
-    
-    # Detectar Plataforma
-    platform = "🔗 Otro"
-    if "spotify" in url: platform = "💚 Spotify"
-    elif "youtu" in url: platform = "🟥 YouTube"
-    elif "soundcloud" in url: platform = "🧡 SoundCloud"
-    
-    meta = []
-    meta.append(platform)
-    if requester: meta.append(f"👤 {requester}")
-    if channel_name: meta.append(f"🔊 {channel_name}")
-    
-    if meta:
-        desc += " | ".join(meta) + "\n"
-        
-    desc += f"\n{time_str}\n{bar}"
-    
-    embed.description = desc
-
-    embed.description = desc
-
-    # Carátula GRANDE (ocupa todo el ancho del embed)
-    if not thumbnail:
-        thumbnail = "https://cdn-icons-png.flaticon.com/512/1384/1384060.png" # Icono Youtube genérico funcional
-        
-    embed.set_image(url=thumbnail)  # Cambiado de set_thumbnail a set_image para mayor impacto visual
-    
-    # Footer con metadata mejorado
-    footer_parts = []
-    if requester:
-        footer_parts.append(f"👤 {requester}")
-    if channel_name:
-        footer_parts.append(f"🔊 {channel_name}")
-    footer_parts.append("✨ Autoplay: ON")
-    
-    embed.set_footer(text=" • ".join(footer_parts))
-    
-    return embed
+    renderer = NowPlayingRenderer(title, url, duration, thumbnail, requester=requester, channel_name=channel_name)
+    return renderer.render(elapsed, paused, force=True)
 
-async def update_message_task(message, start_time, duration, title, voice_client):
+def render_now_playing(guild_id, force=False):
     """
-    Tarea en segundo plano que actualiza la barra de progreso del mensaje cada segundo.
+    Embed del mensaje de "ahora suena" del servidor, UNCHANGED si se vería igual
+    que el que ya está, o None si ya no suena nada.
     """
-    try:
-        while True:
-            await asyncio.sleep(1) # Actualizar cada segundo
-            
-            # Condiciones de parada
-            if not voice_client.is_connected(): break
-            if not voice_client.is_playing() and not voice_client.is_paused(): break # Ya no suena
-            
-            # Calcular nuevo progreso
-            # Elapsed = (now - start) + offset
-            elapsed = (time.time() - start_time) + audio_sources.get(voice_client.guild.id, {}).get("offset", 0)
-            
-            if elapsed > duration: elapsed = duration 
-            
-            # Recuperar info para el embed
-            src_info = audio_sources.get(voice_client.guild.id, {})
-            url = src_info.get("url", "")
-            thumb = src_info.get("thumbnail")
-
-            # Recrear embed minimalista
-            chn_name = voice_client.channel.name if voice_client.channel else "Voz"
-            embed = create_minimal_embed(title, url, duration, elapsed, thumb, channel_name=chn_name)
-            
-            try:
-                await message.edit(embed=embed)
-            except discord.NotFound:
-                break # Mensaje borrado
-            except Exception as e:
-                print(f"[UPDATER] Error al editar mensaje: {e}")
-                break
-                
-            if elapsed >= duration: break
-            
-    except Exception as e:
-        print(f"[UPDATER] Error fatal en task: {e}")
-
-@tasks.loop(seconds=60) # Ejecutar cada 60 segundos
+    current = audio_sources.get(guild_id)
+    guild = bot.get_guild(guild_id)
+    voice = guild.voice_client if guild else None
+    if not current or voice is None or not voice.is_connected():
+        return None
+    if not voice.is_playing() and not voice.is_paused(): # Ya no suena
+        return None
+    duration = current.get("duration") or 0
+    elapsed = stream_position(current) # Por frames enviados: no avanza en pausa
+    if duration and elapsed > duration:
+        elapsed = duration
+    chn_name = voice.channel.name if voice.channel else "Voz"
+    # Lo estático del embed se prepara una vez por pista
+    key = (current.get("title", "Audio"), current.get("url", ""), duration, current.get("thumbnail"), None, chn_name)
+    renderer = current.get("renderer")
+    if renderer is None or renderer.key != key:
+        renderer = current["renderer"] = NowPlayingRenderer(*key[:4], channel_name=chn_name)
+    embed = renderer.render(elapsed, voice.is_paused(), force)
+    return UNCHANGED if embed is None else embed
+
+# Un único planificador edita todos los mensajes de "ahora suena" (sin pasarse del rate limit)
+now_playing = NowPlayingScheduler(render_now_playing)
+
+def track_now_playing(guild_id, message):
+    """Guarda el mensaje de "ahora suena" del servidor y lo deja en manos del planificador."""
+    current = audio_sources.setdefault(guild_id, {})
+    current["message"] = message
+    now_playing.track(guild_id, message, current.get("duration") or 0)
+
+# Mensajes enviados por el bot (se registran en on_message): la limpieza no lee el historial
+message_registry = MessageRegistry(min_age=CHAT_CLEAN_AFTER)
+cleaning_channels = set() # Canales con un borrado en curso
+
+# Favoritos de cada usuario en memoria: el botón ❤️ no lee la DB en cada pulsación
+favorites_index = FavoritesIndex(maxsize=FAVORITES_INDEX_USERS)
+
+@tasks.loop(seconds=60 / CHAT_CLEAN_SLOTS)
 async def clean_chat_task():
-    """Tarea que limpia mensajes antiguos del bot en los canales de música."""
+    """Tarea que limpia mensajes antiguos del bot en los canales de música (una franja de canales por vuelta)."""
     try:
-        # Iterar sobre las colas activas para saber qué canales limpiar
-        # Copiamos keys para evitar error si el dict cambia
-        for guild_id in list(music_queues.keys()):
-            queue = music_queues[guild_id]
+        slot = clean_chat_task.current_loop % CHAT_CLEAN_SLOTS
+        if slot == 0:
+            message_registry.prune()
+        # Copiamos los items para evitar error si el dict cambia
+        for guild_id, queue in list(music_queues.items()):
             channel = queue.get("channel")
-            if not channel: continue
-            
+            if not channel or channel.id % CHAT_CLEAN_SLOTS != slot or channel.id in cleaning_channels:
+                continue
+
             # Identificar el mensaje del reproductor activo para NO borrarlo
-            active_msg_id = None
-            if guild_id in audio_sources and "message" in audio_sources[guild_id]:
-                try:
-                    active_msg_id = audio_sources[guild_id]["message"].id
-                except: pass
-            
-            # Función para identificar qué borrar
-            def is_dirty(m):
-                # Borrar mensajes del BOT que NO sean el player activo
-                if m.author.id == bot.user.id:
-                    if m.id != active_msg_id:
-                        return True
-                return False
-
-            # Purge (Solo miramos los últimos 50 mensajes para no saturar API)
-            try:
-                # Usamos bulk=True por defecto
-                deleted = await channel.purge(limit=50, check=is_dirty)
-                if deleted:
-                    print(f"[AUTO-CLEAN] Borrados {len(deleted)} mensajes en {channel.guild.name} - #{channel.name}")
-            except Exception as e:
-                print(f"[AUTO-CLEAN] Error en purge: {e}")
-                
+            active = audio_sources.get(guild_id, {}).get("message")
+            ids = message_registry.due(channel.id, keep={active.id} if active else ())
+            if not ids:
+                continue # Nada que borrar: ninguna llamada a la API
+            # Cada canal por su cuenta: uno lento no retrasa a los demás
+            cleaning_channels.add(channel.id)
+            bot.loop.create_task(clean_channel(channel, ids))
     except Exception as e:
         print(f"[AUTO-CLEAN] Error general: {e}")
 
+async def clean_channel(channel, ids):
+    """Borra en lote (hasta 100 por llamada) mensajes del bot ya registrados."""
+    try:
+        for i in range(0, len(ids), 100):
+            await channel.delete_messages([discord.Object(id=message_id) for message_id in ids[i:i + 100]])
+        print(f"[AUTO-CLEAN] Borrados {len(ids)} mensajes en {channel.guild.name} - #{channel.name}")
+    except discord.NotFound:
+        pass # Alguno ya no existía
+    except Exception as e:
+        print(f"[AUTO-CLEAN] Error borrando en #{channel.name}: {e}")
+    finally:
+        # Un solo intento por mensaje (si falla por permisos no se reintenta cada minuto)
+        message_registry.discard(channel.id, ids)
+        cleaning_channels.discard(channel.id)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    message_registry.discard(payload.channel_id, (payload.message_id,))
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    message_registry.discard(payload.channel_id, payload.message_ids)
+
 disconnect_tasks = {} # Tareas de desconexión por guild
 
 async def disconnect_timer(guild, timeout=300): # timeout en segundos
@@ -398,6 +661,7 @@ async def disconnect_timer(guild, timeout=300): # timeout en segundos
     
     # 1. Chequeo Miembros (Bot solo)
     if len(voice.channel.members) == 1:
+        stop_background_work(guild.id)
         await voice.disconnect()
         await update_bot_status(None)  # Limpiar estado
         if guild.id in music_queues:
@@ -411,6 +675,7 @@ async def disconnect_timer(guild, timeout=300): # timeout en segundos
         # Doble check de cola
         q = music_queues.get(guild.id)
         if not q or q["index"] >= len(q["tracks"]):
+             stop_background_work(guild.id)
              await voice.disconnect()
              await update_bot_status(None)  # Limpiar estado
              if q:
@@ -461,17 +726,13 @@ async def on_voice_state_update(member, before, after):
         await check_disconnect(guild)
 
 async def cleanup_previous_message(guild_id):
-    """Elimina el mensaje de reproducción anterior y cancela su tarea."""
+    """Elimina el mensaje de reproducción anterior y deja de actualizarlo."""
+    now_playing.untrack(guild_id)
     if guild_id not in audio_sources: 
         print(f"[CLEANUP] Guild {guild_id} no encontrada en audio_sources.")
         return
     
     info = audio_sources[guild_id]
-    
-    # Cancelar tarea
-    if "task" in info:
-        info["task"].cancel()
-        print("[CLEANUP] Tarea cancelada.")
         
     # Borrar mensaje
     if "message" in info:
@@ -487,7 +748,6 @@ async def cleanup_previous_message(guild_id):
         print("[CLEANUP] No se encontró clave 'message' en audio_sources.")
             
     # Limpiar referencias
-    info.pop("task", None)
     info.pop("message", None)
 
 async def update_bot_status(title: str = None):
@@ -539,19 +799,21 @@ async def play(interaction: discord.Interaction, url: str):
         }
     music_queues[interaction.guild.id]["channel"] = interaction.channel
     queue = music_queues[interaction.guild.id]
+    spotify_id = None # Si viene de Spotify, para el mapeo Spotify -> YouTube
 
     # 🟢 CHECK SPOTIFY
     if is_spotify_url(url):
         try:
             print("[PLAY] Detectada URL de Spotify...")
-            queries = get_spotify_queries(url)
+            queries = await get_spotify_tracks(url)
             
             if not queries:
                  return await interaction.followup.send("No se encontraron canciones válidas en ese enlace de Spotify.", ephemeral=True)
             
             # Si es solo 1 (track)
             if len(queries) == 1:
-                query = queries[0]
+                query = queries[0]["query"]
+                spotify_id = queries[0]["spotify_id"]
                 url = f"ytsearch:{query}" # Convertimos y seguimos abajo
                 print(f"[SPOTIFY] Convertido a: {url}")
             else:
@@ -563,13 +825,8 @@ async def play(interaction: discord.Interaction, url: str):
                 except: pass
                 
                 for q in queries:
-                    track_obj = {
-                        "title": q, 
-                        "webpage_url": f"ytsearch:{q}", 
-                        "duration": 0, 
-                        "thumbnail": None
-                    }
-                    queue["tracks"].append(track_obj)
+                    queue["tracks"].append(spotify_placeholder(q))
+                schedule_placeholder_resolution(interaction.guild.id)
                 
                 # Iniciar reproducción si está silencio
                 if not voice.is_playing() and not voice.is_paused():
@@ -577,21 +834,16 @@ async def play(interaction: discord.Interaction, url: str):
                     
                     try:
                         first_track = queue["tracks"][queue["index"]]
-                        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, first_track)
+                        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, first_track, priority=PRIORITY_INTERACTIVE)
                         
                         await cleanup_previous_message(interaction.guild.id)
                         progress_bar = create_progress_bar(0, real_duration)
                         embed = discord.Embed(title="🎵 Reproduciendo Spotify", description=f"**{real_title}**\n\n{progress_bar}", color=discord.Color.green())
                         if thumbnail: embed.set_thumbnail(url=thumbnail)
                         
-                        msg = await interaction.followup.send(embed=embed, view=PlayerView(interaction.guild.id))
+                        msg = await interaction.followup.send(embed=embed, view=player_view)
                         
-                        if real_duration > 0:
-                            task = bot.loop.create_task(update_message_task(msg, time.time(), real_duration, real_title, voice))
-                            audio_sources[interaction.guild.id] = audio_sources.get(interaction.guild.id, {})
-                            audio_sources[interaction.guild.id]["message"] = msg
-                            audio_sources[interaction.guild.id]["start_time"] = time.time()
-                            audio_sources[interaction.guild.id]["task"] = task
+                        track_now_playing(interaction.guild.id, msg)
                     except Exception as e:
                        print(f"Error arrancando playlist Spotify: {e}")
                 return # Salir, ya manejamos todo
@@ -606,7 +858,8 @@ async def play(interaction: discord.Interaction, url: str):
     try:
         print("[PLAY] Obteniendo información del audio...")
         logger.info("[PLAY] Buscando stream...")
-        stream_url, title, duration, thumbnail, webpage_url = buscar_audio(url)
+        info = await resolve_audio(url, priority=PRIORITY_INTERACTIVE, guild_id=interaction.guild.id, spotify_id=spotify_id)
+        title, duration, thumbnail, webpage_url = info["title"], info["duration"], info["thumbnail"], info["webpage_url"]
     except Exception as e:
         print(f"[PLAY] ERROR al obtener audio: {e}")
         logger.error("[PLAY] No pude obtener el audio: %s", e)
@@ -647,12 +900,12 @@ async def play(interaction: discord.Interaction, url: str):
         queue["index"] = len(queue["tracks"]) - 1 # El último índice
 
         # Reproducir el track
-        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, queue["tracks"][queue["index"]])
+        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, queue["tracks"][queue["index"]], priority=PRIORITY_INTERACTIVE)
 
         # Embed minimalista
         chn = interaction.user.voice.channel.name if interaction.user.voice else "Voz"
         embed = create_minimal_embed(real_title, webpage_url, real_duration, 0, thumbnail, interaction.user.name, channel_name=chn)
-        view = PlayerView(interaction.guild.id)
+        view = player_view
         
         # Limpiar anterior antes de mandar nuevo
         await cleanup_previous_message(interaction.guild.id)
@@ -663,36 +916,158 @@ async def play(interaction: discord.Interaction, url: str):
         print(f"[PLAY] Reproducción iniciada exitosamente")
 
         # Guardar mensaje en audio_sources
-        if interaction.guild.id in audio_sources:
-                audio_sources[interaction.guild.id]["message"] = message
-
-        # Iniciar tarea de actualización BACKGROUND
-        if real_duration > 0:
-            task = bot.loop.create_task(update_message_task(message, audio_sources[interaction.guild.id]["start_time"], real_duration, real_title, voice))
-            audio_sources[interaction.guild.id]["task"] = task
+        # A partir de aquí lo actualiza el planificador de "ahora suena"
+        track_now_playing(interaction.guild.id, message)
 
     except Exception as e:
         print(f"[PLAY] ERROR al reproducir: {e}")
         await interaction.followup.send(f"Error al reproducir: {e}", ephemeral=True)
 
 
-async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0):
+# Formato elegido por (vídeo, bitrate del canal): no se repite la selección en cada play/seek
+format_choices = LRUCache(maxsize=4096)
+bandwidth_saved = {} # guild_id -> bytes que no se descargaron gracias a la selección
+
+def match_channel_bitrate(voice, info):
+    """
+    Cambia el stream de la info por el formato de audio más pequeño que cubre
+    el bitrate del canal de voz (Discord lo va a recodificar a ese bitrate igualmente).
+    """
+    formats = info.get("formats")
+    if not formats or info.get("is_live"):
+        return info
+    kbps = getattr(voice.channel, "bitrate", 64000) // 1000
+    key = (info.get("id") or info["url"], kbps)
+    format_id = format_choices.get(key)
+    chosen = next((f for f in formats if f["format_id"] == format_id), None) if format_id else None
+    if chosen is None:
+        chosen = audio.select_format(formats, kbps)
+        if chosen is None:
+            return info
+        format_choices.put(key, chosen["format_id"])
+    if chosen["url"] == info["url"]:
+        return info
+
+    # Lo que se ahorra por segundo: se contabiliza una vez por pista, al empezar (record_bandwidth_saving)
+    saved_rate = ((info.get("abr") or 0) - (chosen.get("abr") or 0)) * 1000 / 8
+    if saved_rate > 0:
+        print(f"[FORMATO] Guild {voice.guild.id}: {chosen['format_id']} ({chosen['acodec']} {chosen['abr']:.0f}k) "
+              f"en vez de {info.get('format_id')} ({info.get('abr') or 0:.0f}k) para un canal de {kbps}k")
+        return {**info, **chosen, "saved_rate": saved_rate}
+    return {**info, **chosen}
+
+def record_bandwidth_saving(guild_id, source, duration, start_offset=0):
+    """Suma al servidor lo que no se descarga de esta pista (desde start_offset hasta el final)."""
+    saved = getattr(source, "saved_rate", 0) * max(0, (duration or 0) - start_offset)
+    if saved > 0:
+        bandwidth_saved[guild_id] = bandwidth_saved.get(guild_id, 0) + saved
+        print(f"[FORMATO] Guild {guild_id}: ~{saved / 1e6:.1f} MB menos (total guild {bandwidth_saved[guild_id] / 1e6:.1f} MB)")
+
+def create_source(voice, info, start_offset=0):
+    """
+    Crea la fuente de audio (audio.MeteredSource) para una info ya resuelta.
+    Devuelve None si era un fichero de la caché en disco que ya no existe.
+    """
+    # Fijar el fichero local mientras suena (la expulsión no lo puede borrar)
+    release_local = None
+    if info.get("local"):
+        if not disk_cache.pin(info["id"]):
+            return None
+        release_local = functools.partial(disk_cache.release, info["id"])
+    else:
+        info = match_channel_bitrate(voice, info)
+
+    # Ganancia: la medida para esta pista o, si aún no se ha medido, el volumen por defecto
+    gain_db = loudness.gain_for(info) if LOUDNESS_ENABLED else None
+    volume = audio.db_to_volume(gain_db) if gain_db is not None else PLAYBACK_VOLUME
+
+    bitrate = min(getattr(voice.channel, "bitrate", 128000) // 1000, 512)
+    try:
+        source = audio.build_source(
+            info["url"], info,
+            executable=FFMPEG_PATH,
+            volume=volume,
+            mode=AUDIO_MODE,
+            bitrate=bitrate,
+            options=FFMPEG_OPTIONS["options"],
+            start_offset=start_offset, # -ss antes de -i: seek rápido en la entrada
+            on_cleanup=release_local,
+            encode_in_ffmpeg=audio_workers is not None,
+            fast_start=FFMPEG_FAST_START,
+            on_spawn=functools.partial(audio_workers.place, voice.guild.id) if audio_workers is not None else None,
+            live_buffer_frames=LIVE_BUFFER_MS // 20,
+            live_stall_timeout=LIVE_STALL_TIMEOUT
+        )
+    except Exception:
+        if release_local:
+            release_local()
+        raise
+    gain_txt = f"{gain_db:+.1f} dB" if gain_db is not None else "sin medir"
+    source.saved_rate = info.get("saved_rate", 0) # Bytes/s que no se descargan (ver match_channel_bitrate)
+    print(f"[PLAY_TRACK] Fuente creada ({source.kind}, {info.get('acodec') or '?'}/{info.get('ext') or '?'}, ganancia {gain_txt})")
+    return source
+
+async def open_track(guild, voice, track, start_offset=0, priority=PRIORITY_PLAYBACK):
+    """Resuelve un track y crea su fuente. Devuelve (info, source) o (mensaje de error, None)."""
+    # Si la pista está en la caché en disco, ni siquiera hace falta yt-dlp
+    info = disk_cache.local_info(video_id_from_url(track["webpage_url"])) if disk_cache else None
+    if info is None:
+        # Conseguir la URL de stream y el título (y thumbnail) sin bloquear el loop
+        # Si el prefetch ya la resolvió, se usa directamente
+        info = take_prefetch(guild.id, track)
+        if info is None:
+            info = await resolve_audio(track["webpage_url"], priority=priority, guild_id=guild.id, spotify_id=track.get("spotify_id"))
+        if disk_cache:
+            info = disk_cache.local_info(info.get("id")) or info
+
+    # Crear el source: Opus passthrough si el formato lo permite, si no PCM
+    try:
+        source = create_source(voice, info, start_offset)
+        if source is None: # Expulsado de la caché en disco justo ahora: vamos a la red
+            info = await resolve_audio(track["webpage_url"], priority=priority, guild_id=guild.id, spotify_id=track.get("spotify_id"))
+            source = create_source(voice, info, start_offset)
+    except Exception as e:
+        print(f"[PLAY_TRACK] Error creando fuente: {e}")
+        return e, None
+    return info, source
+
+def dispose_source(source, delay=0.2):
+    """Libera una fuente sustituida en caliente (mata su ffmpeg) sin bloquear el loop."""
+    # Pequeño margen por si el hilo de audio aún está dentro de su read()
+    bot.loop.call_later(delay, lambda: bot.loop.run_in_executor(None, source.cleanup))
+
+async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0, priority=PRIORITY_PLAYBACK, handoff=None, restart=False):
     """
     Reproduce un track (dict con title/webpage_url) en el voice_client del guild.
     start_offset: Tiempo en segundos desde donde empezar (para seek).
+    restart: La pista ya estaba sonando (seek, /resume): no cuenta como una reproducción nueva.
+    priority: Carril del resolver (PRIORITY_INTERACTIVE para /play).
+    handoff: Relevo ya hecho por el TrackChain ({"info", "source"}): la pista ya
+             está sonando y aquí solo se actualiza el estado.
     """
     voice = guild.voice_client
     if voice is None:
         print("[PLAY_TRACK] No hay voice_client")
         return "No estoy conectado a un canal de voz.", 0
 
-    # Si ya está sonando algo, lo paramos (importante para seek)
-    if voice.is_playing() or voice.is_paused():
-        voice.stop()
-
-    # Conseguir la URL de stream y el título (y thumbnail)
-    # buscar_audio devuelve 5 valores ahora
-    stream_url, real_title, duration, thumbnail, webpage_url = buscar_audio(track["webpage_url"])
+    if handoff is not None:
+        info, source = handoff["info"], handoff["source"]
+    else:
+        # Si ya está sonando algo, lo paramos (importante para seek)
+        if voice.is_playing() or voice.is_paused():
+            voice.stop()
+        cancel_handoff(guild.id)
+
+        info, source = await open_track(guild, voice, track, start_offset, priority)
+        if source is None:
+            return f"Error de audio: {info}", 0
+
+    if is_placeholder(track) or track.get("resolve_failed"):
+        track.pop("resolve_failed", None)
+        fill_placeholder(track, info)
+    stream_url, real_title, duration, thumbnail = info["url"], info["title"], info["duration"], info["thumbnail"]
+    if not restart:
+        record_bandwidth_saving(guild.id, source, duration, start_offset)
     print(f"[PLAY_TRACK] Reproduciendo: {real_title} desde {start_offset}s")
     logger.info("[QUEUE] Ahora suena: %s (offset: %s)", real_title, start_offset)
 
@@ -701,29 +1076,9 @@ async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0)
         hist = music_queues[guild.id]["history"]
         # Guardar URL original para el historial, no el stream
         hist_url = track.get("webpage_url", stream_url)
-        hist.insert(0, {"title": real_title, "url": hist_url})
-        if len(hist) > 15: hist.pop() # Máximo 15
-
-    # Opciones de FFmpeg con offset
-    current_opts = FFMPEG_OPTIONS.copy()
-    # solo añadimos el reconnect_at_eof a la config standard
-    current_opts["before_options"] = f"-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_at_eof 1 -ss {start_offset}"
-
-    # Crear el source (Usamos PCMAudio para poder controlar el volumen)
-    # FFmpegOpusAudio no soporta PCMVolumeTransformer
-    try:
-        source = discord.FFmpegPCMAudio(
-            stream_url,
-            executable=FFMPEG_PATH,
-            **current_opts
-        )
-        print("[PLAY_TRACK] Fuente creada con FFmpegPCMAudio")
-    except Exception as e:
-        print(f"[PLAY_TRACK] Error creando fuente: {e}")
-        return f"Error de audio: {e}", 0
-
-    # Ajustar volumen (Normalizar a 50%)
-    source = discord.PCMVolumeTransformer(source, volume=0.5)
+        if not hist or hist[0]["url"] != hist_url: # Reinicios de la misma pista (seek, /resume) no se repiten
+            hist.insert(0, {"title": real_title, "url": hist_url})
+            if len(hist) > 15: hist.pop() # Máximo 15
 
     # Guardar source actual sin perder la referencia al mensaje anterior
     if guild.id not in audio_sources:
@@ -737,7 +1092,10 @@ async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0)
         "duration": duration,
         "start_time": time.time(),
         "offset": start_offset, 
-        "thumbnail": thumbnail 
+        "offset_frames": 0, # La fuente empezó en start_offset (ver stream_position)
+        "thumbnail": thumbnail,
+        "info": info, # Stream y formato actuales (el seek los reutiliza)
+        "recoveries": 0
     })
     
     # Actualizar estado del bot (Rich Presence)
@@ -756,7 +1114,8 @@ async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0)
         # Si hacemos SEEK, NO queremos que salte al siguiente.
         # Solución: En función seek, antes de play, ponemos un flag "seeking".
         
-        if guild.id in audio_sources and audio_sources[guild.id].get("seeking", False):
+        # pop: el flag solo vale para esta parada (si no, el final real de la canción también se ignoraría)
+        if guild.id in audio_sources and audio_sources[guild.id].pop("seeking", False):
             print("[AFTER_PLAYING] Ignorando porque estamos haciendo SEEK.")
             return
 
@@ -770,13 +1129,442 @@ async def play_track_in_guild(guild: discord.Guild, track: dict, start_offset=0)
         except Exception as e:
              pass
 
-    voice.play(source, after=after_playing)
+    def on_switch(old, new, meta):
+        # Hilo de audio: la siguiente ya suena; el resto del trabajo va al loop
+        bot.loop.call_soon_threadsafe(dispose_source, old)
+        asyncio.run_coroutine_threadsafe(play_next(guild, handoff=meta), bot.loop)
+
+    def on_stall(failed):
+        # Hilo de audio: el stream se cortó a mitad (URL caducada, 403...); el chain envía silencio
+        asyncio.run_coroutine_threadsafe(recover_stream(guild, failed), bot.loop)
+
+    if handoff is None:
+        # El TrackChain se queda en el voice client y va encadenando las siguientes
+        chain = audio.TrackChain(source, on_switch=on_switch, crossfade_frames=HANDOFF_CROSSFADE_MS // 20,
+                                 on_stall=on_stall, max_stall_frames=STREAM_RECOVERY_TIMEOUT * 50)
+        audio_sources[guild.id]["chain"] = chain
+        # discord.py solo crea el encoder si la primera fuente es PCM, y el chain puede pasar
+        # de Opus a PCM (handoff, seek, recuperación): sin él el hilo de audio muere
+        if getattr(voice, "encoder", None) is None:
+            voice.encoder = discord.opus.Encoder()
+        voice.play(chain, after=after_playing)
+
+    # Seeks y /resume no son reproducciones nuevas: ni se mide ni se cuenta otra vez
+    if not restart:
+        # Medir la sonoridad de la pista (solo la primera vez que suena)
+        gain_db = loudness.gain_for(info) if LOUDNESS_ENABLED else None
+        if LOUDNESS_ENABLED and gain_db is None:
+            loudness.schedule(info)
+        # Contar la reproducción para la caché en disco (descarga en segundo plano si se repite)
+        if disk_cache:
+            disk_cache.record_play(info, gain_db)
+
+    # Mientras suena, ir resolviendo la siguiente de la cola (y arrancarla antes de que acabe esta)
+    schedule_prefetch(guild.id)
+    schedule_handoff(guild.id)
+    schedule_stream_refresh(guild.id)
+    # Si es la última, ir preparando candidatos de autoplay
+    queue = music_queues.get(guild.id)
+    if queue and queue["index"] >= len(queue["tracks"]) - 1:
+        autoplay.prepare(guild.id, real_title, autoplay_exclusions(queue))
     return real_title, duration, thumbnail
 
 
-async def play_next(guild: discord.Guild):
+# === PREFETCH DE LA SIGUIENTE CANCIÓN ===
+prefetch_tasks = {} # guild_id -> {"index", "url", "task"}
+
+def schedule_prefetch(guild_id):
+    """Resuelve en segundo plano queue["tracks"][index+1]."""
+    queue = music_queues.get(guild_id)
+    if not queue:
+        return
+    next_index = queue["index"] + 1
+    if next_index >= len(queue["tracks"]):
+        cancel_prefetch(guild_id)
+        return
+    next_track = queue["tracks"][next_index]
+    url = next_track.get("webpage_url")
+    if not url:
+        return
+
+    current = prefetch_tasks.get(guild_id)
+    if current and current["index"] == next_index and current["url"] == url:
+        return # Ya se está preparando (ej: después de un seek)
+
+    cancel_prefetch(guild_id)
+    task = bot.loop.create_task(_prefetch(guild_id, url, next_track.get("spotify_id")))
+    prefetch_tasks[guild_id] = {"index": next_index, "url": url, "task": task}
+
+async def _prefetch(guild_id, url, spotify_id=None):
+    try:
+        info = await resolve_audio(url, priority=PRIORITY_BACKGROUND, guild_id=guild_id, spotify_id=spotify_id)
+        print(f"[PREFETCH] Lista la siguiente: {info['title']}")
+        return info
+    except Exception as e:
+        print(f"[PREFETCH] No se pudo preparar {url}: {e}")
+        return None
+
+def take_prefetch(guild_id, track):
+    """Devuelve la info prefetcheada si corresponde a este track (y ya terminó)."""
+    pf = prefetch_tasks.get(guild_id)
+    if not pf or pf["url"] != track.get("webpage_url"):
+        return None
+    # Misma posición de la cola, no solo la misma URL (la canción puede estar repetida)
+    tracks = music_queues.get(guild_id, {}).get("tracks", [])
+    if pf["index"] >= len(tracks) or tracks[pf["index"]] is not track:
+        return None
+    task = pf["task"]
+    if not task.done() or task.cancelled():
+        return None # Si sigue en vuelo, resolver.resolve se une a la misma petición
+    del prefetch_tasks[guild_id]
+    info = task.result()
+    # Que no haya caducado desde que se preparó
+    if info is None or stream_cache.ttl_for(info["url"]) <= 0:
+        return None
+    return info
+
+def cancel_prefetch(guild_id):
+    """Invalida el prefetch (shuffle, stop, saltos con los botones)."""
+    pf = prefetch_tasks.pop(guild_id, None)
+    if pf and not pf["task"].done():
+        pf["task"].cancel()
+
+
+# === RELEVO ENTRE CANCIONES (siguiente fuente arrancada antes de tiempo) ===
+handoff_tasks = {} # guild_id -> task que prepara la siguiente en el TrackChain
+
+def schedule_handoff(guild_id):
+    """Vigila la canción actual y prepara la siguiente HANDOFF_LEAD segundos antes del final."""
+    chain = audio_sources.get(guild_id, {}).get("chain")
+    if chain is None:
+        return
+    task = handoff_tasks.get(guild_id)
+    if task and not task.done():
+        return
+    handoff_tasks[guild_id] = bot.loop.create_task(_handoff(guild_id, chain))
+
+def cancel_handoff(guild_id):
+    """Para la vigilancia y libera la siguiente fuente si ya estaba arrancada."""
+    task = handoff_tasks.pop(guild_id, None)
+    if task and not task.done():
+        task.cancel()
+    chain = audio_sources.get(guild_id, {}).get("chain")
+    if chain is not None:
+        pending = chain.discard_next()
+        if pending is not None:
+            print(f"[HANDOFF] Descartada la siguiente preparada (guild {guild_id})")
+            dispose_source(pending, delay=0)
+
+async def _handoff(guild_id, chain):
+    try:
+        while True:
+            current = audio_sources.get(guild_id) or {}
+            guild = bot.get_guild(guild_id)
+            voice = guild.voice_client if guild else None
+            if current.get("chain") is not chain or voice is None or voice.source is not chain:
+                return # Ya no es la reproducción que vigilábamos
+            duration = current.get("duration") or 0
+            if not duration:
+                return # Directos / duración desconocida: no se sabe cuándo acaba
+            if chain.pending or chain.current is not current.get("source"):
+                # Ya hay una preparada, o el relevo acaba de ocurrir y play_next aún no actualizó el estado
+                await asyncio.sleep(0.5)
+                continue
+            remaining = duration - (time.time() - current["start_time"] + current.get("offset", 0))
+            queue = music_queues.get(guild_id)
+            next_index = queue["index"] + 1 if queue else 0
+            if remaining > HANDOFF_LEAD or not queue or next_index >= len(queue["tracks"]):
+                # Esperar (también por si se añade algo a la cola mientras suena la última)
+                await asyncio.sleep(max(0.5, min(remaining - HANDOFF_LEAD, 5)))
+                continue
+
+            track = queue["tracks"][next_index]
+            url = track.get("webpage_url")
+            t0 = time.perf_counter()
+            info, source = await open_track(guild, voice, track, 0, PRIORITY_PLAYBACK)
+            if source is None:
+                return # play_next lo intentará de la forma normal
+            # ¿Cambió la cola o la reproducción mientras se preparaba?
+            if (audio_sources.get(guild_id, {}).get("chain") is not chain or queue["index"] + 1 != next_index
+                    or next_index >= len(queue["tracks"]) or queue["tracks"][next_index].get("webpage_url") != url):
+                dispose_source(source, delay=0)
+                continue
+            source.prebuffer(HANDOFF_PREBUFFER_FRAMES)
+            old = chain.prepare_next(source, {"index": next_index, "url": url, "info": info, "source": source})
+            if old is not None:
+                dispose_source(old, delay=0)
+            print(f"[HANDOFF] Preparada la siguiente: {info['title']} ({time.perf_counter() - t0:.2f}s, faltan {remaining:.1f}s)")
+    except ResolveCancelled:
+        pass
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[HANDOFF] Error preparando la siguiente: {e}")
+
+
+# === RENOVACIÓN DE LA URL DE STREAM ===
+stream_refresh_tasks = {} # guild_id -> task que vigila el expire= de la pista actual
+
+def schedule_stream_refresh(guild_id):
+    """Vigila la URL de la pista que suena y la renueva STREAM_REFRESH_LEAD segundos antes de que caduque."""
+    task = stream_refresh_tasks.get(guild_id)
+    if task and not task.done():
+        return # Uno por servidor: sigue a la pista actual aunque cambie
+    stream_refresh_tasks[guild_id] = bot.loop.create_task(_stream_refresh(guild_id))
+
+def cancel_stream_refresh(guild_id):
+    task = stream_refresh_tasks.pop(guild_id, None)
+    if task and not task.done():
+        task.cancel()
+
+async def _stream_refresh(guild_id):
+    while True:
+        current = audio_sources.get(guild_id)
+        if not current or current.get("chain") is None:
+            return
+        info = current.get("info") or {}
+        expire = None if info.get("local") else stream_expiry(info.get("url"))
+        wait = expire - STREAM_REFRESH_LEAD - time.time() if expire else 30
+        if wait > 0:
+            # Como mucho 30 s: la pista puede cambiar mientras tanto
+            await asyncio.sleep(min(wait, 30))
+            continue
+        try:
+            fresh = await resolve_audio(current["url"], priority=PRIORITY_BACKGROUND, guild_id=guild_id, refresh=True)
+        except ResolveCancelled:
+            return
+        except Exception as e:
+            print(f"[STREAM_REFRESH] No se pudo renovar la URL de {current.get('title')}: {e}")
+            await asyncio.sleep(60)
+            continue
+        if audio_sources.get(guild_id) is current and current.get("info") is info:
+            # El ffmpeg actual sigue con su conexión; la URL nueva es para reconectar (recover_stream, /resume)
+            current["info"] = fresh
+            current["refreshed_at"] = time.perf_counter()
+            print(f"[STREAM_REFRESH] URL renovada: {current.get('title')} (la anterior caducaba en {expire - time.time():.0f}s)")
+
+def set_position(current, offset, frames=0):
+    """Fija la posición de la pista: `offset` segundos cuando su fuente llevaba `frames` frames enviados."""
+    current.update({"offset": offset, "offset_frames": frames, "start_time": time.time()})
+
+def stream_position(current):
+    """Segundo exacto de la pista actual según los frames enviados (no cuenta pausas ni silencios)."""
+    source = current.get("source")
+    if isinstance(source, audio.MeteredSource):
+        played = max(0, source.frames - current.get("offset_frames", 0))
+        return current.get("offset", 0) + played * 0.02
+    return current.get("offset", 0) + (time.time() - current.get("start_time", time.time()))
+
+async def fresh_stream_info(guild_id, current, source):
+    """Info con una URL de stream que no es la de `source`: la ya renovada o una extracción nueva."""
+    info = current.get("info") or {}
+    if current.get("refreshed_at", 0) > source.created and stream_cache.ttl_for(info.get("url")) > 0:
+        return info
+    return await resolve_audio(current["url"], priority=PRIORITY_PLAYBACK, guild_id=guild_id, refresh=True)
+
+def swap_stream(guild, info, position):
+    """Cambia en caliente la fuente de la pista actual por una nueva desde `position`. Devuelve la nueva o None."""
+    current = audio_sources[guild.id]
+    new_source = create_source(guild.voice_client, info, position)
+    if new_source is None:
+        return None
+    old = current["chain"].replace(new_source) # Cambio en caliente: no se dispara after_playing
+    dispose_source(old)
+    current.update({"source": new_source, "info": info})
+    set_position(current, position) # Fuente nueva: sus frames cuentan desde position
+    return new_source
+
+async def recover_stream(guild, failed):
+    """
+    El stream de la pista actual se cortó antes de tiempo (URL caducada, 403...).
+    Se vuelve a abrir con una URL válida en el segundo exacto en que se quedó,
+    mientras el TrackChain rellena con silencio.
+    """
+    current = audio_sources.get(guild.id) or {}
+    chain = current.get("chain")
+    if chain is None or chain.current is not failed or guild.voice_client is None:
+        return
+    live = (current.get("info") or {}).get("is_live")
+    # En un directo no hay posición: se vuelve al directo
+    position = 0 if live else stream_position(current)
+    if failed.audio_seconds > 60: # Sonó bien un rato: no es un corte seguido del anterior
+        current["recoveries"] = 0
+    current["recoveries"] = current.get("recoveries", 0) + 1
+    if live:
+        audio.live_stats.add(reconnects=1)
+    if current["recoveries"] > (LIVE_MAX_RECOVERIES if live else MAX_STREAM_RECOVERIES):
+        print(f"[STREAM_RECOVERY] {current.get('title')}: demasiados cortes, se da por terminada")
+        chain.give_up(failed)
+        return
+    print(f"[STREAM_RECOVERY] Stream cortado en {position:.1f}s: {current.get('title')}, reabriendo")
+    t0 = time.perf_counter()
+    try:
+        info = await fresh_stream_info(guild.id, current, failed)
+        if audio_sources.get(guild.id) is not current or chain.current is not failed:
+            return # Mientras tanto se hizo seek, skip o stop
+        new_source = swap_stream(guild, info, position)
+    except Exception as e:
+        print(f"[STREAM_RECOVERY] No se pudo recuperar: {e}")
+        new_source = None
+    if new_source is None:
+        chain.give_up(failed)
+        return
+    print(f"[STREAM_RECOVERY] Recuperada en {time.perf_counter() - t0:.2f}s")
+    now_playing.request(guild.id, urgent=True)
+
+async def refresh_before_resume(guild):
+    """Antes de reanudar tras una pausa: si la URL del ffmpeg pausado ya caducó, se reabre en el mismo punto."""
+    current = audio_sources.get(guild.id) or {}
+    source, info, chain = current.get("source"), current.get("info"), current.get("chain")
+    if source is None or info is None or chain is None or chain.current is not source or info.get("local"):
+        return False
+    # La URL del ffmpeg es la de la info con la que se creó, o una más vieja
+    if current.get("refreshed_at", 0) < source.created and stream_cache.ttl_for(info.get("url")) > 0:
+        return False
+    try:
+        info = await fresh_stream_info(guild.id, current, source)
+        if chain.current is not source:
+            return False
+        new_source = swap_stream(guild, info, stream_position(current))
+    except Exception as e:
+        print(f"[STREAM_REFRESH] No se pudo renovar antes de reanudar: {e}")
+        return False
+    if new_source is None:
+        return False
+    print(f"[STREAM_REFRESH] URL caducada durante la pausa: {current.get('title')} reabierta en {current['offset']:.1f}s")
+    return True
+
+
+# === RESOLUCIÓN EN LOTE DE PLACEHOLDERS (Spotify) ===
+PLACEHOLDER_CONCURRENCY = int(os.getenv("PLACEHOLDER_CONCURRENCY", "3")) # Siempre < RESOLVER_WORKERS
+placeholder_tasks = {} # guild_id -> task
+
+def is_placeholder(track: dict) -> bool:
+    """Track de Spotify aún sin resolver (búsqueda pendiente)."""
+    return (track.get("webpage_url", "").startswith("ytsearch:")
+            and not track.get("duration")
+            and not track.get("resolve_failed"))
+
+def fill_placeholder(track: dict, info: dict):
+    """Sustituye en el sitio los datos del placeholder por los reales."""
+    track.update({
+        "title": info["title"],
+        "webpage_url": info["webpage_url"],
+        "duration": info["duration"],
+        "thumbnail": info["thumbnail"],
+    })
+
+def _placeholder_order(queue):
+    """Índices de los placeholders de la cola, del más cercano al índice actual al más lejano (primero hacia delante)."""
+    idx = queue["index"]
+    pending = [i for i, t in enumerate(queue["tracks"]) if is_placeholder(t)]
+    # Las siguientes pesan menos que las anteriores a igual distancia
+    pending.sort(key=lambda i: (i - idx) * 2 if i > idx else (idx - i) * 2 + 1)
+    return deque(pending)
+
+def schedule_placeholder_resolution(guild_id):
+    """Arranca (si no está ya) la resolución de fondo de los placeholders del servidor."""
+    task = placeholder_tasks.get(guild_id)
+    if task and not task.done():
+        return # El bucle ya recoge los nuevos placeholders
+    placeholder_tasks[guild_id] = bot.loop.create_task(_resolve_placeholders(guild_id))
+
+def cancel_placeholder_resolution(guild_id):
+    task = placeholder_tasks.pop(guild_id, None)
+    if task and not task.done():
+        task.cancel()
+
+async def _resolve_one(guild_id, track):
+    url = track["webpage_url"]
+    try:
+        info = await resolve_audio(url, priority=PRIORITY_BACKGROUND, guild_id=guild_id, spotify_id=track.get("spotify_id"))
+    except ResolveCancelled:
+        return False
+    except Exception as e:
+        print(f"[LOTE] No se pudo resolver '{track.get('title')}': {e}")
+        track["resolve_failed"] = True # Se intentará otra vez al reproducirla
+        return False
+    if track.get("webpage_url") == url: # Sigue siendo el mismo placeholder
+        fill_placeholder(track, info)
+    return True
+
+async def _resolve_placeholders(guild_id):
+    """Resuelve los placeholders con concurrencia acotada, desde el índice actual hacia fuera."""
+    started = time.time()
+    resolved = failed = 0
+    skip = set() # id(track) ya lanzados
+    running = set()
+    order = deque() # Índices pendientes, en orden de resolución
+    built_for = None # (lista de tracks, índice, longitud) con los que se calculó `order`
+    remaining = 0
+    progress_msg = None
+    last_report = 0
+
+    try:
+        while True:
+            queue = music_queues.get(guild_id)
+            if not queue:
+                break
+            tracks = queue["tracks"]
+            if built_for is None or built_for[0] is not tracks or built_for[1:] != (queue["index"], len(tracks)):
+                # Cola mezclada, salto o pistas nuevas: se reordena una vez, no en cada elección
+                built_for = (tracks, queue["index"], len(tracks))
+                order = _placeholder_order(queue)
+                remaining = len(order)
+            while len(running) < PLACEHOLDER_CONCURRENCY and order:
+                track = tracks[order.popleft()]
+                if id(track) in skip or not is_placeholder(track):
+                    continue
+                skip.add(id(track))
+                running.add(asyncio.create_task(_resolve_one(guild_id, track)))
+            if not running:
+                break
+
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for t in finished:
+                if t.result(): resolved += 1
+                else: failed += 1
+            remaining = max(0, remaining - len(finished))
+
+            # Progreso (como mucho un edit cada 5s)
+            if time.time() - last_report >= 5 and remaining:
+                last_report = time.time()
+                txt = f"🔎 Preparando canciones: **{resolved}** listas, **{remaining}** pendientes..."
+                try:
+                    if progress_msg is None and queue.get("channel"):
+                        progress_msg = await queue["channel"].send(txt)
+                    elif progress_msg is not None:
+                        await progress_msg.edit(content=txt)
+                except discord.NotFound:
+                    progress_msg = None
+                except Exception as e:
+                    print(f"[LOTE] Error mostrando progreso: {e}")
+    finally:
+        for t in running:
+            t.cancel()
+        if progress_msg is not None:
+            try: await progress_msg.delete()
+            except: pass
+        print(f"[LOTE] Guild {guild_id}: {resolved} resueltas, {failed} fallidas en {time.time() - started:.1f}s")
+
+def stop_background_work(guild_id):
+    """Cancela todo el trabajo de fondo de un servidor (stop, leave, desconexión)."""
+    resolver.cancel_guild(guild_id)
+    cancel_prefetch(guild_id)
+    cancel_handoff(guild_id)
+    cancel_stream_refresh(guild_id)
+    now_playing.untrack(guild_id)
+    cancel_placeholder_resolution(guild_id)
+    cancel_playlist_load(guild_id)
+    autoplay.reset(guild_id)
+    if audio_workers is not None:
+        audio_workers.release(guild_id)
+
+
+async def play_next(guild: discord.Guild, handoff=None):
     """
     Avanza al siguiente track en la cola y lo reproduce.
+    handoff: relevo del TrackChain (la siguiente ya está sonando).
     """
     if guild.id not in music_queues: # Si no hay cola
         return
@@ -788,7 +1576,19 @@ async def play_next(guild: discord.Guild):
         return
 
     # Avanzar índice
-    queue["index"] += 1
+    if handoff is not None:
+        tracks = queue["tracks"]
+        if handoff["index"] < len(tracks) and tracks[handoff["index"]].get("webpage_url") == handoff["url"]:
+            queue["index"] = handoff["index"]
+        else:
+            # La cola cambió justo en el relevo: se para lo que suena sin saltar otra vez
+            print("[HANDOFF] La cola cambió durante el relevo, se reproduce de la forma normal.")
+            handoff = None
+            if guild.id in audio_sources and (voice.is_playing() or voice.is_paused()):
+                audio_sources[guild.id]["seeking"] = True
+            queue["index"] += 1
+    else:
+        queue["index"] += 1
 
     # Verificar si hay más canciones
     # IMPORTANTE: Si la cola está vacía (Stop), no hacer autoplay
@@ -812,105 +1612,15 @@ async def play_next(guild: discord.Guild):
         try:
             last_track = queue["tracks"][-1]
             last_title = last_track.get("title", "")
-            
-            # Limpiar título de forma más agresiva para mejores resultados
-            import re
-            
-            # Quitar paréntesis, corchetes y su contenido
-            clean_title = re.sub(r'[\(\[].*?[\)\]]', '', last_title)
-            
-            # Quitar palabras comunes que no ayudan en la búsqueda
-            remove_words = ['official', 'video', 'audio', 'visualizer', 'lyric', 'lyrics', 
-                           'feat', 'ft', 'prod', 'music', 'mv', 'hd', 'hq', '4k']
-            for word in remove_words:
-                clean_title = re.sub(rf'\b{word}\b', '', clean_title, flags=re.IGNORECASE)
-            
-            # Quitar caracteres especiales excepto letras, números y espacios
-            clean_title = re.sub(r'[^\w\s]', ' ', clean_title)
-            
-            # Quitar espacios múltiples
-            clean_title = ' '.join(clean_title.split())
-            
-            # Tomar solo las primeras 3-4 palabras para búsqueda más amplia
-            words = clean_title.split()[:4]
-            search_query = ' '.join(words)
-            
             print(f"[AUTOPLAY] Título original: {last_title}")
-            print(f"[AUTOPLAY] Buscando recomendaciones para: {search_query}")
-
-            # Buscar 5 resultados y SIEMPRE elegir uno diferente
-            # Lógica personalizada inline para no romper buscar_audio estándar
-            def get_recommendation(query):
-                with YoutubeDL({"format": "bestaudio", "noplaylist": True, "quiet": False}) as ydl_rec:
-                   try:
-                        # Buscar 5 videos
-                        print(f"[AUTOPLAY] Buscando: ytsearch5:{query}")
-                        info_rec = ydl_rec.extract_info(f"ytsearch5:{query}", download=False)
-                        
-                        if "entries" not in info_rec:
-                            print("[AUTOPLAY] No se encontró 'entries' en la respuesta")
-                            return None
-                            
-                        entries = info_rec["entries"]
-                        print(f"[AUTOPLAY] Encontrados {len(entries) if entries else 0} resultados")
-                        
-                        if not entries or len(entries) == 0:
-                            print("[AUTOPLAY] Lista de entries vacía")
-                            return None
-                        
-                        # Filtrar válidos
-                        valid = [e for e in entries if e]
-                        print(f"[AUTOPLAY] {len(valid)} videos válidos después del filtro")
-                        
-                        if not valid:
-                            print("[AUTOPLAY] No hay videos válidos")
-                            return None
-                        
-                        # ESTRATEGIA: Saltar SIEMPRE el primero (es la misma canción)
-                        # Si hay más de 1, elegir uno aleatorio del resto
-                        import random
-                        candidates = valid[1:] if len(valid) > 1 else valid
-                        
-                        # Protección: asegurarse de que hay candidatos
-                        if not candidates or len(candidates) == 0:
-                            print("[AUTOPLAY] No hay candidatos disponibles después de saltar el primero")
-                            return None
-                        
-                        print(f"[AUTOPLAY] {len(candidates)} candidatos disponibles")
-                        random.shuffle(candidates)
-                        
-                        # Simplificado: tomar el primero de los candidatos sin re-validar
-                        # El extract_info inicial ya descartó videos inaccesibles
-                        chosen = candidates[0]
-                        
-                        if not chosen or not chosen.get("url"):
-                            print("[AUTOPLAY] Candidato elegido inválido")
-                            return None
-                        
-                        print(f"[AUTOPLAY] Seleccionado: {chosen.get('title')}")
-                        return (chosen.get("url"), chosen.get("title"), chosen.get("duration"), 
-                                chosen.get("thumbnail"), chosen.get("webpage_url"))
-                        
-                   except Exception as e:
-                        print(f"[AUTOPLAY_SEARCH] Error en búsqueda: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        return None
-                return None
-
-            res = await bot.loop.run_in_executor(None, lambda: get_recommendation(search_query))
+
+            # La bolsa de candidatos se preparó mientras sonaba la última canción
+            new_track = await autoplay.pick(guild.id, last_title, autoplay_exclusions(queue))
             
-            if res:
-                stream_u, new_title, new_dur, new_thumb, new_page_url = res
-                
-                # Añadir a la cola
-                queue["tracks"].append({
-                    "title": new_title, 
-                    "webpage_url": new_page_url, 
-                    "duration": new_dur, 
-                    "thumbnail": new_thumb
-                })
-                print(f"[AUTOPLAY] Añadido auto: {new_title}")
+            if new_track:
+                # Añadir a la cola (se resuelve del todo al reproducirla)
+                queue["tracks"].append(new_track)
+                print(f"[AUTOPLAY] Añadido auto: {new_track['title']}")
             else:
                 print("[AUTOPLAY] No se encontraron recomendaciones.")
                 # Borrar mensaje de búsqueda si no encontramos nada
@@ -934,7 +1644,7 @@ async def play_next(guild: discord.Guild):
     track = queue["tracks"][queue["index"]]
     print(f"[PLAY_NEXT] Reproduciendo siguiente: {track['title']}")
         
-    real_title, real_duration, thumbnail = await play_track_in_guild(guild, track)
+    real_title, real_duration, thumbnail = await play_track_in_guild(guild, track, handoff=handoff)
     
     # Enviar mensaje al canal original
     channel = queue.get("channel")
@@ -945,21 +1655,16 @@ async def play_next(guild: discord.Guild):
         embed = create_minimal_embed(real_title, track_url, real_duration, 0, thumbnail)
         
         # Reenviamos la view para que los botones sigan disponibles abajo
-        view = PlayerView(guild.id)
+        view = player_view
         try:
             # Limpiar anterior
             await cleanup_previous_message(guild.id)
             
             message = await channel.send(embed=embed, view=view)
             
-            # Guardar referencia
+            # Guardar referencia (el planificador de "ahora suena" lo va actualizando)
             if guild.id in audio_sources:
-                audio_sources[guild.id]["message"] = message
-
-            # Iniciar tarea de actualización BACKGROUND
-            if real_duration > 0 and guild.id in audio_sources:
-                 task = bot.loop.create_task(update_message_task(message, audio_sources[guild.id]["start_time"], real_duration, real_title, guild.voice_client))
-                 audio_sources[guild.id]["task"] = task
+                track_now_playing(guild.id, message)
                  
         except Exception as e:
             print(f"[PLAY_NEXT] No se pudo enviar mensaje: {e}")
@@ -980,6 +1685,20 @@ async def play_next(guild: discord.Guild):
 
 
 
+# Vista única de los botones del reproductor (se crea en setup_hook, con el loop ya en marcha)
+player_view = None
+
+@bot.event
+async def setup_hook():
+    global player_view
+    player_view = PlayerView()
+    bot.add_view(player_view) # Persistente: responde a los botones de mensajes enviados antes de reiniciar
+
+def log_warm_up_error(future):
+    """El warm-up del pool corre en un executor sin esperar el resultado: si no, sus errores se perderían."""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"[YDL_POOL] Error en el warm-up: {future.exception()!r}")
+
 @bot.event
 async def on_ready():
     print(f"Bot listo como {bot.user}") # Muestra el nombre del bot
@@ -989,6 +1708,10 @@ async def on_ready():
     try:
         db.init_db() # Inicializar base de datos
         print("Base de datos inicializada")
+
+        # Preparar instancias de YoutubeDL para que la primera búsqueda no pague el arranque
+        warm_up = bot.loop.run_in_executor(None, ydl_pool.warm_up)
+        warm_up.add_done_callback(log_warm_up_error)
         
         if not clean_chat_task.is_running():
              clean_chat_task.start()
@@ -1027,6 +1750,7 @@ async def join(interaction: discord.Interaction): # Función para unir el bot a
 @bot.tree.command(name="leave", description="Desconecta el bot del canal de voz") # Comando para desconectar el bot de un canal de voz
 async def leave(interaction: discord.Interaction): # Función para desconectar el bot de un canal de voz
     if interaction.guild.voice_client:
+        stop_background_work(interaction.guild.id) # Cancelar búsquedas pendientes
         # Limpiar el source guardado al desconectarse
         if interaction.guild.id in audio_sources: # Si el servidor está en el diccionario de audio_sources, se elimina
             del audio_sources[interaction.guild.id] # Se elimina el servidor del diccionario de audio_sources
@@ -1045,6 +1769,7 @@ async def pause(interaction: discord.Interaction): # Función para pausar la rep
     if voice.is_playing(): # Si el bot está reproduciendo, se pausa
         print(f"[PAUSE] Pausando reproducción en servidor {interaction.guild.id}") # Muestra el ID del servidor en el que se está pausando la reproducción
         voice.pause()
+        now_playing.request(interaction.guild.id, urgent=True)
         await interaction.response.send_message("⏸️ Pausado.") # Se envía un mensaje de confirmación
     elif voice.is_paused():
         await interaction.response.send_message("Ya está pausado.", ephemeral=True) # Se envía un mensaje de error
@@ -1059,36 +1784,32 @@ async def resume(interaction: discord.Interaction): # Función para reanudar la
     
     if voice.is_paused():
         print(f"[RESUME] Reanudando reproducción en servidor {interaction.guild.id}") # Muestra el ID del servidor en el que se está reanudando la reproducción
+        await interaction.response.defer()
+        await refresh_before_resume(interaction.guild) # Tras una pausa larga la URL de stream puede haber caducado
         voice.resume() # Se reanuda la reproducción
-        await interaction.response.send_message("▶️ Reanudado.") # Se envía un mensaje de confirmación
+        now_playing.request(interaction.guild.id, urgent=True)
+        await interaction.followup.send("▶️ Reanudado.") # Se envía un mensaje de confirmación
     elif voice.is_playing():
         await interaction.response.send_message("Ya está reproduciéndose.", ephemeral=True)
     else:
-        # Si no está pausado ni reproduciendo, intentar reanudar desde el source guardado
+        # Si no está pausado ni reproduciendo, intentar reanudar desde lo guardado
         if interaction.guild.id in audio_sources:
             saved_data = audio_sources[interaction.guild.id]
             print(f"[RESUME] No hay source activo, pero hay uno guardado. Reiniciando...") # Muestra un mensaje de que no hay source activo, pero hay uno guardado
+            await interaction.response.defer()
             try:
-                # Recrear el source desde la URL guardada
-                try:
-                    source = await discord.FFmpegOpusAudio.from_probe( # Se crea la fuente de audio con FFmpegOpusAudio.from_probe
-                        saved_data["url"], 
-                        executable=FFMPEG_PATH, # Ruta del ejecutable de FFMPEG
-                        **FFMPEG_OPTIONS
-                    )
-                except:
-                    source = discord.FFmpegPCMAudio( # Se crea la fuente de audio con FFmpegPCMAudio
-                        saved_data["url"],
-                        executable=FFMPEG_PATH, # Ruta del ejecutable de FFMPEG
-                        **FFMPEG_OPTIONS
-                    )
-                
-                audio_sources[interaction.guild.id]["source"] = source # Se guarda el source en el diccionario de audio_sources
-                voice.play(source, after=lambda e: print(f"\n[PLAY] Reproducción finalizada: {e}" if e else "\n[PLAY] Reproducción terminada correctamente"))
-                await interaction.response.send_message(f"▶️ Reanudando: {saved_data['title']}") # Se envía un mensaje de confirmación
+                # saved_data["url"] es la página, no un stream: se vuelve a resolver y se sigue donde se quedó
+                position = int(stream_position(saved_data))
+                if saved_data.get("duration") and position >= saved_data["duration"] - 1:
+                    position = 0 # Ya había terminado: desde el principio
+                track = {"title": saved_data["title"], "webpage_url": saved_data["url"]}
+                result = await play_track_in_guild(interaction.guild, track, start_offset=position, priority=PRIORITY_INTERACTIVE, restart=True)
+                if len(result) == 2: # (mensaje de error, 0)
+                    raise RuntimeError(result[0])
+                await interaction.followup.send(f"▶️ Reanudando: {result[0]}") # Se envía un mensaje de confirmación
             except Exception as e:
                 print(f"[RESUME] ERROR al reanudar: {e}") # Muestra un mensaje de que la reanudación finalizó con error
-                await interaction.response.send_message(f"Error al reanudar: {e}", ephemeral=True) # Se envía un mensaje de error
+                await interaction.followup.send(f"Error al reanudar: {e}", ephemeral=True) # Se envía un mensaje de error
         else:
             await interaction.response.send_message("No hay nada pausado ni guardado para reanudar.", ephemeral=True) # Se envía un mensaje de error
 
@@ -1098,7 +1819,12 @@ async def stop(interaction: discord.Interaction): # Función para detener la rep
     if not voice: 
         return await interaction.response.send_message("No estoy en un canal de voz.", ephemeral=True) # Se envía un mensaje de error
     
-    if voice.is_playing() or voice.is_paused(): # Si el bot está reproduciendo o pausado, se detiene
+    # Cancelar búsquedas pendientes antes de mirar si suena algo: una playlist que aún
+    # está resolviendo su primera canción empezaría a sonar después del /stop
+    loading = interaction.guild.id in playlist_loads
+    stop_background_work(interaction.guild.id)
+
+    if voice.is_playing() or voice.is_paused() or loading: # Si el bot está reproduciendo, pausado o cargando, se detiene
         print(f"[STOP] Deteniendo reproducción en servidor {interaction.guild.id}") # Muestra el ID  del servidor en el que se está deteniendo la reproducción
         voice.stop() # Se detiene la reproducción
         # Limpiar el source guardado
@@ -1153,11 +1879,6 @@ async def playlist(interaction: discord.Interaction, url: str):
     if not interaction.guild.voice_client:
         await voice_channel.connect()
     
-    tracks, playlist_title = buscar_playlist(url)
-    
-    if not tracks:
-         return await interaction.followup.send(f"❌ Error cargando playlist: {playlist_title}")
-         
     # Añadir a cola
     if interaction.guild.id not in music_queues:
         music_queues[interaction.guild.id] = {
@@ -1165,48 +1886,65 @@ async def playlist(interaction: discord.Interaction, url: str):
         }
         
     queue = music_queues[interaction.guild.id]
-    
-    # Añadir canciones
-    count = 0
-    for t in tracks:
-        queue["tracks"].append(t)
-        count += 1
-        
-    await interaction.followup.send(f"✅ Añadidas **{count}** canciones de la lista **{playlist_title}**.")
-    
-    # Si no suena nada, darle caña
     voice = interaction.guild.voice_client
-    if not voice.is_playing() and not voice.is_paused():
-        # Ajustar index si acabamos de crear la cola
-        if len(queue["tracks"]) == count: # Cola nueva
-            queue["index"] = 0
-            
-        # Reproducir tracks[0] o el que toque
-        # Si la cola tenía cosas pero ya acabó, index estará al final
-        if queue["index"] >= len(queue["tracks"]) - count:
-             # Si estaba parada al final, movemos index al principio de lo nuevo
-             queue["index"] = len(queue["tracks"]) - count
-             
-        track = queue["tracks"][queue["index"]]
-        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track)
-        
-        # Enviar embed inicial (reutilizando lógica play)
-        try:
-             # Cleanup y mensaje
-             await cleanup_previous_message(interaction.guild.id)
-             progress_bar = create_progress_bar(0, real_duration)
-             embed = discord.Embed(title="🎵 Reproduciendo Playlist", description=f"**{real_title}**\n\n{progress_bar}", color=discord.Color.blurple())
-             if thumbnail: embed.set_thumbnail(url=thumbnail)
-             msg = await interaction.followup.send(embed=embed, view=PlayerView(interaction.guild.id))
-             
-             if real_duration > 0:
-                 task = bot.loop.create_task(update_message_task(msg, time.time(), real_duration, real_title, voice))
-                 audio_sources[interaction.guild.id] = audio_sources.get(interaction.guild.id, {})
-                 audio_sources[interaction.guild.id]["message"] = msg
-                 audio_sources[interaction.guild.id]["start_time"] = time.time()
-                 audio_sources[interaction.guild.id]["task"] = task
-        except Exception as e:
-            print(f"Error UI Playlist: {e}")
+    playlist_title = "Playlist"
+    count = 0
+    started = False
+
+    # Ingesta incremental: la primera canción suena en cuanto se conoce
+    try:
+        async for kind, value in stream_playlist(url, interaction.guild.id):
+            if kind == "title":
+                playlist_title = value
+                continue
+
+            queue["tracks"].append(value)
+            count += 1
+
+            if count == 1:
+                # Si no suena nada, darle caña con la primera de la lista
+                if not voice.is_playing() and not voice.is_paused():
+                    queue["index"] = len(queue["tracks"]) - 1
+                    started = True
+                    await _start_playlist_playback(interaction, queue, voice)
+            elif count == 2:
+                schedule_prefetch(interaction.guild.id) # Ya hay siguiente
+    except Exception as e:
+        if count == 0:
+            return await interaction.followup.send(f"❌ Error cargando playlist: {e}")
+        print(f"[PLAYLIST] Carga interrumpida tras {count} canciones: {e}")
+
+    if count == 0:
+        return await interaction.followup.send(f"❌ Error cargando playlist: no se encontraron canciones.")
+
+    txt = f"✅ Añadidas **{count}** canciones de la lista **{playlist_title}**."
+    if interaction.guild.id not in music_queues or not queue["tracks"]:
+        txt = f"⏹️ Carga de **{playlist_title}** detenida ({count} canciones leídas)."
+    await interaction.followup.send(txt)
+    if not started:
+        schedule_prefetch(interaction.guild.id)
+
+async def _start_playlist_playback(interaction, queue, voice):
+    """Arranca la canción actual de la cola y manda el embed de la playlist."""
+    track = queue["tracks"][queue["index"]]
+    try:
+        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track, priority=PRIORITY_INTERACTIVE)
+    except Exception as e:
+        print(f"[PLAYLIST] Error arrancando: {e}")
+        return
+
+    # Enviar embed inicial (reutilizando lógica play)
+    try:
+         # Cleanup y mensaje
+         await cleanup_previous_message(interaction.guild.id)
+         progress_bar = create_progress_bar(0, real_duration)
+         embed = discord.Embed(title="🎵 Reproduciendo Playlist", description=f"**{real_title}**\n\n{progress_bar}", color=discord.Color.blurple())
+         if thumbnail: embed.set_thumbnail(url=thumbnail)
+         msg = await interaction.followup.send(embed=embed, view=player_view)
+         
+         track_now_playing(interaction.guild.id, msg)
+    except Exception as e:
+        print(f"Error UI Playlist: {e}")
 
 @bot.tree.command(name="history", description="Muestra las últimas 10 canciones reproducidas")
 async def historial(interaction: discord.Interaction):
@@ -1363,6 +2101,55 @@ class SeekModal(discord.ui.Modal, title="Ir a minuto específico"):
         await seek_to_time(interaction, seconds)
 
 
+SEEK_TARGET_MS = 300 # Objetivo de latencia del seek
+seek_latencies = {} # método -> deque con las últimas latencias (ms)
+
+def record_seek_latency(method, ms):
+    seek_latencies.setdefault(method, deque(maxlen=200)).append(ms)
+    level = "" if ms <= SEEK_TARGET_MS else " (por encima del objetivo)"
+    print(f"[SEEK] {method}: {ms:.0f} ms{level}")
+
+async def measure_seek(method, source, t0):
+    """Latencia del seek: desde la orden hasta el primer frame de audio de la nueva posición."""
+    if method != "in-process": # En proceso el siguiente frame ya es el bueno
+        for _ in range(250): # Máx. 5 s
+            if source.first_frame_at is not None:
+                break
+            await asyncio.sleep(0.02)
+    end = source.first_frame_at if method != "in-process" and source.first_frame_at else time.perf_counter()
+    record_seek_latency(method, (end - t0) * 1000)
+
+async def seek_in_place(guild, target_seconds):
+    """
+    Mueve la canción actual sin volver a pasar por yt-dlp ni parar el reproductor.
+    - Fichero local de la caché: seek dentro del propio proceso (sin ffmpeg).
+    - Stream: nueva fuente con -ss sobre la URL y formato que ya teníamos,
+      cambiada en caliente en el voice client.
+    Devuelve el método usado o None si hay que reiniciar la pista.
+    """
+    voice = guild.voice_client
+    current = audio_sources.get(guild.id) or {}
+    source, info, chain = current.get("source"), current.get("info"), current.get("chain")
+    if voice is None or source is None or info is None or chain is None:
+        return None
+    if voice.source is not chain or chain.current is not source:
+        return None
+    if not (voice.is_playing() or voice.is_paused()):
+        return None
+
+    if source.seekable:
+        source.seek(target_seconds)
+        set_position(current, target_seconds, source.frames) # Misma fuente: se cuenta desde los frames de ahora
+        method = "in-process"
+    else:
+        if not info.get("local") and stream_cache.ttl_for(info["url"]) <= 0:
+            # La URL de stream caducó: extraer de nuevo, pero sin cortar lo que suena
+            info = await resolve_audio(current["url"], priority=PRIORITY_INTERACTIVE, guild_id=guild.id)
+        if swap_stream(guild, info, target_seconds) is None:
+            return None
+        method = "swap"
+    return method
+
 async def seek_to_time(interaction: discord.Interaction, target_seconds: int):
     """Lógica para mover la canción."""
     guild = interaction.guild
@@ -1371,6 +2158,8 @@ async def seek_to_time(interaction: discord.Interaction, target_seconds: int):
     
     info = audio_sources[guild.id]
     duration = info["duration"]
+    if (info.get("info") or {}).get("is_live"):
+        return await interaction.response.send_message("🔴 No se puede mover un directo.", ephemeral=True)
     
     # Validar límites
     if target_seconds < 0: target_seconds = 0
@@ -1378,23 +2167,34 @@ async def seek_to_time(interaction: discord.Interaction, target_seconds: int):
         return await interaction.response.send_message("No puedes adelantar más allá del final.", ephemeral=True)
 
     await interaction.response.defer() # Porque vamos a tardar un poco
-    
-    # Marcar que estamos haciendo seek para que after_playing no salte de canción
-    audio_sources[guild.id]["seeking"] = True
-    
-    # Recuperar track actual de la cola para tener la URL original limpia?
-    # Ya tenemos info["url"] que es el stream_url. 
-    # OJO: `stream_url` de yt-dlp a veces caduca. Lo ideal sería recuperar el track de la cola.
-    queue = music_queues.get(guild.id)
-    if not queue: return
-    
-    track = queue["tracks"][queue["index"]]
-    
-    # Reproducir desde offset
-    real_title, _, thumbnail = await play_track_in_guild(guild, track, start_offset=target_seconds)
-    
-    # Quitar el flag de seeking (se reinicializa en play_track_in_guild en realidad, 
-    # porque sobrescribe audio_sources[guild.id], así que "seeking" se pierde, que es lo que queremos)
+    t0 = time.perf_counter()
+
+    # Camino rápido: mover la fuente actual sin yt-dlp ni parar el reproductor
+    try:
+        method = await seek_in_place(guild, target_seconds)
+    except Exception as e:
+        print(f"[SEEK] Falló el seek rápido ({e}), reiniciando la pista")
+        method = None
+
+    if method:
+        real_title, thumbnail = info["title"], info.get("thumbnail")
+    else:
+        # Marcar que estamos haciendo seek para que after_playing no salte de canción
+        voice = guild.voice_client
+        if voice and (voice.is_playing() or voice.is_paused()):
+            audio_sources[guild.id]["seeking"] = True
+
+        queue = music_queues.get(guild.id)
+        if not queue: return
+
+        track = queue["tracks"][queue["index"]]
+
+        # Reproducir desde offset
+        real_title, _, thumbnail = await play_track_in_guild(guild, track, start_offset=target_seconds, priority=PRIORITY_INTERACTIVE, restart=True)
+        method = "restart"
+    source = audio_sources.get(guild.id, {}).get("source")
+    if isinstance(source, audio.MeteredSource):
+        bot.loop.create_task(measure_seek(method, source, t0))
     
     # Actualizar mensaje con nueva barra
     progress_bar = create_progress_bar(target_seconds, duration)
@@ -1409,27 +2209,28 @@ async def seek_to_time(interaction: discord.Interaction, target_seconds: int):
     await cleanup_previous_message(guild.id)
 
     # Enviamos nuevo mensaje de estado
-    msg = await interaction.followup.send(embed=embed, view=PlayerView(guild.id))
+    msg = await interaction.followup.send(embed=embed, view=player_view)
     
-    # Guardar referencia
-    audio_sources[guild.id]["message"] = msg
-    
-    # Reiniciar updater
-    if duration > 0:
-        task = bot.loop.create_task(update_message_task(msg, time.time(), duration, real_title, guild.voice_client))
-        audio_sources[guild.id]["task"] = task
+    # Guardar referencia (el planificador de "ahora suena" lo va actualizando)
+    track_now_playing(guild.id, msg)
 
 
 class PlayerView(discord.ui.View):
-    def __init__(self, guild_id):
+    """
+    Botones del reproductor. Hay una sola instancia persistente para todos los
+    mensajes (registrada con bot.add_view en setup_hook): los custom_id son fijos
+    y el servidor sale de la propia interacción, así que los botones siguen
+    funcionando tras reiniciar el bot y no se acumulan vistas en memoria.
+    """
+
+    def __init__(self):
         super().__init__(timeout=None)
-        self.guild_id = guild_id
 
-    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary, row=0, custom_id="player:previous")
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        queue = music_queues.get(self.guild_id)
+        queue = music_queues.get(interaction.guild.id)
         if not queue: 
             return await interaction.channel.send("No hay cola.", delete_after=3)
         
@@ -1437,6 +2238,8 @@ class PlayerView(discord.ui.View):
         new_index = queue["index"] - 2
         if new_index < -1: new_index = -1
         queue["index"] = new_index
+        cancel_prefetch(interaction.guild.id) # Lo prefetcheado ya no es lo siguiente
+        cancel_handoff(interaction.guild.id)
         
         if voice and (voice.is_playing() or voice.is_paused()): 
             voice.stop()
@@ -1445,7 +2248,7 @@ class PlayerView(discord.ui.View):
         
         await interaction.channel.send("⏮️ Retrocediendo...", delete_after=3)
 
-    @discord.ui.button(emoji="⏯️", style=discord.ButtonStyle.success, row=0)
+    @discord.ui.button(emoji="⏯️", style=discord.ButtonStyle.success, row=0, custom_id="player:pause_resume")
     async def pause_resume(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
@@ -1457,34 +2260,47 @@ class PlayerView(discord.ui.View):
             voice.pause()
             txt = "⏸️ Pausado."
         elif voice.is_paused():
+            await refresh_before_resume(interaction.guild)
             voice.resume()
             txt = "▶️ Reanudado."
         else: 
             txt = "Nada sonando."
+        now_playing.request(interaction.guild.id, urgent=True)
         
         await interaction.channel.send(txt, delete_after=3)
 
-    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary, row=0, custom_id="player:next")
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        queue = music_queues.get(self.guild_id)
+        queue = music_queues.get(interaction.guild.id)
         if not queue: 
             return await interaction.channel.send("No hay cola.", delete_after=3)
         
+        # Saltar a index+1 es justo lo prefetcheado: take_prefetch valida índice/URL,
+        # así que solo se invalida si la cola cambió por debajo
+        pf = prefetch_tasks.get(interaction.guild.id)
+        next_index = queue["index"] + 1
+        if pf and (next_index >= len(queue["tracks"]) or pf["url"] != queue["tracks"][next_index].get("webpage_url")):
+            cancel_prefetch(interaction.guild.id)
+            cancel_handoff(interaction.guild.id)
+
         voice = interaction.guild.voice_client
-        if voice and (voice.is_playing() or voice.is_paused()): 
+        chain = audio_sources.get(interaction.guild.id, {}).get("chain")
+        if voice and voice.is_playing() and voice.source is chain and chain.skip():
+            pass # La siguiente ya estaba arrancada: el relevo se hace en el próximo frame
+        elif voice and (voice.is_playing() or voice.is_paused()): 
             voice.stop()
         else: 
             await play_next(interaction.guild)
         
         await interaction.channel.send("⏭️ Saltando...", delete_after=3)
 
-    @discord.ui.button(emoji="🔀", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(emoji="🔀", style=discord.ButtonStyle.secondary, row=0, custom_id="player:shuffle")
     async def shuffle_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        queue = music_queues.get(self.guild_id)
+        queue = music_queues.get(interaction.guild.id)
         if not queue: 
             return await interaction.channel.send("No hay cola.", delete_after=3)
         
@@ -1496,17 +2312,22 @@ class PlayerView(discord.ui.View):
         upcoming = queue["tracks"][current_idx+1:]
         random.shuffle(upcoming)
         queue["tracks"] = current_and_past + upcoming
+        # La siguiente ha cambiado: preparar la nueva
+        cancel_prefetch(interaction.guild.id)
+        cancel_handoff(interaction.guild.id)
+        schedule_prefetch(interaction.guild.id)
+        schedule_handoff(interaction.guild.id)
         
         await interaction.channel.send("🔀 Cola mezclada.", delete_after=3)
 
-    @discord.ui.button(emoji="❤️", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(emoji="❤️", style=discord.ButtonStyle.secondary, row=0, custom_id="player:favorite")
     async def toggle_favorite(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        if self.guild_id not in audio_sources: 
+        if interaction.guild.id not in audio_sources: 
             return await interaction.channel.send("No está sonando nada.", delete_after=3)
         
-        info = audio_sources[self.guild_id]
+        info = audio_sources[interaction.guild.id]
         track = {
             "title": info["title"],
             "webpage_url": info["url"],
@@ -1514,38 +2335,23 @@ class PlayerView(discord.ui.View):
             "thumbnail": info.get("thumbnail")
         }
         
-        # Verificar si ya está en favoritos
-        favs = db.get_favorites(interaction.user.id)
-        
-        # Debug logging
-        print(f"[FAVORITE_TOGGLE] URL actual: {track['webpage_url']}")
-        print(f"[FAVORITE_TOGGLE] Favoritos del user {interaction.user.id}: {len(favs)} canciones")
-        for f in favs:
-            print(f"  - {f['webpage_url']}")
-        
-        is_favorited = any(f["webpage_url"] == track["webpage_url"] for f in favs)
-        print(f"[FAVORITE_TOGGLE] ¿Está en favoritos? {is_favorited}")
-        
-        if is_favorited:
-            # Quitar de favoritos
-            success, msg = db.remove_favorite(interaction.user.id, track)
-            print(f"[FAVORITE_TOGGLE] Resultado de remove: success={success}, msg={msg}")
-            await interaction.channel.send(f"💔 {msg}", delete_after=3)
-        else:
-            # Agregar a favoritos
-            success, msg = db.save_favorite(interaction.user.id, track)
-            print(f"[FAVORITE_TOGGLE] Resultado de save: success={success}, msg={msg}")
-            await interaction.channel.send(f"❤️ {msg}", delete_after=3)
+        # Índice en memoria: sin leer todos los favoritos de la DB en cada pulsación
+        added, success, msg = await favorites_index.toggle(interaction.user.id, track)
+        if not success:
+            print(f"[FAVORITE_TOGGLE] Error guardando favorito de {interaction.user.id}: {msg}")
+        icon = "⚠️" if added is None else "❤️" if added else "💔"
+        await interaction.channel.send(f"{icon} {msg}", delete_after=3)
 
-    @discord.ui.button(emoji="📍", label="Ir a...", style=discord.ButtonStyle.secondary, row=1)
+    @discord.ui.button(emoji="📍", label="Ir a...", style=discord.ButtonStyle.secondary, row=1, custom_id="player:seek")
     async def seek_modal(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(SeekModal(self.guild_id))
+        await interaction.response.send_modal(SeekModal(interaction.guild.id))
 
-    @discord.ui.button(emoji="⏹️", style=discord.ButtonStyle.danger, row=1)
+    @discord.ui.button(emoji="⏹️", style=discord.ButtonStyle.danger, row=1, custom_id="player:stop")
     async def stop_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
         voice = interaction.guild.voice_client
+        stop_background_work(interaction.guild.id)
         if voice: 
             voice.stop()
         
@@ -1562,6 +2368,8 @@ class PlayerView(discord.ui.View):
 async def favorites(interaction: discord.Interaction):
     # Obtener favoritos
     favs = db.get_favorites(interaction.user.id)
+    if favs is None:
+        return await interaction.response.send_message("⚠️ No se pudieron cargar tus favoritos, inténtalo más tarde.", ephemeral=True)
     if not favs:
         return await interaction.response.send_message("💔 No tienes favoritos guardados aún. Usa el botón ❤️ cuando suene algo que te guste.", ephemeral=True)
         
@@ -1590,7 +2398,7 @@ async def favorites(interaction: discord.Interaction):
              queue["index"] = 0
              
         track = queue["tracks"][queue["index"]]
-        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track)
+        real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track, priority=PRIORITY_INTERACTIVE)
         
         # UI Inicial (reutilizada)
         try:
@@ -1598,14 +2406,9 @@ async def favorites(interaction: discord.Interaction):
              progress_bar = create_progress_bar(0, real_duration)
              embed = discord.Embed(title="❤️ Reproduciendo Favoritos", description=f"**{real_title}**\n\n{progress_bar}", color=discord.Color.red())
              if thumbnail: embed.set_thumbnail(url=thumbnail)
-             msg = await interaction.followup.send(embed=embed, view=PlayerView(interaction.guild.id))
+             msg = await interaction.followup.send(embed=embed, view=player_view)
              
-             if real_duration > 0:
-                 task = bot.loop.create_task(update_message_task(msg, time.time(), real_duration, real_title, voice))
-                 audio_sources[interaction.guild.id] = audio_sources.get(interaction.guild.id, {})
-                 audio_sources[interaction.guild.id]["message"] = msg
-                 audio_sources[interaction.guild.id]["start_time"] = time.time()
-                 audio_sources[interaction.guild.id]["task"] = task
+             track_now_playing(interaction.guild.id, msg)
         except Exception as e:
             print(f"Error UI Favorites: {e}")
 
@@ -1743,17 +2546,15 @@ class ServerPlaylistGroup(app_commands.Group):
             
             # Play
             track = queue["tracks"][queue["index"]]
-            real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track)
+            real_title, real_duration, thumbnail = await play_track_in_guild(interaction.guild, track, priority=PRIORITY_INTERACTIVE)
             
             # UI
             embed = discord.Embed(title="📢 Reproduciendo Playlist de Servidor", description=track["title"], color=discord.Color.gold())
             if thumbnail: embed.set_thumbnail(url=thumbnail)
-            view = PlayerView(interaction.guild.id)
+            view = player_view
             msg = await interaction.channel.send(embed=embed, view=view)
             
-            if real_duration > 0:
-                 task = bot.loop.create_task(update_message_task(msg, time.time(), real_duration, real_title, voice))
-                 audio_sources[interaction.guild.id] = {"message": msg, "start_time": time.time(), "task": task, "title": real_title, "url": track["webpage_url"], "duration": real_duration}
+            track_now_playing(interaction.guild.id, msg)
 
 
     @app_commands.command(name="list", description="Lista las playlists del servidor")
@@ -1802,6 +2603,126 @@ async def delete_playlist(interaction: discord.Interaction, name: str):
 
 # CONFIGURACIÓN Y RESTRICCIONES
 
+def is_bot_admin(interaction: discord.Interaction) -> bool:
+    """True si el usuario está en ADMIN_ID (o es admin del servidor cuando no hay ADMIN_ID)."""
+    if ADMIN_ID:
+        allowed_ids = [x.strip() for x in ADMIN_ID.split(',')]
+        return str(interaction.user.id) in allowed_ids
+    return interaction.user.guild_permissions.administrator
+
+@bot.tree.command(name="stats", description="[Admin] Estadísticas internas del bot (caché, resolver)")
+async def stats(interaction: discord.Interaction):
+    if not is_bot_admin(interaction):
+        return await interaction.response.send_message("❌ No tienes permiso para usar este comando.", ephemeral=True)
+
+    r_stats = resolver.stats()
+    c_stats = r_stats.pop("cache", {})
+
+    embed = discord.Embed(title="📊 Estadísticas", color=0x2b2d31)
+    embed.add_field(
+        name="🔎 Resolver",
+        value=(f"Trabajos: **{r_stats['jobs']}** (compartidos {r_stats['shared']})\n"
+               f"Pendientes: **{r_stats['pending']}** | En vuelo: **{r_stats['inflight']}**\n"
+               f"Timeouts: {r_stats['timeouts']} | Cancelados: {r_stats['cancelled']} | Errores: {r_stats['errors']}"),
+        inline=False
+    )
+    if c_stats:
+        embed.add_field(
+            name="⚡ Caché de streams",
+            value=(f"Entradas: **{c_stats['size']}/{c_stats['maxsize']}**\n"
+                   f"Hits: **{c_stats['hits']}** | Misses: **{c_stats['misses']}** | Hit rate: **{c_stats['hit_rate']:.0%}**\n"
+                   f"Expulsadas (LRU): {c_stats['evictions']}"),
+            inline=False
+        )
+    # Coste de CPU por tipo de fuente (terminadas + las que suenan ahora)
+    live = [d["source"] for d in audio_sources.values() if isinstance(d.get("source"), audio.MeteredSource)]
+    a_stats = audio.audio_stats.summary(live)
+    if a_stats:
+        lines = [f"`{kind}`: **{d['cpu_per_minute']:.2f}s** CPU/min "
+                 f"(Python {d['python_cpu']:.1f}s, ffmpeg {d['ffmpeg_cpu']:.1f}s, {d['streams']} streams)"
+                 for kind, d in sorted(a_stats.items())]
+        embed.add_field(name=f"🔊 Audio (modo {AUDIO_MODE})", value="\n".join(lines), inline=False)
+    if audio_workers is not None:
+        w_stats = audio_workers.stats()
+        load = " ".join(f"`{core}`:{n}" for core, n in w_stats["load"].items())
+        embed.add_field(
+            name="🧵 Workers de audio",
+            value=(f"Workers (núcleos): **{w_stats['workers']}** | ffmpeg fijados: {w_stats['pinned']} (errores {w_stats['pin_errors']})\n"
+                   f"Servidores por núcleo: {load}"),
+            inline=False
+        )
+    if bandwidth_saved:
+        embed.add_field(
+            name="📉 Selección de formato",
+            value=(f"Ahorro estimado: **{sum(bandwidth_saved.values()) / 1e6:.0f} MB** en {len(bandwidth_saved)} servidores\n"
+                   f"Formatos recordados: {len(format_choices)}"),
+            inline=False
+        )
+    np_stats = now_playing.stats()
+    embed.add_field(
+        name="🖼️ Mensajes de reproducción",
+        value=(f"Mensajes activos: **{np_stats['tracked']}** | Intervalo (canción de 4 min): {np_stats['interval']}s\n"
+               f"Ediciones: {np_stats['edits']} (urgentes {np_stats['urgent_edits']}) | Sin cambios: {np_stats['unchanged']} | Aplazadas por presupuesto: {np_stats['deferred']}\n"
+               f"429 recibidos: {np_stats['rate_limited']} | Errores: {np_stats['errors']}"),
+        inline=False
+    )
+    reg = message_registry.stats()
+    embed.add_field(
+        name="🧹 Limpieza del chat",
+        value=f"Mensajes del bot pendientes: **{reg['messages']}** en {reg['channels']} canales | Registrados: {reg['registered']}",
+        inline=False
+    )
+    fav = favorites_index.stats()
+    if fav["loads"]:
+        embed.add_field(
+            name="❤️ Favoritos",
+            value=f"Usuarios en memoria: **{fav['users']}** | Cargas desde la DB: {fav['loads']} | Escrituras: {fav['writes']} (errores {fav['errors']})",
+            inline=False
+        )
+    live = audio.live_stats.summary()
+    if live["opened"]:
+        live_now = sum(1 for data in audio_sources.values() if (data.get("info") or {}).get("is_live"))
+        embed.add_field(
+            name="🔴 Directos",
+            value=(f"Sonando: **{live_now}** | Abiertos: {live['streams']} (total {live['opened']}) | Reconexiones: {live['reconnects']}\n"
+                   f"Buffer (distancia al origen): p50 {live['latency_p50_ms']} ms, p95 {live['latency_p95_ms']} ms\n"
+                   f"Atascos: {live['stalls']} ({live['stall_seconds']}s de silencio) | Frames descartados: {live['dropped_frames']}"),
+            inline=False
+        )
+    ttfa = audio.audio_stats.ttfa_summary()
+    if ttfa:
+        lines = [f"`{profile}`: p50 **{p50 * 1000:.0f} ms** | p95 {p95 * 1000:.0f} ms ({n})"
+                 for profile, (n, p50, p95) in sorted(ttfa.items())]
+        embed.add_field(name="⏱️ Tiempo hasta el primer audio", value="\n".join(lines), inline=False)
+    if seek_latencies:
+        lines = []
+        for method, values in sorted(seek_latencies.items()):
+            ordered = sorted(values)
+            p50 = ordered[len(ordered) // 2]
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            lines.append(f"`{method}`: p50 **{p50:.0f} ms** | p95 {p95:.0f} ms ({len(ordered)})")
+        embed.add_field(name=f"⏩ Seek (objetivo {SEEK_TARGET_MS} ms)", value="\n".join(lines), inline=False)
+    if disk_cache:
+        d_stats = disk_cache.stats()
+        embed.add_field(
+            name="💾 Caché en disco",
+            value=(f"Pistas: **{d_stats['files']}** | Tamaño: **{d_stats['bytes'] / 1e6:.0f}/{d_stats['max_bytes'] / 1e6:.0f} MB**\n"
+                   f"Hits: **{d_stats['hits']}** | Misses: **{d_stats['misses']}** | Hit rate: **{d_stats['hit_rate']:.0%}**\n"
+                   f"Descargas: {d_stats['downloads']} (errores {d_stats['download_errors']}, en curso {d_stats['downloading']}) | "
+                   f"Expulsadas: {d_stats['evictions']} | En uso: {d_stats['pinned']}"),
+            inline=False
+        )
+    if LOUDNESS_ENABLED:
+        l_stats = loudness.stats()
+        embed.add_field(
+            name="🎚️ Normalización",
+            value=(f"Objetivo: **{l_stats['target']} LUFS**\n"
+                   f"Medidas: **{l_stats['measured']}** | Fallidas: {l_stats['failed']} | En curso: {l_stats['pending']}\n"
+                   f"Tiempo midiendo: {l_stats['measure_seconds']}s"),
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="setup", description="Configura este canal como exclusivo para música (solo enlaces)")
 async def setup(interaction: discord.Interaction):
     # Verificación por ID de Discord (desde .env)
@@ -1841,6 +2762,11 @@ warning_cooldowns = {}
 
 @bot.event
 async def on_message(message):
+    if message.author.id == bot.user.id:
+        # Mensaje propio (también las respuestas a interacciones): se apunta para la limpieza
+        if message.guild and not message.flags.ephemeral:
+            message_registry.add(message.channel.id, message.id, message.created_at.timestamp())
+        return
     if message.author.bot: return
     if not message.guild: return # Ignorar DMs
 
@@ -1982,12 +2908,13 @@ async def play_from_message(message, url):
             }
         
         queue = music_queues[guild.id]
+        spotify_id = None
         
         # Extracción de URL (simplificada vs /play)
         # 1. SPOTIFY
         if is_spotify_url(url):
             try:
-                queries = get_spotify_queries(url)
+                queries = await get_spotify_tracks(url)
                 if not queries: return await message.channel.send("❌ Enlace de Spotify vacío o inválido.", delete_after=5)
 
 
@@ -1997,7 +2924,8 @@ async def play_from_message(message, url):
                          await message.delete()
                      except:
                          pass
-                     url = f"ytsearch:{queries[0]}"
+                     url = f"ytsearch:{queries[0]['query']}"
+                     spotify_id = queries[0]["spotify_id"]
                 else:
                      # Playlist
                      # Borrar mensaje original del enlace primero
@@ -2012,7 +2940,8 @@ async def play_from_message(message, url):
                      
                      for q in queries:
                          # Añadir objetos light a la cola
-                         queue["tracks"].append({"title": q, "webpage_url": f":{q}", "duration": 0, "thumbnail": None}) 
+                         queue["tracks"].append(spotify_placeholder(q))
+                     schedule_placeholder_resolution(guild.id)
                     
                      # Si no suena nada, arrancar
                      if not voice.is_playing() and not voice.is_paused():
@@ -2020,16 +2949,14 @@ async def play_from_message(message, url):
                          try:
                              first = queue["tracks"][queue["index"]]
                              # Para el primero sí buscamos info completa
-                             real_title, real_dur, thumb = await play_track_in_guild(guild, first)
+                             real_title, real_dur, thumb = await play_track_in_guild(guild, first, priority=PRIORITY_INTERACTIVE)
                              await cleanup_previous_message(guild.id)
                              prog = create_progress_bar(0, real_dur)
                              embed = discord.Embed(title="🎵 Reproduciendo Spotify", description=f"**{real_title}**\n\n{prog}", color=discord.Color.green())
                              if thumb: embed.set_thumbnail(url=thumb)
-                             m = await message.channel.send(embed=embed, view=PlayerView(guild.id))
+                             m = await message.channel.send(embed=embed, view=player_view)
                              
-                             if real_dur > 0:
-                                 t = bot.loop.create_task(update_message_task(m, time.time(), real_dur, real_title, voice))
-                                 audio_sources[guild.id] = {"message": m, "start_time": time.time(), "task": t, "title": real_title, "url": first["webpage_url"]}
+                             track_now_playing(guild.id, m)
                          except Exception as e:
                              print(f"Error auto-play spotify: {e}")
                      return
@@ -2041,7 +2968,8 @@ async def play_from_message(message, url):
         # 2. YOUTUBE / OTROS
         # Buscar info
         try:
-            stream_url, title, duration, thumbnail, webpage_url = buscar_audio(url)
+            info = await resolve_audio(url, priority=PRIORITY_INTERACTIVE, guild_id=guild.id, spotify_id=spotify_id)
+            title, duration, thumbnail, webpage_url = info["title"], info["duration"], info["thumbnail"], info["webpage_url"]
         except Exception as e:
             # Error al buscar el audio (enlace inválido, video no disponible, etc.)
             print(f"Error en buscar_audio: {e}")
@@ -2071,7 +2999,7 @@ async def play_from_message(message, url):
         else:
             # Reproducir
             queue["index"] = len(queue["tracks"]) - 1
-            real_title, real_dur, thumb = await play_track_in_guild(guild, queue["tracks"][queue["index"]])
+            real_title, real_dur, thumb = await play_track_in_guild(guild, queue["tracks"][queue["index"]], priority=PRIORITY_INTERACTIVE)
             
             # Borrar mensaje original (el link)
             try: await message.delete() 
@@ -2082,12 +3010,9 @@ async def play_from_message(message, url):
             track_url = queue["tracks"][queue["index"]].get("webpage_url", "https://discord.com")
             embed = create_minimal_embed(real_title, track_url, real_dur, 0, thumb, message.author.name)
             
-            m = await message.channel.send(embed=embed, view=PlayerView(guild.id))
+            m = await message.channel.send(embed=embed, view=player_view)
             
-            if real_dur > 0:
-                 t = bot.loop.create_task(update_message_task(m, time.time(), real_dur, real_title, voice))
-                 # IMPORTANTE: Guardamos track_url (original) para que la metadata salga bien
-                 audio_sources[guild.id] = {"message": m, "start_time": time.time(), "task": t, "title": real_title, "url": track_url}
+            track_now_playing(guild.id, m)
 
     except Exception as e:
         print(f"Error playing from message: {e}")
@@ -0,0 +1,850 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+
+import discord
+
+# Modos de reproducción (AUDIO_MODE en .env)
+MODE_OPUS = "opus" # Opus passthrough cuando el formato lo permite
+MODE_PCM = "pcm" # Siempre decodificar a PCM (comportamiento antiguo)
+
+# Tipos de fuente, para comparar el coste de cada camino en /stats
+KIND_COPY = "opus-copy" # ffmpeg solo re-empaqueta los paquetes Opus
+KIND_ENCODE = "opus-gain" # ffmpeg aplica la ganancia y codifica a Opus
+KIND_PCM = "pcm" # ffmpeg decodifica (y aplica la ganancia), libopus codifica en Python
+KIND_LOCAL = "local" # Fichero Ogg Opus de la caché en disco, leído sin ffmpeg
+KIND_LOCAL_GAIN = "local-gain" # Fichero de la caché con ganancia distinta: ffmpeg local
+
+# Una ganancia por debajo de esto no se nota: se trata como unidad
+UNITY_GAIN_DB = 0.5
+
+OPUS_CONTAINERS = ("webm", "ogg", "opus")
+
+OPUS_RATE = 48000 # Los granule positions de Ogg Opus siempre van a 48 kHz
+OPUS_FRAME_SAMPLES = 960 # 20 ms por paquete
+
+# Frames de silencio (20 ms) para no cortar el envío mientras se recupera un stream
+SILENCE_OPUS = b"\xf8\xff\xfe"
+SILENCE_PCM = b"\0" * 3840
+
+# Un stream que acaba más de esto antes de su duración se ha cortado (URL caducada, 403...)
+EARLY_END_MARGIN = 5.0
+
+try:
+    _CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLK_TCK = None
+
+
+def volume_to_db(volume: float) -> float:
+    return 20 * math.log10(volume) if volume > 0 else -100.0
+
+
+def db_to_volume(gain_db: float) -> float:
+    return 10 ** (gain_db / 20)
+
+
+def can_passthrough(info: dict) -> bool:
+    """True si el stream ya es Opus en un contenedor que ffmpeg puede copiar a Ogg."""
+    acodec = (info.get("acodec") or "").lower()
+    ext = (info.get("ext") or "").lower()
+    return acodec.startswith("opus") and ext in OPUS_CONTAINERS
+
+
+def select_format(formats, target_kbps):
+    """
+    Elige entre los formatos de solo audio el más pequeño que llega a target_kbps,
+    prefiriendo Opus (webm). Si ninguno llega, el de más calidad. None si no hay datos.
+    """
+    candidates = [f for f in formats if f.get("abr") and f.get("url")]
+    if not candidates:
+        return None
+    opus = [f for f in candidates if (f.get("acodec") or "").startswith("opus")]
+    for group in (opus, candidates):
+        enough = [f for f in group if f["abr"] >= target_kbps]
+        if enough:
+            return min(enough, key=lambda f: f["abr"])
+    return max(opus or candidates, key=lambda f: f["abr"])
+
+
+def process_cpu_seconds(pid):
+    """CPU (user + sys) consumida por un proceso, leída de /proc (solo Linux)."""
+    if not pid or not _CLK_TCK:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # El nombre del proceso va entre paréntesis y puede tener espacios
+    fields = data.rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / _CLK_TCK
+
+
+class AudioStats:
+    """Acumula el coste de CPU por tipo de fuente (streams ya terminados) y el tiempo hasta el primer audio."""
+
+    def __init__(self):
+        self.kinds = {}
+        self.ttfa = {} # perfil de arranque -> deque con los últimos tiempos (s)
+
+    def record_ttfa(self, profile, seconds):
+        self.ttfa.setdefault(profile, deque(maxlen=500)).append(seconds)
+
+    def ttfa_summary(self):
+        """{perfil: (n, p50, p95)} del tiempo hasta el primer paquete de audio."""
+        result = {}
+        for profile, values in self.ttfa.items():
+            ordered = sorted(values)
+            if ordered:
+                result[profile] = (len(ordered), ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))])
+        return result
+
+    def record(self, kind, audio_seconds, python_cpu, ffmpeg_cpu):
+        data = self.kinds.setdefault(kind, {"streams": 0, "audio_seconds": 0.0, "python_cpu": 0.0, "ffmpeg_cpu": 0.0})
+        data["streams"] += 1
+        data["audio_seconds"] += audio_seconds
+        data["python_cpu"] += python_cpu
+        data["ffmpeg_cpu"] += ffmpeg_cpu or 0.0
+
+    def summary(self, live_sources=()):
+        """
+        CPU por minuto de audio para cada tipo de fuente.
+        Incluye las fuentes que siguen sonando (live_sources).
+        """
+        totals = {k: dict(v) for k, v in self.kinds.items()}
+        for src in live_sources:
+            data = totals.setdefault(src.kind, {"streams": 0, "audio_seconds": 0.0, "python_cpu": 0.0, "ffmpeg_cpu": 0.0})
+            data["streams"] += 1
+            data["audio_seconds"] += src.audio_seconds
+            data["python_cpu"] += src.python_cpu
+            data["ffmpeg_cpu"] += src.ffmpeg_cpu() or 0.0
+        for data in totals.values():
+            minutes = data["audio_seconds"] / 60
+            cpu = data["python_cpu"] + data["ffmpeg_cpu"]
+            data["cpu_per_minute"] = round(cpu / minutes, 3) if minutes else 0.0
+        return totals
+
+
+audio_stats = AudioStats()
+
+
+class LiveStats:
+    """Métricas de los directos: latencia respecto a lo que ya llegó del origen, atascos y reconexiones."""
+
+    def __init__(self):
+        self.latency = deque(maxlen=3600) # Frames en el buffer, una muestra por segundo de audio
+        self.opened = 0 # Directos abiertos desde el arranque
+        self.streams = 0 # Abiertos ahora mismo
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.dropped_frames = 0
+        self.reconnects = 0
+        self._lock = threading.Lock() # Se actualiza desde los hilos lectores y los del reproductor
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def sample(self, frames):
+        with self._lock:
+            self.latency.append(frames)
+
+    def summary(self):
+        with self._lock:
+            ordered = sorted(self.latency)
+            counters = {
+                "opened": self.opened,
+                "streams": self.streams,
+                "stalls": self.stalls,
+                "stall_seconds": round(self.stall_seconds, 1),
+                "dropped_frames": self.dropped_frames,
+                "reconnects": self.reconnects,
+            }
+        p50 = ordered[len(ordered) // 2] * 20 if ordered else 0
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 20 if ordered else 0
+        return {**counters, "latency_p50_ms": p50, "latency_p95_ms": p95}
+
+
+live_stats = LiveStats()
+
+
+class MeteredSource(discord.AudioSource):
+    """
+    Envuelve una fuente de audio y mide lo que cuesta reproducirla:
+    - python_cpu: CPU del hilo del AudioPlayer entre lecturas (lectura,
+      y codificación Opus si la fuente es PCM).
+    - ffmpeg_cpu: CPU del proceso ffmpeg, leída de /proc.
+    - Tiempo hasta el primer paquete de audio (TTFA) por perfil de arranque.
+    Si el arranque rápido no da ni un frame, `fallback()` crea la fuente de nuevo
+    con probing completo.
+    """
+
+    def __init__(self, source, kind, process=None, on_cleanup=None, profile=None, fallback=None, on_spawn=None,
+                 expected_seconds=None):
+        self.source = source
+        self.kind = kind
+        self._process = process
+        self.on_cleanup = on_cleanup # Se llama una vez al terminar (ej: soltar un fichero de la caché)
+        self.profile = profile # "fast" / "full" (None = no se mide el TTFA)
+        self.fallback = fallback # () -> fuente de discord.py con probing completo
+        self.on_spawn = on_spawn # Se llama con esta fuente cada vez que arranca un ffmpeg
+        self.expected_seconds = expected_seconds # Audio que debería dar (None = desconocido / no aplica)
+        self.eof = False
+        self.fallbacks = 0
+        self.frames = 0
+        self.python_cpu = 0.0
+        self._last_cpu = None
+        self._ffmpeg_cpu = 0.0
+        self.created = time.perf_counter()
+        self.first_frame_at = None
+        self._recorded = False
+
+    @property
+    def audio_seconds(self):
+        return self.frames * 0.02 # Cada frame son 20 ms
+
+    def read(self):
+        now = time.thread_time()
+        if self._last_cpu is not None:
+            # Entre dos read() el hilo solo codifica y envía: todo es coste de esta fuente
+            self.python_cpu += now - self._last_cpu
+        data = self.source.read()
+        if not data and not self.frames and self.fallback is not None:
+            data = self._restart_full_probe()
+        self._last_cpu = time.thread_time()
+        self.python_cpu += self._last_cpu - now
+        if data:
+            self.frames += 1
+            if self.first_frame_at is None:
+                self.first_frame_at = time.perf_counter()
+                if self.profile:
+                    audio_stats.record_ttfa(self.profile, self.first_frame_at - self.created)
+        else:
+            self.eof = True
+        return data
+
+    def ended_early(self):
+        """True si la fuente ya terminó pero le faltaba audio (el stream se cortó)."""
+        return (self.eof and self.expected_seconds is not None
+                and self.audio_seconds < self.expected_seconds - EARLY_END_MARGIN)
+
+    def _restart_full_probe(self):
+        fallback, self.fallback = self.fallback, None
+        print("[AUDIO] El arranque rápido no dio audio, reintentando con probing completo")
+        try:
+            new_source = fallback()
+        except Exception as e:
+            print(f"[AUDIO] Error en el reintento: {e}")
+            return b""
+        old, self.source = self.source, new_source
+        self._process = _ffmpeg_process(new_source)
+        self.fallbacks += 1
+        old.cleanup()
+        if self.profile:
+            self.profile = "fallback"
+        if self.on_spawn is not None:
+            self.on_spawn(self)
+        return self.source.read()
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    @property
+    def pid(self):
+        return getattr(self._process, "pid", None)
+
+    def ffmpeg_cpu(self):
+        pid = getattr(self._process, "pid", None)
+        cpu = process_cpu_seconds(pid)
+        if cpu is not None:
+            self._ffmpeg_cpu = cpu
+        return self._ffmpeg_cpu
+
+    @property
+    def seekable(self):
+        """True si se puede mover dentro del propio proceso (fichero local, sin ffmpeg)."""
+        inner = self.source.source if isinstance(self.source, Prebuffer) else self.source
+        return isinstance(inner, OggOpusFileSource)
+
+    def seek(self, seconds):
+        """Seek dentro del proceso (ver seekable). La cuenta de frames vuelve a empezar desde `seconds`."""
+        self.source.seek(seconds)
+        self.frames = 0
+
+    def prebuffer(self, frames):
+        """Empieza a leer por adelantado los primeros `frames` frames (en otro hilo)."""
+        if not isinstance(self.source, LiveSource): # El directo ya tiene su propio buffer
+            self.source = Prebuffer(self.source, frames)
+        self.profile = None # Nadie espera este arranque: no cuenta para el TTFA
+
+    def cleanup(self):
+        if not self._recorded:
+            self._recorded = True
+            self.ffmpeg_cpu() # Última lectura antes de que el proceso muera
+            audio_stats.record(self.kind, self.audio_seconds, self.python_cpu, self._ffmpeg_cpu)
+        self.source.cleanup()
+        if self.on_cleanup is not None:
+            callback, self.on_cleanup = self.on_cleanup, None
+            callback()
+
+
+class Prebuffer(discord.AudioSource):
+    """
+    Lee en un hilo aparte los primeros frames de una fuente, para que el
+    arranque de ffmpeg, el probing y la conexión HTTP no caigan en el silencio
+    entre canciones.
+    """
+
+    def __init__(self, source, frames=50):
+        self.source = source
+        self._frames = deque()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._fill, args=(frames,), name="prebuffer", daemon=True)
+        self._thread.start()
+
+    def _fill(self, frames):
+        for _ in range(frames):
+            with self._lock:
+                if self._stopped:
+                    return
+                data = self.source.read()
+                if not data:
+                    return
+                self._frames.append(data)
+
+    @property
+    def buffered(self):
+        return len(self._frames)
+
+    def read(self):
+        with self._lock: # Si el hilo sigue leyendo, se espera a que termine ese frame
+            if self._frames:
+                return self._frames.popleft()
+            return self.source.read()
+
+    def seek(self, seconds):
+        with self._lock: # Lo leído por adelantado es de antes del seek
+            self._frames.clear()
+            self.source.seek(seconds)
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self._stopped = True # Sin lock: cleanup mata ffmpeg y eso desbloquea al hilo
+        self.source.cleanup()
+        self._frames.clear()
+
+
+class LiveSource(discord.AudioSource):
+    """
+    Directo (radio 24/7, directos de YouTube o Twitch) con buffer de lectura acotado.
+
+    - Un hilo lee de ffmpeg sin parar. Si el buffer pasa de `max_frames` se tiran
+      los frames más viejos: la distancia al directo no crece tras un atasco (sin
+      deriva) y la memoria no pasa del tope aunque el directo dure días.
+    - Si el buffer se vacía se envía silencio en vez de terminar, así el
+      reproductor no suelta la conexión de voz.
+    - Si el atasco dura más de `stall_timeout` segundos, o ffmpeg termina, read()
+      devuelve b"" y la pista se reabre (ver TrackChain.on_stall).
+    """
+
+    def __init__(self, source, max_frames=250, stall_timeout=10.0):
+        self.source = source
+        self.max_frames = max_frames
+        self.stall_timeout = stall_timeout
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._stopped = False
+        self._started = False
+        self._stall_since = None
+        self._reads = 0
+        live_stats.add(opened=1, streams=1)
+        self._thread = threading.Thread(target=self._fill, name="live-buffer", daemon=True)
+        self._thread.start()
+
+    @property
+    def _process(self):
+        return _ffmpeg_process(self.source)
+
+    @property
+    def buffered(self):
+        return len(self._frames)
+
+    def _fill(self):
+        while not self._stopped:
+            data = self.source.read()
+            with self._cond:
+                if not data:
+                    self._eof = True
+                    self._cond.notify_all()
+                    return
+                if len(self._frames) >= self.max_frames:
+                    self._frames.popleft() # Ponerse al día con el directo
+                    live_stats.add(dropped_frames=1)
+                self._frames.append(data)
+                self._cond.notify_all()
+
+    def read(self):
+        with self._cond:
+            if not self._started:
+                # Arranque: esperar al primer frame, como si se leyera de ffmpeg directamente
+                self._cond.wait_for(lambda: self._frames or self._eof, timeout=self.stall_timeout)
+                self._started = True
+            if self._frames:
+                if self._stall_since is not None:
+                    live_stats.add(stall_seconds=time.monotonic() - self._stall_since)
+                    self._stall_since = None
+                self._reads += 1
+                if self._reads % 50 == 0:
+                    live_stats.sample(len(self._frames))
+                return self._frames.popleft()
+            if self._eof:
+                return b""
+        now = time.monotonic()
+        if self._stall_since is None:
+            self._stall_since = now
+            live_stats.add(stalls=1)
+        if now - self._stall_since > self.stall_timeout:
+            return b"" # Origen muerto: que se reabra
+        return SILENCE_OPUS if self.is_opus() else SILENCE_PCM
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        with self._cond:
+            closing = not self._stopped
+            self._stopped = True # Matar ffmpeg desbloquea al hilo lector
+        self.source.cleanup()
+        with self._cond:
+            self._frames.clear()
+        if closing:
+            live_stats.add(streams=-1)
+
+
+def _crossfade(tail, head):
+    """Mezcla frames PCM (s16le): `tail` baja de volumen mientras `head` sube."""
+    mixed = []
+    steps = len(tail) + 1
+    for i, a in enumerate(tail):
+        b = head[i] if i < len(head) and head[i] else bytes(len(a))
+        fade_in = (i + 1) / steps
+        fade_out = 1 - fade_in
+        xa, xb = array("h", a), array("h", b[:len(a)].ljust(len(a), b"\0"))
+        mixed.append(array("h", [int(x * fade_out + y * fade_in) for x, y in zip(xa, xb)]).tobytes())
+    return mixed
+
+
+class TrackChain(discord.AudioSource):
+    """
+    Fuente que el voice client reproduce de forma continua y que encadena pistas.
+
+    - `prepare_next(src)` deja lista la siguiente (ffmpeg ya arrancado y con frames leídos).
+    - Cuando la actual se termina, la siguiente empieza en el mismo read(): sin hueco.
+    - Con crossfade_frames > 0 (y ambas PCM) las dos se mezclan durante ese número de frames.
+    - `on_switch(old, new, meta)` se llama desde el hilo de audio: no debe bloquear.
+    - Si la actual se corta antes de tiempo se llama a `on_stall(src)` (también desde
+      el hilo de audio) y se envía silencio hasta que llegue la fuente de recambio
+      con `replace()`, o hasta `max_stall_frames`; después se sigue como un final normal.
+    """
+
+    def __init__(self, current, on_switch=None, crossfade_frames=0, on_stall=None, max_stall_frames=750):
+        self.current = current
+        self.on_switch = on_switch
+        self.crossfade_frames = crossfade_frames
+        self.on_stall = on_stall
+        self.max_stall_frames = max_stall_frames
+        self._stalled = None # Fuente cortada que se está recuperando
+        self._stall_frames = 0
+        self.stalls = 0
+        self._next = None
+        self._meta = None
+        self._skip = False
+        self._tail = deque() # Frames leídos por adelantado de la actual (para el crossfade)
+        self._mixed = deque() # Frames ya mezclados pendientes de enviar
+        self._lock = threading.Lock()
+        self.switches = 0
+
+    @property
+    def pending(self):
+        return self._next is not None
+
+    def prepare_next(self, source, meta=None):
+        """Deja preparada la siguiente fuente. Devuelve la que hubiera antes (para liberarla)."""
+        with self._lock:
+            old, self._next, self._meta = self._next, source, meta
+        return old
+
+    def discard_next(self):
+        """Quita la siguiente preparada (la cola cambió). Devuelve la fuente para liberarla."""
+        with self._lock:
+            old, self._next, self._meta = self._next, None, None
+            self._skip = False
+        return old
+
+    def replace(self, source):
+        """Cambia la pista actual en caliente (seek). Devuelve la anterior para liberarla."""
+        with self._lock:
+            old, self.current = self.current, source
+            self._tail.clear()
+            self._mixed.clear()
+        return old
+
+    def give_up(self, source):
+        """La recuperación de `source` falló: dejar de esperar y terminarla ya."""
+        with self._lock:
+            if self._stalled is source:
+                self._stall_frames = self.max_stall_frames
+
+    def skip(self):
+        """Salta ya a la siguiente preparada. False si no hay ninguna."""
+        with self._lock:
+            if self._next is None:
+                return False
+            self._skip = True
+            return True
+
+    def _switch(self):
+        old, self.current = self.current, self._next
+        meta = self._meta
+        self._next = self._meta = None
+        self.switches += 1
+        if self.on_switch is not None:
+            self.on_switch(old, self.current, meta)
+
+    def _stall(self):
+        """Frame de silencio si la actual se cortó antes de tiempo y se está recuperando, si no None."""
+        ended_early = getattr(self.current, "ended_early", None)
+        if self.on_stall is None or ended_early is None or not ended_early():
+            return None
+        if self._stalled is not self.current:
+            self._stalled, self._stall_frames = self.current, 0
+            self.stalls += 1
+            self.on_stall(self.current)
+        if self._stall_frames >= self.max_stall_frames:
+            return None
+        self._stall_frames += 1
+        return SILENCE_OPUS if self.current.is_opus() else SILENCE_PCM
+
+    def _crossfading(self):
+        return (self.crossfade_frames > 0 and self._next is not None
+                and not self.current.is_opus() and not self._next.is_opus())
+
+    def _silence(self):
+        return SILENCE_OPUS if self.current.is_opus() else SILENCE_PCM
+
+    def read(self):
+        # Las lecturas del pipe pueden bloquear (ffmpeg reconectando): se hacen sin el lock
+        # para que prepare_next/replace/skip desde el event loop no se queden esperando
+        with self._lock:
+            if self._mixed:
+                return self._mixed.popleft()
+            if self._skip:
+                self._skip = False
+                self._tail.clear()
+                self._switch()
+            current = self.current
+            crossfading = self._crossfading()
+            if not crossfading and self._tail: # Se canceló la siguiente a mitad de ventana
+                return self._tail.popleft()
+            # Con crossfade se va siempre crossfade_frames por delante para tener la cola cuando se acabe
+            want = self.crossfade_frames + 1 - len(self._tail) if crossfading else 1
+
+        frames = []
+        while len(frames) < want:
+            data = current.read()
+            if not data:
+                break
+            frames.append(data)
+
+        with self._lock:
+            if self.current is not current: # replace() mientras se leía: lo leído es de la fuente vieja
+                return self._silence()
+            if crossfading:
+                self._tail.extend(frames)
+                if len(self._tail) > self.crossfade_frames:
+                    return self._tail.popleft()
+            if crossfading and self._crossfading():
+                tail = list(self._tail)
+                self._tail.clear()
+                self._switch()
+                new = self.current
+            else:
+                if crossfading: # La siguiente se canceló mientras se leía
+                    data = self._tail.popleft() if self._tail else None
+                else:
+                    data = frames[0] if frames else None
+                data = data or self._stall() or b""
+                if data or self._next is None:
+                    return data
+                tail = []
+                self._switch()
+                new = self.current
+
+        head = [new.read() for _ in tail]
+        if tail:
+            with self._lock:
+                if self.current is new:
+                    self._mixed.extend(_crossfade(tail, head))
+                    if self._mixed:
+                        return self._mixed.popleft()
+        return new.read()
+
+    def is_opus(self):
+        return not self._mixed and self.current.is_opus()
+
+    def cleanup(self):
+        pending = self.discard_next()
+        if pending is not None:
+            pending.cleanup()
+        self.current.cleanup()
+
+
+class OggOpusFileSource(discord.AudioSource):
+    """
+    Lee los paquetes Opus de un fichero .ogg local mapeado en memoria, sin ffmpeg.
+    `seek(segundos)` salta a la página que contiene ese instante (granule position).
+    """
+
+    def __init__(self, path, start_offset=0):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._packets = iter(())
+        self.seek(start_offset)
+
+    def _pages(self, offset):
+        """(offset, header_type, granule, lacing, body) de cada página desde offset."""
+        mm = self._mm
+        size = len(mm)
+        while offset + 27 <= size:
+            if mm[offset:offset + 4] != b"OggS":
+                offset = mm.find(b"OggS", offset + 1) # Resincronizar
+                if offset == -1:
+                    return
+                continue
+            header_type = mm[offset + 5]
+            granule = struct.unpack_from("<q", mm, offset + 6)[0]
+            segments = mm[offset + 26]
+            lacing = mm[offset + 27:offset + 27 + segments]
+            body = offset + 27 + segments
+            yield offset, header_type, granule, lacing, body
+            offset = body + sum(lacing)
+
+    def _iter_packets(self, offset, skip):
+        partial = b""
+        first = True
+        for _, header_type, _, lacing, body in self._pages(offset):
+            # Si empezamos a mitad de un paquete (página de continuación), se descarta
+            drop = first and header_type & 0x01
+            first = False
+            start = pos = body
+            for lace in lacing:
+                pos += lace
+                if lace < 255:
+                    packet = partial + self._mm[start:pos]
+                    partial = b""
+                    start = pos
+                    if drop:
+                        drop = False
+                    elif skip:
+                        skip -= 1
+                    else:
+                        yield packet
+            if start < pos:
+                partial += self._mm[start:pos]
+
+    def seek(self, seconds):
+        target = int(max(0, seconds) * OPUS_RATE)
+        if target == 0:
+            self._packets = self._iter_packets(0, 2) # Saltar OpusHead y OpusTags
+            return
+        previous = 0
+        for offset, _, granule, _, _ in self._pages(0):
+            if granule <= 0: # Cabeceras o páginas sin paquete completo
+                continue
+            if granule >= target:
+                skip = (target - previous) // OPUS_FRAME_SAMPLES
+                self._packets = self._iter_packets(offset, skip)
+                return
+            previous = granule
+        self._packets = iter(()) # Más allá del final
+
+    def read(self):
+        return next(self._packets, b"")
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self._packets = iter(())
+        try:
+            self._mm.close()
+        except (BufferError, ValueError):
+            pass
+        self._file.close()
+
+
+# Reconexión por extractor
+RECONNECT_BY_EXTRACTOR = {
+    # googlevideo corta conexiones largas: reconectar también al llegar a EOF
+    "Youtube": "-reconnect 1 -reconnect_streamed 1 -reconnect_on_network_error 1 -reconnect_delay_max 5 -reconnect_at_eof 1",
+    # SoundCloud sirve HLS/progresivo desde CDN: reintentos cortos
+    "Soundcloud": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 2",
+}
+# Ficheros genéricos: sin reconnect_at_eof (en un fichero finito el EOF es el final de verdad)
+RECONNECT_GENERIC = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+# Demuxer de ffmpeg según la extensión que reporta yt-dlp
+DEMUXER_BY_EXT = {"webm": "matroska", "mkv": "matroska", "m4a": "mp4", "mp4": "mp4",
+                  "ogg": "ogg", "opus": "ogg", "mp3": "mp3"}
+# Decodificador según el acodec de yt-dlp (prefijo)
+DECODER_BY_CODEC = (("opus", "opus"), ("mp4a", "aac"), ("aac", "aac"), ("mp3", "mp3"), ("vorbis", "vorbis"))
+
+# Probing mínimo: el contenedor y el codec ya los conocemos
+FAST_PROBE = "-probesize 32768 -analyzeduration 0"
+
+
+def input_options(info, start_offset=0, fast=True):
+    """
+    before_options de ffmpeg para un stream resuelto por yt-dlp.
+    fast=True usa el formato que ya reportó yt-dlp (demuxer y decodificador)
+    y reduce probesize/analyzeduration; fast=False deja que ffmpeg lo detecte.
+    """
+    extractor = info.get("extractor") or ""
+    opts = [RECONNECT_BY_EXTRACTOR.get(extractor, RECONNECT_GENERIC)]
+    if fast and "m3u8" not in (info.get("protocol") or ""): # HLS: lo gestiona su propio demuxer
+        demuxer = DEMUXER_BY_EXT.get((info.get("ext") or "").lower())
+        acodec = (info.get("acodec") or "").lower()
+        decoder = next((dec for prefix, dec in DECODER_BY_CODEC if acodec.startswith(prefix)), None)
+        if demuxer:
+            opts.append(FAST_PROBE)
+            opts.append(f"-f {demuxer}")
+            if decoder:
+                opts.append(f"-c:a {decoder}")
+    opts.append(f"-ss {start_offset}")
+    return " ".join(opts)
+
+
+# Directos: sin reconnect_at_eof (en HLS cada recarga de la playlist sería una "reconexión")
+RECONNECT_LIVE = "-reconnect 1 -reconnect_streamed 1 -reconnect_on_network_error 1 -reconnect_delay_max 5"
+# HLS: empezar a 3 segmentos del final (cerca del directo sin atascarse) y aguantar recargas lentas
+HLS_LIVE_OPTIONS = "-live_start_index -3 -max_reload 20"
+
+
+def live_input_options(info):
+    """before_options de ffmpeg para un directo: sin -ss, con poco buffer de entrada."""
+    opts = [RECONNECT_LIVE, "-fflags +nobuffer"]
+    if "m3u8" in (info.get("protocol") or ""):
+        opts.append(HLS_LIVE_OPTIONS)
+    return " ".join(opts)
+
+
+def _ffmpeg_process(source):
+    """Proceso ffmpeg de una fuente de discord.py."""
+    return getattr(source, "_process", None)
+
+
+def is_unity(volume: float) -> bool:
+    return abs(volume_to_db(volume)) < UNITY_GAIN_DB
+
+
+def _with_gain(options, volume):
+    """Añade el filtro de volumen de ffmpeg si la ganancia no es la unidad."""
+    if is_unity(volume):
+        return options
+    return f"{options} -af volume={volume:.4f}"
+
+
+def _open_stream(stream_url, info, *, executable, before_options, options, volume, mode, bitrate, encode_in_ffmpeg):
+    """Fuente de discord.py para un stream remoto. Devuelve (fuente, tipo)."""
+    if mode == MODE_OPUS and can_passthrough(info):
+        if is_unity(volume):
+            # codec="opus" hace que discord.py use "-c:a copy"
+            source = discord.FFmpegOpusAudio(
+                stream_url, codec="opus", executable=executable,
+                before_options=before_options, options=options,
+            )
+            return source, KIND_COPY
+        source = discord.FFmpegOpusAudio(
+            stream_url, bitrate=bitrate, executable=executable,
+            before_options=before_options, options=_with_gain(options, volume),
+        )
+        return source, KIND_ENCODE
+    if mode == MODE_OPUS and encode_in_ffmpeg:
+        # La codificación Opus la hace ffmpeg (otro proceso), no el hilo del AudioPlayer
+        source = discord.FFmpegOpusAudio(
+            stream_url, bitrate=bitrate, executable=executable,
+            before_options=before_options, options=_with_gain(options, volume),
+        )
+        return source, KIND_ENCODE
+    source = discord.FFmpegPCMAudio(
+        stream_url, executable=executable,
+        before_options=before_options, options=_with_gain(options, volume),
+    )
+    return source, KIND_PCM
+
+
+def build_source(stream_url, info, *, executable="ffmpeg", options="-vn", volume=1.0, mode=MODE_OPUS,
+                 bitrate=128, start_offset=0, on_cleanup=None, encode_in_ffmpeg=False, fast_start=True,
+                 on_spawn=None, live_buffer_frames=250, live_stall_timeout=10.0):
+    """
+    Crea la fuente de audio más barata posible para el stream:
+    - Fichero de la caché en disco con la ganancia ya aplicada -> lectura directa (sin ffmpeg).
+    - Opus en webm/ogg y sin ganancia -> FFmpegOpusAudio con codec copy.
+    - Opus con ganancia -> FFmpegOpusAudio, ffmpeg aplica `volume` y codifica.
+    - Otros codecs con encode_in_ffmpeg -> FFmpegOpusAudio, ffmpeg decodifica y codifica.
+    - Otros codecs (o mode="pcm") -> FFmpegPCMAudio, ffmpeg aplica `volume`.
+    La ganancia siempre va como filtro de ffmpeg (nada de escalar frames en Python).
+    Con fast_start ffmpeg arranca con el formato de yt-dlp y probing mínimo;
+    si así no sale audio, se reintenta solo con probing completo.
+    on_spawn(fuente) se llama cada vez que se arranca un ffmpeg.
+    Los directos van siempre por LiveSource (buffer acotado, silencio en los atascos).
+    Devuelve un MeteredSource (para streams con `expected_seconds`, ver ended_early()).
+    """
+    if info.get("local"):
+        # La ganancia con la que se guardó el fichero ya está aplicada
+        residual = volume / db_to_volume(info.get("baked_gain_db") or 0.0)
+        if is_unity(residual):
+            source = OggOpusFileSource(stream_url, start_offset)
+            return MeteredSource(source, KIND_LOCAL, on_cleanup=on_cleanup, profile="local")
+        source = discord.FFmpegOpusAudio(
+            stream_url, bitrate=bitrate, executable=executable,
+            before_options=f"-ss {start_offset}", options=_with_gain(options, residual),
+        )
+        metered = MeteredSource(source, KIND_LOCAL_GAIN, _ffmpeg_process(source), on_cleanup=on_cleanup,
+                                profile="local", on_spawn=on_spawn)
+    elif info.get("is_live"):
+        source, kind = _open_stream(stream_url, info, before_options=live_input_options(info), executable=executable,
+                                    options=options, volume=volume, mode=mode, bitrate=bitrate,
+                                    encode_in_ffmpeg=encode_in_ffmpeg)
+        source = LiveSource(source, live_buffer_frames, live_stall_timeout)
+        # Un directo no tiene final: cualquier EOF es un corte (ended_early() == eof)
+        metered = MeteredSource(source, kind, _ffmpeg_process(source), on_cleanup=on_cleanup,
+                                profile="live", on_spawn=on_spawn, expected_seconds=math.inf)
+    else:
+        open_args = dict(executable=executable, options=options, volume=volume, mode=mode,
+                         bitrate=bitrate, encode_in_ffmpeg=encode_in_ffmpeg)
+        source, kind = _open_stream(stream_url, info, before_options=input_options(info, start_offset, fast_start), **open_args)
+        fallback = None
+        if fast_start:
+            def fallback():
+                return _open_stream(stream_url, info, before_options=input_options(info, start_offset, fast=False), **open_args)[0]
+        # Con la duración conocida se puede distinguir un corte (URL caducada) del final real
+        duration = info.get("duration") or 0
+        expected = duration - start_offset if duration else None
+        metered = MeteredSource(source, kind, _ffmpeg_process(source), on_cleanup=on_cleanup,
+                                profile="fast" if fast_start else "full", fallback=fallback, on_spawn=on_spawn,
+                                expected_seconds=expected)
+    if on_spawn is not None:
+        on_spawn(metered)
+    return metered
@@ -0,0 +1,69 @@
+import os
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class AudioWorkers:
+    """
+    Pool de workers de audio: un worker por núcleo de CPU.
+
+    Cada stream lo procesa su propio proceso ffmpeg (descarga, decodificación,
+    ganancia y codificación Opus) y el proceso principal solo lee del pipe los
+    paquetes Opus ya hechos y los envía. Así el trabajo pesado no compite por
+    el GIL y la capacidad crece con los núcleos.
+
+    Reparto: cada servidor se asigna al worker con menos servidores y se queda
+    en él mientras dure su sesión; sus procesos ffmpeg se fijan a ese núcleo.
+    """
+
+    def __init__(self, workers=None):
+        cores = _available_cores()
+        self.cores = cores[:workers] if workers else cores
+        self._guilds = {} # guild_id -> núcleo
+        self._load = {core: 0 for core in self.cores} # núcleo -> nº de servidores
+        self.pinned = 0
+        self.pin_errors = 0
+
+    def assign(self, guild_id):
+        """Núcleo del servidor (el menos cargado la primera vez)."""
+        core = self._guilds.get(guild_id)
+        if core is None:
+            core = min(self.cores, key=lambda c: (self._load[c], c))
+            self._guilds[guild_id] = core
+            self._load[core] += 1
+        return core
+
+    def release(self, guild_id):
+        core = self._guilds.pop(guild_id, None)
+        if core is not None:
+            self._load[core] -= 1
+
+    def place(self, guild_id, source):
+        """Fija el ffmpeg de una fuente (audio.MeteredSource) al núcleo de su servidor."""
+        pid = source.pid
+        if pid is None or not hasattr(os, "sched_setaffinity"):
+            return None
+        core = self.assign(guild_id)
+        try:
+            # Todos los hilos que ffmpeg ya haya creado; los nuevos heredan la afinidad
+            tids = [int(t) for t in os.listdir(f"/proc/{pid}/task")] if os.path.isdir(f"/proc/{pid}/task") else [pid]
+            for tid in tids:
+                os.sched_setaffinity(tid, {core})
+            self.pinned += 1
+        except (OSError, ValueError) as e:
+            self.pin_errors += 1
+            print(f"[AUDIO_WORKERS] No se pudo fijar ffmpeg {pid} al núcleo {core}: {e}")
+            return None
+        return core
+
+    def stats(self):
+        return {
+            "workers": len(self.cores),
+            "load": dict(self._load),
+            "pinned": self.pinned,
+            "pin_errors": self.pin_errors,
+        }
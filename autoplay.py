@@ -0,0 +1,168 @@
+import asyncio
+import random
+import re
+import time
+
+from cache import video_id_from_url
+from resolver import PRIORITY_BACKGROUND, PRIORITY_PLAYBACK
+
+# Palabras comunes que no ayudan en la búsqueda
+REMOVE_WORDS = ['official', 'video', 'audio', 'visualizer', 'lyric', 'lyrics',
+                'feat', 'ft', 'prod', 'music', 'mv', 'hd', 'hq', '4k']
+
+_BRACKETS_RE = re.compile(r'[\(\[].*?[\)\]]')
+_WORDS_RE = re.compile(r'\b(?:' + '|'.join(REMOVE_WORDS) + r')\b', re.IGNORECASE)
+_SYMBOLS_RE = re.compile(r'[^\w\s]')
+
+
+def clean_query(title: str, max_words=4) -> str:
+    """Limpia un título para buscar canciones parecidas (primeras 3-4 palabras útiles)."""
+    clean = _BRACKETS_RE.sub('', title or "") # Quitar paréntesis, corchetes y su contenido
+    clean = _WORDS_RE.sub('', clean)
+    clean = _SYMBOLS_RE.sub(' ', clean) # Solo letras, números y espacios
+    return ' '.join(clean.split()[:max_words])
+
+
+class AutoplayEngine:
+    """
+    Bolsa de candidatos para el autoplay, preparada mientras suena la última
+    canción de la cola.
+
+    - Las búsquedas son "flat" (sin extraer streams) y van por el carril de fondo del resolver.
+    - Se excluye por ID de vídeo todo lo que está en el historial o en la cola.
+    - Solo el candidato elegido se resuelve del todo (al reproducirlo).
+    """
+
+    def __init__(self, resolver, search_fn, results=10, min_pool=3, max_pool=30):
+        self.resolver = resolver
+        self.search_fn = search_fn # search_fn(query, n) -> lista de entradas flat (bloqueante)
+        self.results = results
+        self.min_pool = min_pool
+        self.max_pool = max_pool
+        self._state = {} # guild_id -> {"pool": [...], "seeds": set(), "task": Task|None}
+        self.picks = 0
+        self.empty = 0
+
+    def _guild(self, guild_id):
+        return self._state.setdefault(guild_id, {"pool": [], "seeds": set(), "task": None})
+
+    def prepare(self, guild_id, seed_title, exclude_ids):
+        """Lanza en segundo plano la búsqueda de candidatos para seed_title (si hace falta)."""
+        state = self._guild(guild_id)
+        query = clean_query(seed_title)
+        if not query:
+            return
+        self._prune(state, exclude_ids)
+        if query in state["seeds"] and len(state["pool"]) >= self.min_pool:
+            return
+        if state["task"] and not state["task"].done():
+            return
+        state["task"] = asyncio.get_running_loop().create_task(
+            self._fill(guild_id, query, seed_title, PRIORITY_BACKGROUND)
+        )
+
+    async def pick(self, guild_id, seed_title, exclude_ids):
+        """Elige un candidato (dict con title/webpage_url/duration/thumbnail) o None."""
+        state = self._guild(guild_id)
+        query = clean_query(seed_title)
+
+        # Si hay una búsqueda de fondo en curso, esperarla en vez de lanzar otra
+        task = state["task"]
+        if task and not task.done():
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise # Cancelaron a quien llama, no la búsqueda
+                return None # reset() (stop, cambio de cola) canceló la búsqueda: ya no hay autoplay
+            except Exception:
+                pass
+
+        self._prune(state, exclude_ids)
+        if not state["pool"] and query:
+            await self._fill(guild_id, query, seed_title, PRIORITY_PLAYBACK)
+            self._prune(state, exclude_ids)
+
+        pool = state["pool"]
+        if not pool:
+            self.empty += 1
+            return None
+
+        # Preferir candidatos de la semilla actual; si no, cualquiera de la bolsa
+        same_seed = [c for c in pool if c["seed"] == query] or pool
+        chosen = random.choice(same_seed)
+        pool.remove(chosen)
+        self.picks += 1
+        print(f"[AUTOPLAY] Seleccionado: {chosen['title']} ({len(pool)} candidatos restantes)")
+
+        # Rellenar en segundo plano para la próxima vez
+        if len(pool) < self.min_pool:
+            self.prepare(guild_id, chosen["title"], exclude_ids | {chosen["id"]})
+        return {
+            "title": chosen["title"],
+            "webpage_url": chosen["webpage_url"],
+            "duration": chosen["duration"],
+            "thumbnail": chosen["thumbnail"],
+        }
+
+    def reset(self, guild_id):
+        state = self._state.pop(guild_id, None)
+        if state and state["task"] and not state["task"].done():
+            state["task"].cancel()
+
+    def stats(self):
+        return {
+            "guilds": len(self._state),
+            "candidates": sum(len(s["pool"]) for s in self._state.values()),
+            "picks": self.picks,
+            "empty": self.empty,
+        }
+
+    @staticmethod
+    def _prune(state, exclude_ids):
+        state["pool"] = [c for c in state["pool"] if c["id"] not in exclude_ids]
+
+    async def _fill(self, guild_id, query, seed_title, priority):
+        state = self._guild(guild_id)
+        t0 = time.perf_counter()
+        try:
+            entries = await self.resolver.run(
+                self.search_fn, query, self.results,
+                key=("autoplay", query), priority=priority, guild_id=guild_id
+            )
+        except Exception as e:
+            print(f"[AUTOPLAY_SEARCH] Error en búsqueda: {e}")
+            return
+
+        seed_clean = query.lower()
+        known = {c["id"] for c in state["pool"]}
+        added = 0
+        for e in entries or []:
+            vid = e.get("id") or video_id_from_url(e.get("url"))
+            if not vid or vid in known:
+                continue
+            # Descartar la misma canción con otro vídeo (mismo título limpio)
+            if clean_query(e.get("title", "")).lower() == seed_clean:
+                continue
+            url = e.get("url") or ""
+            if not url.startswith("http"):
+                url = f"https://www.youtube.com/watch?v={vid}"
+            thumbs = e.get("thumbnails") or []
+            state["pool"].append({
+                "id": vid,
+                "title": e.get("title", "Audio"),
+                "webpage_url": url,
+                "duration": e.get("duration") or 0,
+                "thumbnail": e.get("thumbnail") or (thumbs[-1]["url"] if thumbs else None),
+                "seed": query,
+            })
+            known.add(vid)
+            added += 1
+
+        if len(state["seeds"]) > 50:
+            state["seeds"].clear()
+        state["seeds"].add(query)
+        # No dejar crecer la bolsa sin límite: se quedan los más recientes
+        if len(state["pool"]) > self.max_pool:
+            state["pool"] = state["pool"][-self.max_pool:]
+        print(f"[AUTOPLAY] '{query}': +{added} candidatos ({len(state['pool'])} en bolsa, {time.perf_counter() - t0:.2f}s)")
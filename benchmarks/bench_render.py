@@ -0,0 +1,122 @@
+"""
+Benchmark: embed de "ahora suena" reconstruido cada segundo vs NowPlayingRenderer
+(partes estáticas precalculadas y solo se devuelve embed cuando cambia algo).
+
+Simula N servidores reproduciendo a la vez y un tick por segundo de audio.
+
+Uso:
+    python benchmarks/bench_render.py                       # 500 servidores, canciones de 4 min
+    python benchmarks/bench_render.py --guilds 2000 --duration 600
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+from render import NowPlayingRenderer, AUTHOR_ICON, DEFAULT_THUMBNAIL
+
+
+def legacy_embed(title, url, duration, elapsed, thumbnail, requester=None, channel_name=None):
+    """create_minimal_embed tal y como estaba: todo el embed desde cero en cada tick."""
+    length = 20
+    if duration > 0:
+        percent = min(1, max(0, elapsed / duration))
+        progress = int(length * percent)
+    else:
+        progress = 0
+    bar = "▬" * progress + "🔘" + "─" * (length - progress)
+
+    def fmt(s):
+        m, s = divmod(int(s), 60)
+        h, m = divmod(m, 60)
+        if h > 0: return f"{h:02d}:{m:02d}:{s:02d}"
+        return f"{m:02d}:{s:02d}"
+
+    time_str = f"`{fmt(elapsed)} / {fmt(duration)}`"
+    embed = discord.Embed(color=0x2b2d31)
+    embed.set_author(name="Tune Flow", icon_url=AUTHOR_ICON)
+    desc = f"**[{title}]({url})**\n"
+    platform = "🔗 Otro"
+    if "spotify" in url: platform = "💚 Spotify"
+    elif "youtu" in url: platform = "🟥 YouTube"
+    elif "soundcloud" in url: platform = "🧡 SoundCloud"
+    meta = [platform]
+    if requester: meta.append(f"👤 {requester}")
+    if channel_name: meta.append(f"🔊 {channel_name}")
+    desc += " | ".join(meta) + "\n"
+    desc += f"\n{time_str}\n{bar}"
+    embed.description = desc
+    embed.set_image(url=thumbnail or DEFAULT_THUMBNAIL)
+    footer_parts = []
+    if requester: footer_parts.append(f"👤 {requester}")
+    if channel_name: footer_parts.append(f"🔊 {channel_name}")
+    footer_parts.append("✨ Autoplay: ON")
+    embed.set_footer(text=" • ".join(footer_parts))
+    return embed
+
+
+def make_guilds(n, duration):
+    guilds = []
+    for i in range(n):
+        guilds.append({
+            "title": f"Canción de prueba número {i} (Official Video)",
+            "url": f"https://www.youtube.com/watch?v=vid{i:07d}",
+            "duration": duration,
+            "thumbnail": f"https://i.ytimg.com/vi/vid{i:07d}/hqdefault.jpg",
+            "channel": f"Voz {i % 7}",
+            "start": random.uniform(0, duration), # Cada servidor va por un punto distinto
+        })
+    return guilds
+
+
+def run_legacy(guilds, seconds):
+    embeds = 0
+    t0 = time.perf_counter()
+    for tick in range(seconds):
+        for g in guilds:
+            elapsed = min(g["duration"], (g["start"] + tick) % g["duration"])
+            legacy_embed(g["title"], g["url"], g["duration"], elapsed, g["thumbnail"], channel_name=g["channel"])
+            embeds += 1
+    return time.perf_counter() - t0, embeds
+
+
+def run_renderer(guilds, seconds):
+    embeds = 0
+    t0 = time.perf_counter()
+    renderers = [NowPlayingRenderer(g["title"], g["url"], g["duration"], g["thumbnail"], channel_name=g["channel"])
+                 for g in guilds]
+    for tick in range(seconds):
+        for g, renderer in zip(guilds, renderers):
+            elapsed = min(g["duration"], (g["start"] + tick) % g["duration"])
+            if renderer.render(elapsed) is not None:
+                embeds += 1
+    return time.perf_counter() - t0, embeds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=500, help="Servidores reproduciendo a la vez")
+    parser.add_argument("--duration", type=int, default=240, help="Duración de cada canción (s)")
+    parser.add_argument("--seconds", type=int, default=None, help="Segundos simulados (por defecto, una canción)")
+    args = parser.parse_args()
+    seconds = args.seconds or args.duration
+
+    random.seed(1)
+    guilds = make_guilds(args.guilds, args.duration)
+    print(f"{args.guilds} servidores, canciones de {args.duration}s, {seconds} ticks de 1s")
+
+    legacy_time, legacy_embeds = run_legacy(guilds, seconds)
+    new_time, new_embeds = run_renderer(guilds, seconds)
+    for label, total, embeds in (("cada-tick", legacy_time, legacy_embeds), ("renderer", new_time, new_embeds)):
+        per_tick = total / seconds * 1000
+        print(f"{label:<10} total={total:7.3f}s  por tick (todos los servidores)={per_tick:7.2f}ms  "
+              f"embeds/ediciones={embeds}")
+    print(f"CPU: x{legacy_time / new_time:.1f} menos | Ediciones: x{legacy_embeds / max(1, new_embeds):.1f} menos")
+
+
+if __name__ == "__main__":
+    main()
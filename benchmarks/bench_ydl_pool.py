@@ -0,0 +1,88 @@
+"""
+Benchmark: YoutubeDL nuevo por llamada vs instancias del YDLPool.
+
+Uso:
+    python benchmarks/bench_ydl_pool.py                 # Solo coste de construcción (sin red)
+    python benchmarks/bench_ydl_pool.py -n 300 --url "ytsearch:lofi hip hop"   # Búsquedas reales
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yt_dlp import YoutubeDL
+from ydl_pool import YDLPool, WARM_EXTRACTORS
+
+# Mismas opciones que YDL_OPTIONS en Main.py
+OPTIONS = {
+    "format": "bestaudio/best",
+    "noplaylist": True,
+    "quiet": True,
+    "no_warnings": True,
+    "extract_flat": False,
+    "default_search": "auto",
+    "source_address": "0.0.0.0",
+    "http_chunk_size": 10485760,
+    "force_generic_extractor": False,
+}
+
+
+def lookup_fresh(url):
+    with YoutubeDL(OPTIONS) as ydl:
+        if url:
+            return ydl.extract_info(url, download=False)
+        # Sin red: lo mismo que paga cada llamada antes de extraer
+        for ie_key in WARM_EXTRACTORS:
+            ydl.get_info_extractor(ie_key)
+
+
+def lookup_pooled(pool, url):
+    with pool.get("track") as ydl:
+        if url:
+            return ydl.extract_info(url, download=False)
+        for ie_key in WARM_EXTRACTORS:
+            ydl.get_info_extractor(ie_key)
+
+
+def run(label, fn, n, threads):
+    times = []
+
+    def timed(_):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(timed, range(n)))
+    total = time.perf_counter() - t0
+    times.sort()
+    p95 = times[int(len(times) * 0.95) - 1] if len(times) > 1 else times[0]
+    print(f"{label:<10} total={total:7.2f}s  media={statistics.mean(times) * 1000:8.2f}ms  "
+          f"p50={statistics.median(times) * 1000:8.2f}ms  p95={p95 * 1000:8.2f}ms")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=300, help="Número de búsquedas")
+    parser.add_argument("--threads", type=int, default=4, help="Hilos concurrentes (como RESOLVER_WORKERS)")
+    parser.add_argument("--url", default=None, help="URL/búsqueda real (si no, solo se mide el arranque)")
+    args = parser.parse_args()
+
+    pool = YDLPool({"track": OPTIONS}, size=args.threads)
+    pool.warm_up(per_profile=args.threads)
+
+    print(f"{args.n} búsquedas, {args.threads} hilos, url={args.url or '(sin red)'}")
+    fresh = run("por-llamada", lambda: lookup_fresh(args.url), args.n, args.threads)
+    pooled = run("pool", lambda: lookup_pooled(pool, args.url), args.n, args.threads)
+    print(f"Mejora: x{fresh / pooled:.1f}  | pool: {pool.stats()}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
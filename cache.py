@@ -0,0 +1,163 @@
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+# Margen de seguridad antes de que caduque la URL de googlevideo
+EXPIRE_MARGIN = 120
+# TTL cuando la URL no trae "expire=" (SoundCloud, otros)
+DEFAULT_STREAM_TTL = 600
+
+
+def video_id_from_url(url: str):
+    """Devuelve el ID de vídeo de YouTube de una URL (o None si no es de YouTube)."""
+    if not url:
+        return None
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    host = (parsed.netloc or "").lower()
+    if host.endswith("youtu.be"):
+        vid = parsed.path.lstrip("/").split("/")[0]
+        return vid or None
+    if "youtube.com" in host:
+        if parsed.path.startswith("/watch"):
+            return parse_qs(parsed.query).get("v", [None])[0]
+        for prefix in ("/shorts/", "/live/", "/embed/"):
+            if parsed.path.startswith(prefix):
+                return parsed.path[len(prefix):].split("/")[0] or None
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """Normaliza una URL para usarla como clave (YouTube -> watch?v=ID)."""
+    if not url:
+        return url
+    if url.startswith("ytsearch"):
+        # "ytsearch:Canción  Artista" == "ytsearch:canción artista"
+        prefix, _, query = url.partition(":")
+        return f"{prefix}:{' '.join(query.lower().split())}"
+    vid = video_id_from_url(url)
+    if vid:
+        return f"https://www.youtube.com/watch?v={vid}"
+    return url.strip()
+
+
+def stream_expiry(stream_url: str):
+    """Lee el parámetro expire= (epoch) de una URL de googlevideo, si existe."""
+    if not stream_url:
+        return None
+    try:
+        query = parse_qs(urlparse(stream_url).query)
+        if "expire" in query:
+            return float(query["expire"][0])
+    except (ValueError, IndexError):
+        pass
+    # Algunas URLs llevan los parámetros en el path: /expire/1700000000/...
+    marker = "/expire/"
+    if marker in stream_url:
+        try:
+            return float(stream_url.split(marker, 1)[1].split("/", 1)[0])
+        except ValueError:
+            pass
+    return None
+
+
+class LRUCache:
+    """
+    Caché LRU acotada con caducidad opcional por entrada.
+    No es thread-safe: se usa solo desde el event loop.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl # TTL por defecto (None = sin caducidad)
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and (item[0] is None or item[0] > time.time())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class StreamCache(LRUCache):
+    """
+    Caché de streams resueltos (info de buscar_audio).
+    La clave es la URL canónica (o la búsqueda ytsearch:) y el TTL sale
+    del parámetro expire= de la URL de stream.
+    """
+
+    def __init__(self, maxsize=512):
+        super().__init__(maxsize=maxsize)
+
+    def get(self, url, default=None):
+        return super().get(canonical_url(url), default)
+
+    def store(self, url, info):
+        """Guarda la info bajo la URL pedida y bajo su webpage_url real."""
+        ttl = self.ttl_for(info.get("url"))
+        if ttl <= 0:
+            return
+        keys = {canonical_url(url)}
+        if info.get("webpage_url"):
+            keys.add(canonical_url(info["webpage_url"]))
+        for key in keys:
+            self.put(key, info, ttl=ttl)
+
+    def invalidate(self, url):
+        info = self.pop(canonical_url(url))
+        if info and info.get("webpage_url"):
+            self.pop(canonical_url(info["webpage_url"]))
+
+    @staticmethod
+    def ttl_for(stream_url):
+        expire = stream_expiry(stream_url)
+        if expire is None:
+            return DEFAULT_STREAM_TTL
+        return expire - time.time() - EXPIRE_MARGIN
@@ -132,6 +132,32 @@ def init_db():
             )
         ''')
 
+        # Mapeo búsqueda de Spotify -> vídeo de YouTube (evita repetir búsquedas)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS spotify_youtube_map (
+                query_key VARCHAR(255) PRIMARY KEY,
+                spotify_id VARCHAR(64),
+                video_id VARCHAR(32) NOT NULL,
+                title VARCHAR(255),
+                duration INT,
+                thumbnail TEXT,
+                confidence FLOAT DEFAULT 0,
+                last_verified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_spotify_id (spotify_id)
+            )
+        ''')
+
+        # Sonoridad medida por vídeo (EBU R128), para normalizar el volumen
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_loudness (
+                video_id VARCHAR(32) PRIMARY KEY,
+                integrated_lufs FLOAT NOT NULL,
+                true_peak FLOAT,
+                gain_db FLOAT NOT NULL,
+                measured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         conn.commit()
         conn.close()
         print("Base de datos inicializada correctamente.")
@@ -448,9 +474,9 @@ def save_favorite(user_id: int, track: dict):
         conn.close()
 
 def get_favorites(user_id: int):
-    """Obtiene los favoritos de un usuario."""
+    """Obtiene los favoritos de un usuario (None si no hay conexión con la DB)."""
     conn = get_connection()
-    if not conn: return []
+    if not conn: return None
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT title, url, duration, thumbnail FROM favorites WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
@@ -479,3 +505,89 @@ def remove_favorite(user_id: int, track: dict):
         return False, str(e)
     finally:
         conn.close()
+
+# === MAPEO SPOTIFY -> YOUTUBE ===
+
+def normalize_query(query: str) -> str:
+    """Clave de búsqueda normalizada (minúsculas, espacios simples, máx 255)."""
+    return " ".join(query.lower().split())[:255]
+
+def get_spotify_match(query: str, spotify_id: str = None):
+    """Devuelve el vídeo de YouTube guardado para una búsqueda/track de Spotify, o None."""
+    conn = get_connection()
+    if not conn: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        row = None
+        if spotify_id:
+            cursor.execute("SELECT * FROM spotify_youtube_map WHERE spotify_id = %s LIMIT 1", (spotify_id,))
+            row = cursor.fetchone()
+        if not row:
+            cursor.execute("SELECT * FROM spotify_youtube_map WHERE query_key = %s", (normalize_query(query),))
+            row = cursor.fetchone()
+        return row
+    except Exception as e:
+        print(f"Error leyendo mapeo Spotify: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_spotify_match(query: str, video_id: str, title: str, duration: int, thumbnail: str, confidence: float, spotify_id: str = None):
+    """Guarda/actualiza el vídeo encontrado para una búsqueda de Spotify."""
+    conn = get_connection()
+    if not conn: return False
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO spotify_youtube_map (query_key, spotify_id, video_id, title, duration, thumbnail, confidence)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                spotify_id = COALESCE(VALUES(spotify_id), spotify_id),
+                video_id = VALUES(video_id), title = VALUES(title), duration = VALUES(duration),
+                thumbnail = VALUES(thumbnail), confidence = VALUES(confidence),
+                last_verified = CURRENT_TIMESTAMP
+        """, (normalize_query(query), spotify_id, video_id, (title or "")[:255], duration or 0, thumbnail, confidence))
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error guardando mapeo Spotify: {e}")
+        return False
+    finally:
+        conn.close()
+
+# === NORMALIZACIÓN DE VOLUMEN ===
+
+def get_loudness(video_id: str):
+    """Devuelve {integrated_lufs, true_peak, gain_db} de un vídeo, o None si no está medido."""
+    conn = get_connection()
+    if not conn: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT integrated_lufs, true_peak, gain_db FROM track_loudness WHERE video_id = %s", (video_id,))
+        return cursor.fetchone()
+    except Exception as e:
+        print(f"Error leyendo sonoridad: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_loudness(video_id: str, integrated_lufs: float, true_peak: float, gain_db: float):
+    """Guarda/actualiza la sonoridad medida de un vídeo."""
+    conn = get_connection()
+    if not conn: return False
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO track_loudness (video_id, integrated_lufs, true_peak, gain_db)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                integrated_lufs = VALUES(integrated_lufs), true_peak = VALUES(true_peak),
+                gain_db = VALUES(gain_db), measured_at = CURRENT_TIMESTAMP
+        """, (video_id, integrated_lufs, true_peak, gain_db))
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error guardando sonoridad: {e}")
+        return False
+    finally:
+        conn.close()
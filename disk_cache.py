@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import LRUCache
+
+INDEX_FILE = "index.json"
+RECONNECT_OPTIONS = ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+
+
+class DiskCache:
+    """
+    Caché en disco de pistas que se repiten (favoritos, playlists, /load),
+    guardadas como Ogg Opus y servidas desde el fichero local.
+
+    - Admisión por número de reproducciones: una pista se descarga (en segundo
+      plano) cuando ha sonado `min_plays` veces.
+    - Límite en bytes con expulsión LRU.
+    - Los ficheros en uso están "fijados" (pin) y nunca se borran mientras suenan.
+    - La ganancia de normalización conocida al descargar se aplica al fichero,
+      así la reproducción normal no necesita ffmpeg.
+    """
+
+    def __init__(self, directory, max_bytes, min_plays=3, max_duration=900, executable="ffmpeg", timeout=600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.max_duration = max_duration # Pistas más largas (mixes, directos) no se guardan
+        self.executable = executable
+        self.timeout = timeout
+        self._entries = OrderedDict() # video_id -> {size, title, duration, thumbnail, webpage_url, baked_gain_db}
+        self._pins = {} # video_id -> nº de fuentes usando el fichero
+        self._plays = LRUCache(maxsize=10000) # video_id -> reproducciones (aún no cacheadas)
+        self._downloading = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk_cache")
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.download_errors = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # --- Índice ---
+
+    def _path(self, vid):
+        return os.path.join(self.directory, f"{vid}.ogg")
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        # Orden LRU: el índice se guarda del menos al más reciente
+        for vid, entry in data.items():
+            path = self._path(vid)
+            if os.path.exists(path):
+                entry["size"] = os.path.getsize(path)
+                self._entries[vid] = entry
+        print(f"[DISK_CACHE] {len(self._entries)} pistas en caché ({self.total_bytes() / 1e6:.0f} MB)")
+
+    def _save_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, path)
+
+    def total_bytes(self):
+        return sum(e["size"] for e in self._entries.values())
+
+    # --- Reproducción ---
+
+    def local_info(self, vid):
+        """Info (mismo formato que buscar_audio) apuntando al fichero local, o None."""
+        if not vid:
+            return None
+        with self._lock:
+            entry = self._entries.get(vid)
+            if entry is None:
+                return None
+            self._entries.move_to_end(vid)
+        return {
+            "url": self._path(vid),
+            "title": entry["title"],
+            "duration": entry["duration"],
+            "thumbnail": entry["thumbnail"],
+            "webpage_url": entry["webpage_url"],
+            "id": vid,
+            "acodec": "opus",
+            "ext": "ogg",
+            "is_live": False,
+            "gain_db": entry["baked_gain_db"],
+            "baked_gain_db": entry["baked_gain_db"] or 0.0,
+            "local": True,
+        }
+
+    def pin(self, vid):
+        """Marca el fichero como en uso. False si ya no está en la caché."""
+        with self._lock:
+            if vid not in self._entries:
+                return False
+            self._pins[vid] = self._pins.get(vid, 0) + 1
+            return True
+
+    def release(self, vid):
+        with self._lock:
+            count = self._pins.get(vid, 0) - 1
+            if count > 0:
+                self._pins[vid] = count
+            else:
+                self._pins.pop(vid, None)
+
+    def record_play(self, info, gain_db=None):
+        """
+        Cuenta una reproducción (una vez por pista, no en cada seek o reapertura):
+        acierto si sonó desde el disco; si vino de la red, descarga la pista si ya toca.
+        """
+        vid = info.get("id")
+        if not vid:
+            return
+        if info.get("local"):
+            self.hits += 1
+            return
+        self.misses += 1
+        if info.get("is_live") or not info.get("duration") or info["duration"] > self.max_duration:
+            return
+        plays = self._plays.get(vid, 0) + 1
+        self._plays.put(vid, plays)
+        if plays < self.min_plays or vid in self._downloading:
+            return
+        with self._lock:
+            if vid in self._entries:
+                return
+        self._downloading.add(vid)
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._executor, self._download, dict(info), gain_db)
+        fut.add_done_callback(lambda f, vid=vid: self._downloading.discard(vid))
+
+    # --- Descarga y expulsión (hilo de la caché) ---
+
+    def _download(self, info, gain_db):
+        vid = info["id"]
+        path = self._path(vid)
+        tmp = path + ".part"
+        cmd = [self.executable, "-hide_banner", "-loglevel", "error", "-y", *RECONNECT_OPTIONS, "-i", info["url"], "-vn"]
+        if gain_db:
+            cmd += ["-af", f"volume={gain_db}dB", "-c:a", "libopus", "-b:a", "128k"]
+        elif (info.get("acodec") or "").startswith("opus"):
+            cmd += ["-c:a", "copy"] # Ya es Opus: solo cambiar de contenedor
+        else:
+            cmd += ["-c:a", "libopus", "-b:a", "128k"]
+        cmd += ["-f", "ogg", tmp]
+
+        t0 = time.perf_counter()
+        try:
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=self.timeout, check=True)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except (subprocess.SubprocessError, OSError) as e:
+            self.download_errors += 1
+            print(f"[DISK_CACHE] Error descargando {vid}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._entries[vid] = {
+                "size": size,
+                "title": info.get("title"),
+                "duration": info.get("duration") or 0,
+                "thumbnail": info.get("thumbnail"),
+                "webpage_url": info.get("webpage_url"),
+                "baked_gain_db": gain_db,
+            }
+            self._plays.pop(vid)
+            self.downloads += 1
+            self._evict()
+            self._save_index()
+        print(f"[DISK_CACHE] Guardada {info.get('title')} ({size / 1e6:.1f} MB en {time.perf_counter() - t0:.1f}s)")
+
+    def _evict(self):
+        """Borra las pistas menos usadas hasta caber en max_bytes (con el lock cogido)."""
+        total = self.total_bytes()
+        for vid in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if self._pins.get(vid): # Sonando ahora mismo: no se toca
+                continue
+            try:
+                os.remove(self._path(vid))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[DISK_CACHE] No se pudo borrar {vid}: {e}")
+                continue
+            total -= self._entries.pop(vid)["size"]
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "files": len(self._entries),
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "downloads": self.downloads,
+            "download_errors": self.download_errors,
+            "downloading": len(self._downloading),
+            "evictions": self.evictions,
+            "pinned": len(self._pins),
+        }
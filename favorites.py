@@ -0,0 +1,89 @@
+import asyncio
+import functools
+
+import database as db
+from cache import LRUCache, canonical_url, video_id_from_url
+
+
+def favorite_key(url):
+    """Clave de un favorito: el ID de vídeo de YouTube o, si no es de YouTube, la URL normalizada."""
+    return video_id_from_url(url) or canonical_url(url)
+
+
+class FavoritesIndex:
+    """
+    Qué canciones tiene cada usuario en favoritos, en memoria.
+
+    Sustituye a leer todos los favoritos de la DB en cada pulsación del ❤️:
+    la primera vez se cargan (en el executor) y a partir de ahí saber si una
+    canción está es una búsqueda en un dict. Cada alta/baja actualiza el
+    índice antes de escribir en la DB, así dos pulsaciones seguidas ven el
+    estado correcto. Si la escritura falla, el usuario se vuelve a cargar.
+    Acotado por LRU: los usuarios que no lo usan hace tiempo se olvidan.
+    """
+
+    def __init__(self, maxsize=1000):
+        self._users = LRUCache(maxsize=maxsize) # user_id -> {clave: URL tal cual está en la DB}
+        self._loading = {} # user_id -> Task de la carga en curso
+        self.loads = 0
+        self.writes = 0
+        self.errors = 0
+
+    async def _entries(self, user_id):
+        entries = self._users.get(user_id)
+        if entries is not None:
+            return entries
+        task = self._loading.get(user_id)
+        if task is None: # Pulsaciones simultáneas comparten la misma carga
+            task = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+            task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await task
+
+    async def _load(self, user_id):
+        favs = await asyncio.get_running_loop().run_in_executor(None, db.get_favorites, user_id)
+        if favs is None: # Sin DB no es lo mismo que sin favoritos: no se guarda nada en el índice
+            raise ConnectionError("no hay conexión con la base de datos")
+        entries = {}
+        for f in favs:
+            entries.setdefault(favorite_key(f["webpage_url"]), f["webpage_url"])
+        self._users.put(user_id, entries)
+        self.loads += 1
+        return entries
+
+    async def toggle(self, user_id, track):
+        """
+        Añade o quita `track` de los favoritos del usuario.
+        Devuelve (añadida, éxito, mensaje); añadida es None si no se pudo hacer nada.
+        """
+        try:
+            entries = await self._entries(user_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"[FAVORITES] Error cargando favoritos de {user_id}: {e}")
+            return None, False, "No se pudieron cargar tus favoritos, inténtalo más tarde."
+        key = favorite_key(track["webpage_url"])
+        stored = entries.pop(key, None)
+        if stored is not None:
+            # La DB borra por URL exacta: la que se guardó, no la que suena ahora
+            added, write = False, functools.partial(db.remove_favorite, user_id, {**track, "webpage_url": stored})
+        else:
+            entries[key] = track["webpage_url"]
+            added, write = True, functools.partial(db.save_favorite, user_id, track)
+
+        try:
+            success, msg = await asyncio.get_running_loop().run_in_executor(None, write)
+        except Exception as e:
+            success, msg = False, str(e)
+        self.writes += 1
+        if not success:
+            self.errors += 1
+            self._users.pop(user_id) # No se sabe qué quedó en la DB: se recarga en la próxima pulsación
+        return added, success, msg
+
+    def stats(self):
+        return {
+            "users": len(self._users),
+            "loads": self.loads,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
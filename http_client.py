@@ -0,0 +1,60 @@
+import asyncio
+
+import aiohttp
+
+# User-Agent de navegador para evitar bloqueos al leer páginas públicas
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+
+# Estados que merece la pena reintentar
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    Cliente HTTP asíncrono compartido (aiohttp) con pool de conexiones,
+    keep-alive, timeouts estrictos y reintentos con backoff exponencial.
+    La sesión se crea la primera vez que se usa (necesita el loop en marcha).
+    """
+
+    def __init__(self, timeout=5.0, connect_timeout=2.0, retries=2, backoff=0.5, limit=20, headers=None):
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.headers = headers or DEFAULT_HEADERS
+        self._session = None
+        self.requests = 0
+        self.failures = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        return self._session
+
+    async def get_text(self, url, **kwargs):
+        """GET con reintentos. Devuelve (status, texto). Lanza la última excepción si todos fallan."""
+        session = self._get_session()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            self.requests += 1
+            try:
+                async with session.get(url, **kwargs) as resp:
+                    text = await resp.text()
+                    if resp.status in RETRY_STATUSES and attempt < self.retries:
+                        last_error = aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                        continue
+                    return resp.status, text
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+        self.failures += 1
+        raise last_error
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self):
+        return {"requests": self.requests, "failures": self.failures}
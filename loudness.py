@@ -0,0 +1,132 @@
+import asyncio
+import json
+import math
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+from cache import LRUCache
+
+# Límites de la ganancia aplicada (dB)
+MIN_GAIN_DB = -20.0
+MAX_GAIN_DB = 10.0
+# Techo de true peak tras aplicar la ganancia (dBTP)
+MAX_TRUE_PEAK = -1.0
+
+RECONNECT_OPTIONS = ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+
+
+def compute_gain(integrated_lufs: float, true_peak: float, target: float) -> float:
+    """Ganancia para llevar la pista a `target` LUFS sin que el pico pase de MAX_TRUE_PEAK."""
+    gain = target - integrated_lufs
+    if true_peak is not None:
+        gain = min(gain, MAX_TRUE_PEAK - true_peak)
+    return round(max(MIN_GAIN_DB, min(MAX_GAIN_DB, gain)), 2)
+
+
+def parse_loudnorm(stderr: str):
+    """Extrae (input_i, input_tp) del JSON que imprime loudnorm=print_format=json."""
+    start = stderr.rfind("{")
+    end = stderr.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        data = json.loads(stderr[start:end + 1])
+        lufs = float(data["input_i"])
+        peak = float(data["input_tp"])
+    except (ValueError, KeyError):
+        return None
+    if math.isinf(lufs) or math.isnan(lufs): # Silencio
+        return None
+    return lufs, None if math.isinf(peak) else peak
+
+
+class LoudnessNormalizer:
+    """
+    Normalización de volumen por pista (EBU R128).
+
+    - La sonoridad integrada se mide una sola vez por ID de vídeo, en segundo
+      plano (ffmpeg + loudnorm), y se guarda en la tabla track_loudness.
+    - Al reproducir, la ganancia guardada se aplica como un único filtro de
+      ffmpeg (sin trabajo en Python por cada frame).
+    - Mientras una pista no está medida se usa el volumen por defecto.
+    """
+
+    def __init__(self, executable="ffmpeg", target=-20.0, workers=1, max_seconds=600, timeout=300):
+        self.executable = executable
+        self.target = target
+        self.max_seconds = max_seconds # Solo se analiza el principio de pistas muy largas
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loudness")
+        self._gains = LRUCache(maxsize=4096) # video_id -> gain_db (medidas de esta sesión)
+        self._pending = {} # video_id -> Future
+        self.measured = 0
+        self.failed = 0
+        self.measure_time = 0.0
+
+    def gain_for(self, info: dict):
+        """Ganancia en dB para una info de buscar_audio, o None si aún no está medida."""
+        vid = info.get("id")
+        if vid:
+            gain = self._gains.get(vid)
+            if gain is not None:
+                return gain
+        return info.get("gain_db")
+
+    def schedule(self, info: dict):
+        """Mide la pista en segundo plano si todavía no tiene ganancia guardada."""
+        vid = info.get("id")
+        if not vid or info.get("is_live") or not info.get("url"):
+            return
+        if self.gain_for(info) is not None or vid in self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._executor, self._measure_and_save, vid, info["url"])
+        self._pending[vid] = fut
+        fut.add_done_callback(lambda f, vid=vid: self._done(vid, f))
+
+    def _done(self, vid, fut):
+        self._pending.pop(vid, None)
+        if fut.cancelled():
+            return
+        gain = fut.result() if fut.exception() is None else None
+        if gain is not None:
+            self._gains.put(vid, gain)
+
+    def measure(self, stream_url):
+        """Ejecuta ffmpeg con loudnorm (BLOQUEANTE). Devuelve (lufs, true_peak) o None."""
+        cmd = [self.executable, "-hide_banner", "-nostats", *RECONNECT_OPTIONS,
+               "-i", stream_url, "-vn", "-t", str(self.max_seconds),
+               "-af", f"loudnorm=I={self.target}:print_format=json", "-f", "null", "-"]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                timeout=self.timeout, text=True, errors="replace")
+        return parse_loudnorm(result.stderr)
+
+    def _measure_and_save(self, vid, stream_url):
+        t0 = time.perf_counter()
+        try:
+            measurement = self.measure(stream_url)
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"[LOUDNESS] Error midiendo {vid}: {e}")
+            measurement = None
+        finally:
+            self.measure_time += time.perf_counter() - t0
+        if measurement is None:
+            self.failed += 1
+            return None
+        lufs, peak = measurement
+        gain = compute_gain(lufs, peak, self.target)
+        db.save_loudness(vid, lufs, peak, gain)
+        self.measured += 1
+        print(f"[LOUDNESS] {vid}: {lufs:.1f} LUFS, pico {peak if peak is not None else '?'} dBTP -> {gain:+.1f} dB ({time.perf_counter() - t0:.1f}s)")
+        return gain
+
+    def stats(self):
+        return {
+            "measured": self.measured,
+            "failed": self.failed,
+            "pending": len(self._pending),
+            "measure_seconds": round(self.measure_time, 1),
+            "target": self.target,
+        }
@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+
+BULK_DELETE_MAX_AGE = 14 * 24 * 3600 # Discord no borra en lote mensajes de más de 14 días
+
+
+class MessageRegistry:
+    """
+    IDs de los mensajes que ha enviado el bot, por canal y en orden de envío.
+
+    Sustituye a leer el historial del canal para encontrar los mensajes del
+    bot: la limpieza sabe exactamente qué borrar y un canal sin nada pendiente
+    no cuesta ninguna llamada a la API.
+    """
+
+    def __init__(self, min_age=60, max_age=BULK_DELETE_MAX_AGE - 3600, max_per_channel=500):
+        self.min_age = min_age # Antigüedad a partir de la que un mensaje se puede borrar
+        self.max_age = max_age # Más viejos ya no se pueden borrar en lote: se olvidan
+        self.max_per_channel = max_per_channel
+        self._channels = {} # channel_id -> OrderedDict(message_id -> hora de envío)
+        self.registered = 0
+        self.forgotten = 0
+
+    def add(self, channel_id, message_id, sent_at=None):
+        messages = self._channels.setdefault(channel_id, OrderedDict())
+        messages[message_id] = sent_at or time.time()
+        self.registered += 1
+        if len(messages) > self.max_per_channel:
+            messages.popitem(last=False)
+            self.forgotten += 1
+
+    def discard(self, channel_id, message_ids):
+        """Quita mensajes ya borrados (por el bot, por delete_after o a mano)."""
+        messages = self._channels.get(channel_id)
+        if not messages:
+            return
+        for message_id in message_ids:
+            messages.pop(message_id, None)
+        if not messages:
+            del self._channels[channel_id]
+
+    def due(self, channel_id, keep=(), now=None):
+        """IDs del canal con más de min_age segundos (sin los de `keep`), del más viejo al más nuevo."""
+        messages = self._channels.get(channel_id)
+        if not messages:
+            return []
+        now = now or time.time()
+        result = []
+        for message_id, sent_at in messages.items(): # Orden de envío: se para en el primero reciente
+            if now - sent_at < self.min_age:
+                break
+            if message_id not in keep and now - sent_at < self.max_age:
+                result.append(message_id)
+        return result
+
+    def prune(self, now=None):
+        """Olvida los mensajes que ya no se pueden borrar en lote."""
+        now = now or time.time()
+        for channel_id in list(self._channels):
+            messages = self._channels[channel_id]
+            while messages and now - next(iter(messages.values())) >= self.max_age:
+                messages.popitem(last=False)
+                self.forgotten += 1
+            if not messages:
+                del self._channels[channel_id]
+
+    def stats(self):
+        return {
+            "channels": len(self._channels),
+            "messages": sum(len(m) for m in self._channels.values()),
+            "registered": self.registered,
+            "forgotten": self.forgotten,
+        }
@@ -0,0 +1,198 @@
+import asyncio
+import time
+
+import discord
+
+BAR_SEGMENTS = 20 # La barra del embed solo se mueve 20 veces por canción
+UNCHANGED = object() # render() sin nada nuevo que mostrar
+
+
+class _Bucket:
+    """Token bucket: `rate` ediciones por segundo con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def available(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Entry:
+    __slots__ = ("guild_id", "message", "duration", "due", "urgent", "in_flight", "force")
+
+    def __init__(self, guild_id, message, duration):
+        self.guild_id = guild_id
+        self.message = message
+        self.duration = duration
+        self.due = 0.0 # Primera edición en cuanto haya presupuesto
+        self.urgent = False
+        self.in_flight = False
+        self.force = True # Mensaje nuevo o edición fallida: se envía aunque no haya cambios
+
+
+class NowPlayingScheduler:
+    """
+    Dueño único de todos los mensajes de "ahora suena" (sustituye a una tarea
+    por servidor editando cada segundo).
+
+    - Las peticiones se fusionan: un mensaje tiene como mucho una edición en
+      curso y la siguiente se renderiza con el estado de ese momento.
+    - Presupuesto por bucket de rate limit: uno por canal (Discord limita las
+      ediciones por canal) y uno global, para no provocar 429.
+    - El intervalo de cada servidor sale de la duración de la pista (la barra
+      solo cambia cada duración/20) y del número de servidores activos.
+    - Las ediciones urgentes (cambio de estado, pausa) van antes que los ticks
+      de progreso y pueden usar la reserva del bucket del canal.
+
+    render(guild_id, force) devuelve el embed a mostrar, UNCHANGED si se vería
+    igual que el que ya está (no se gasta presupuesto y se vuelve a mirar en
+    `poll` segundos), o None si ya no suena nada.
+    """
+
+    def __init__(self, render, channel_rate=0.8, channel_burst=4, global_rate=20.0,
+                 min_interval=5.0, max_interval=15.0, tick=0.25, poll=1.0):
+        self.render = render
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tick = tick
+        self.poll = poll
+        self._global = _Bucket(global_rate, global_rate)
+        self._channels = {} # channel_id -> _Bucket
+        self._entries = {} # guild_id -> _Entry
+        self._wake = asyncio.Event()
+        self._task = None
+        self.edits = 0
+        self.urgent_edits = 0
+        self.deferred = 0
+        self.unchanged = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # --- API ---
+
+    def track(self, guild_id, message, duration=0):
+        """Empieza a mantener `message` para el servidor (sustituye al anterior)."""
+        self._entries[guild_id] = _Entry(guild_id, message, duration or 0)
+        self.start()
+        self._wake.set()
+
+    def untrack(self, guild_id):
+        self._entries.pop(guild_id, None)
+
+    def request(self, guild_id, urgent=False):
+        """Pide una edición: urgente = ya (pausa, seek...), si no en el próximo tick libre."""
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            return
+        if urgent:
+            entry.urgent = True
+            self._wake.set()
+        else:
+            entry.due = min(entry.due, time.monotonic())
+
+    def interval_for(self, duration):
+        """Segundos entre ediciones de progreso para una pista de `duration` segundos."""
+        base = duration / BAR_SEGMENTS if duration else self.max_interval
+        base = min(self.max_interval, max(self.min_interval, base))
+        # Los ticks de progreso no gastan más de la mitad del presupuesto global
+        return max(base, len(self._entries) / (self._global.rate * 0.5))
+
+    # --- Bucle ---
+
+    def _bucket(self, channel_id):
+        bucket = self._channels.get(channel_id)
+        if bucket is None:
+            bucket = self._channels[channel_id] = _Bucket(self.channel_rate, self.channel_burst)
+        return bucket
+
+    async def _run(self):
+        while self._entries:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.tick)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.monotonic()
+            due = [e for e in self._entries.values() if not e.in_flight and (e.urgent or e.due <= now)]
+            due.sort(key=lambda e: (not e.urgent, e.due))
+            for entry in due:
+                channel = self._bucket(getattr(entry.message.channel, "id", None))
+                reserve = 0 if entry.urgent else 1 # Un token del canal queda para lo urgente
+                if self._global.available(now) < 1 or channel.available(now) < 1 + reserve:
+                    self.deferred += 1
+                    continue
+                try:
+                    embed = self.render(entry.guild_id, entry.urgent or entry.force)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[NOW_PLAYING] Error renderizando (guild {entry.guild_id}): {e}")
+                    entry.due = now + self.max_interval
+                    continue
+                if embed is None:
+                    self._drop(entry)
+                    continue
+                if embed is UNCHANGED:
+                    self.unchanged += 1
+                    entry.urgent = False
+                    entry.due = now + self.poll
+                    continue
+                self._global.take()
+                channel.take()
+                entry.in_flight = True
+                if entry.urgent:
+                    self.urgent_edits += 1
+                entry.urgent = entry.force = False # Lo que llegue mientras se edita vuelve a marcarlo
+                asyncio.get_running_loop().create_task(self._edit(entry, embed))
+        # Sin mensajes que mantener: limpiar los buckets de canal llenos
+        self._channels = {cid: b for cid, b in self._channels.items() if b.available(time.monotonic()) < b.burst}
+
+    async def _edit(self, entry, embed):
+        try:
+            await entry.message.edit(embed=embed)
+            self.edits += 1
+        except discord.NotFound:
+            self._drop(entry) # Mensaje borrado
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.rate_limited += 1
+            else:
+                self.errors += 1
+            entry.force = True
+            print(f"[NOW_PLAYING] Error al editar mensaje (guild {entry.guild_id}): {e}")
+        except Exception as e:
+            self.errors += 1
+            entry.force = True
+            print(f"[NOW_PLAYING] Error al editar mensaje (guild {entry.guild_id}): {e}")
+        finally:
+            entry.in_flight = False
+            entry.due = time.monotonic() + self.interval_for(entry.duration)
+
+    def _drop(self, entry):
+        if self._entries.get(entry.guild_id) is entry:
+            del self._entries[entry.guild_id]
+
+    def stats(self):
+        return {
+            "tracked": len(self._entries),
+            "edits": self.edits,
+            "urgent_edits": self.urgent_edits,
+            "deferred": self.deferred,
+            "unchanged": self.unchanged,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "interval": round(self.interval_for(240), 1), # Para una canción de 4 minutos con la carga actual
+        }
@@ -0,0 +1,81 @@
+import discord
+
+BAR_LENGTH = 20
+EMBED_COLOR = 0x2b2d31
+AUTHOR_NAME = "Tune Flow"
+AUTHOR_ICON = "https://media0.giphy.com/media/v1.Y2lkPTc5MGI3NjExYmVmNDQ4d210cjNxczNleXJ4ODI2bDJ1OGMwdHE5YnhmdWVmdmVyZyZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9Zw/yZ7Xya4covzN1WhOAa/giphy.gif"
+DEFAULT_THUMBNAIL = "https://cdn-icons-png.flaticon.com/512/1384/1384060.png" # Icono Youtube genérico funcional
+LIVE_STEP = 60 # En un directo no hay barra: el tiempo se actualiza por minutos
+
+# Todas las barras posibles, calculadas una vez: BAR_FRAMES[i] tiene i segmentos avanzados
+BAR_FRAMES = tuple("▬" * i + "🔘" + "─" * (BAR_LENGTH - i) for i in range(BAR_LENGTH + 1))
+
+
+def fmt_time(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    if h > 0: return f"{h:02d}:{m:02d}:{s:02d}"
+    return f"{m:02d}:{s:02d}"
+
+
+def platform_of(url):
+    if "spotify" in url: return "💚 Spotify"
+    if "youtu" in url: return "🟥 YouTube"
+    if "soundcloud" in url: return "🧡 SoundCloud"
+    return "🔗 Otro"
+
+
+class NowPlayingRenderer:
+    """
+    Embed de "ahora suena" de una pista (estilo Rythm, minimalista).
+
+    Lo que no cambia durante la pista (título, plataforma, carátula, pie) se
+    calcula una vez. render() solo devuelve un embed cuando cambia algo visible:
+    la barra (20 posiciones), la pausa, o el minuto en los directos; el tiempo
+    mostrado es el del momento de ese cambio. Si no, devuelve None.
+    """
+
+    def __init__(self, title, url, duration, thumbnail, requester=None, channel_name=None):
+        self.key = (title, url, duration, thumbnail, requester, channel_name)
+        self.duration = duration if duration and duration > 0 else 0
+        meta = [platform_of(url or "")]
+        if requester: meta.append(f"👤 {requester}")
+        if channel_name: meta.append(f"🔊 {channel_name}")
+        self._header = f"**[{title}]({url})**\n" + " | ".join(meta) + "\n\n"
+        self._total = fmt_time(self.duration)
+
+        footer = []
+        if requester: footer.append(f"👤 {requester}")
+        if channel_name: footer.append(f"🔊 {channel_name}")
+        footer.append("✨ Autoplay: ON")
+
+        self._embed = discord.Embed(color=EMBED_COLOR)
+        self._embed.set_author(name=AUTHOR_NAME, icon_url=AUTHOR_ICON)
+        self._embed.set_image(url=thumbnail or DEFAULT_THUMBNAIL) # Carátula GRANDE (ocupa todo el ancho)
+        self._embed.set_footer(text=" • ".join(footer))
+        self._last = None # Estado visible del último embed devuelto
+
+    def visible_state(self, elapsed, paused=False):
+        """Lo que se ve del progreso: (posición de la barra o minuto del directo, pausa)."""
+        if self.duration:
+            step = min(BAR_LENGTH, max(0, int(BAR_LENGTH * elapsed / self.duration)))
+        else:
+            step = int(elapsed // LIVE_STEP)
+        return step, paused
+
+    def render(self, elapsed, paused=False, force=False):
+        """Embed actualizado, o None si se vería igual que el último (salvo force)."""
+        state = self.visible_state(elapsed, paused)
+        if state == self._last and not force:
+            return None
+        self._last = state
+        if self.duration:
+            time_str = f"`{fmt_time(elapsed)} / {self._total}`"
+            bar = BAR_FRAMES[state[0]]
+        else:
+            time_str = f"`🔴 EN DIRECTO · {fmt_time(elapsed)}`"
+            bar = BAR_FRAMES[0]
+        if paused:
+            time_str = f"⏸️ {time_str}"
+        self._embed.description = f"{self._header}{time_str}\n{bar}"
+        return self._embed
@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import canonical_url
+
+# Carriles de prioridad (número más bajo = se atiende antes)
+PRIORITY_INTERACTIVE = 0 # /play, mensajes en el canal de música
+PRIORITY_PLAYBACK = 1 # Siguiente canción, seek, anterior
+PRIORITY_BACKGROUND = 2 # Prefetch, resolución en lote, etc.
+
+
+class ResolveCancelled(Exception):
+    """Se lanza cuando la petición se cancela (ej: el servidor hizo /stop)."""
+
+
+class _Job:
+    """Trabajo pendiente del pool. Varios llamadores pueden esperar el mismo resultado."""
+    __slots__ = ("key", "fn", "priority", "waiters", "started")
+
+    def __init__(self, key, fn, priority):
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.waiters = []
+        self.started = False
+
+    def abandoned(self):
+        # Nadie espera ya el resultado (timeout o cancelación)
+        return all(w.done() for w in self.waiters)
+
+
+class AudioResolver:
+    """
+    Ejecuta las búsquedas bloqueantes (yt-dlp) en un pool acotado de hilos
+    sin bloquear el event loop.
+
+    - `await resolver.resolve(url)` devuelve lo mismo que `fetch(url)`.
+    - Cola con prioridad: lo interactivo adelanta al trabajo de fondo.
+    - Un worker queda reservado para peticiones que no son de fondo.
+    - Peticiones iguales en vuelo se comparten (solo se extrae una vez).
+    - `cancel_guild(id)` cancela todo lo que esperaba ese servidor.
+    """
+
+    def __init__(self, fetch, workers=4, timeout=30.0, cache=None):
+        self._fetch = fetch
+        self.cache = cache # StreamCache opcional (resultados de resolve)
+        self.workers = max(2, workers)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="resolver")
+        self._pending = [] # heap de (priority, seq, job)
+        self._seq = itertools.count()
+        self._inflight = {} # key -> _Job
+        self._by_guild = {} # guild_id -> set(waiters)
+        self._cond = None
+        self._tasks = []
+        self.stats_counters = {"jobs": 0, "shared": 0, "timeouts": 0, "cancelled": 0, "errors": 0}
+        self._busy_time = 0.0
+
+    def start(self):
+        """Arranca los workers en el loop actual (se llama solo la primera vez)."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._cond = asyncio.Condition()
+        for i in range(self.workers):
+            # El worker 0 nunca coge trabajo de fondo
+            self._tasks.append(loop.create_task(self._worker(reserved=(i == 0))))
+        print(f"[RESOLVER] Pool iniciado con {self.workers} workers.")
+
+    async def resolve(self, url, priority=PRIORITY_INTERACTIVE, guild_id=None, timeout=None, refresh=False, **kwargs):
+        """
+        Resuelve una URL con `fetch` en el pool.
+        Si hay caché y la entrada sigue viva se devuelve al instante
+        (refresh=True fuerza una extracción nueva).
+        Los kwargs van a `fetch` y forman parte de la clave de deduplicación:
+        dos peticiones solo comparten trabajo si piden lo mismo.
+        """
+        if self.cache is not None and not refresh:
+            info = self.cache.get(url)
+            if info is not None:
+                return info
+        fn = functools.partial(self._fetch, url, **kwargs)
+        info = await self.run(fn, key=("resolve", canonical_url(url), refresh, tuple(sorted(kwargs.items()))), priority=priority, guild_id=guild_id, timeout=timeout)
+        if self.cache is not None:
+            self.cache.store(url, info)
+        return info
+
+    async def run(self, fn, *args, key=None, priority=PRIORITY_INTERACTIVE, guild_id=None, timeout=None):
+        """Ejecuta cualquier función bloqueante en el pool con prioridad y timeout."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        if args:
+            fn = functools.partial(fn, *args)
+
+        job = self._inflight.get(key) if key is not None else None
+        async with self._cond:
+            if job is None or job.abandoned() and not job.started:
+                job = _Job(key, fn, priority)
+                if key is not None:
+                    self._inflight[key] = job
+                heapq.heappush(self._pending, (priority, next(self._seq), job))
+                self.stats_counters["jobs"] += 1
+            else:
+                self.stats_counters["shared"] += 1
+                if not job.started and priority < job.priority:
+                    # Sube de carril: se vuelve a meter con la prioridad nueva
+                    job.priority = priority
+                    heapq.heappush(self._pending, (priority, next(self._seq), job))
+            waiter = loop.create_future()
+            job.waiters.append(waiter)
+            self._cond.notify_all()
+
+        if guild_id is not None:
+            self._by_guild.setdefault(guild_id, set()).add(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats_counters["timeouts"] += 1
+            raise
+        finally:
+            if guild_id is not None:
+                waiters = self._by_guild.get(guild_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._by_guild[guild_id]
+
+    def cancel_guild(self, guild_id):
+        """Cancela todas las peticiones pendientes de un servidor."""
+        waiters = self._by_guild.pop(guild_id, set())
+        count = 0
+        for w in waiters:
+            if not w.done():
+                w.set_exception(ResolveCancelled(f"Cancelado para guild {guild_id}"))
+                count += 1
+        if count:
+            self.stats_counters["cancelled"] += count
+            print(f"[RESOLVER] Canceladas {count} peticiones de guild {guild_id}")
+        return count
+
+    def stats(self):
+        """Contadores para diagnóstico."""
+        data = dict(self.stats_counters)
+        data["pending"] = sum(1 for _, _, j in self._pending if not j.started and not j.abandoned())
+        data["inflight"] = len(self._inflight)
+        data["busy_seconds"] = round(self._busy_time, 1)
+        if self.cache is not None:
+            data["cache"] = self.cache.stats()
+        return data
+
+    async def _take(self, reserved):
+        async with self._cond:
+            while True:
+                # Descartar trabajos ya empezados (duplicados por cambio de carril) o abandonados
+                while self._pending:
+                    _, _, job = self._pending[0]
+                    if job.started or job.abandoned():
+                        heapq.heappop(self._pending)
+                        if not job.started and self._inflight.get(job.key) is job:
+                            del self._inflight[job.key]
+                        continue
+                    break
+                if self._pending and (not reserved or self._pending[0][0] < PRIORITY_BACKGROUND):
+                    _, _, job = heapq.heappop(self._pending)
+                    job.started = True
+                    return job
+                await self._cond.wait()
+
+    async def _worker(self, reserved):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._take(reserved)
+            t0 = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn)
+            except Exception as e:
+                self.stats_counters["errors"] += 1
+                for w in job.waiters:
+                    if not w.done():
+                        w.set_exception(e)
+            else:
+                for w in job.waiters:
+                    if not w.done():
+                        w.set_result(result)
+            finally:
+                self._busy_time += time.perf_counter() - t0
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
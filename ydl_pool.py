@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from yt_dlp import YoutubeDL
+
+# Extractores que usa el bot (se instancian en el warm-up)
+WARM_EXTRACTORS = ("Youtube", "YoutubeTab", "YoutubeSearch", "Soundcloud", "Generic")
+
+
+class YDLPool:
+    """
+    Pool de instancias YoutubeDL de larga duración, una cola por perfil
+    de opciones ("track", "flat", "search"...).
+
+    Cada instancia la usa un solo hilo a la vez: se saca con `get()` y se
+    devuelve al salir del `with`. Así el registro de extractores, el parseo
+    de opciones y las cookies/caché se preparan una sola vez.
+    """
+
+    def __init__(self, profiles: dict, size=4):
+        self.profiles = profiles
+        self.size = size # Máximo de instancias por perfil
+        self._idle = {name: queue.LifoQueue() for name in profiles}
+        self._created = {name: 0 for name in profiles}
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0 # Veces que hubo que esperar a una instancia libre
+
+    def _build(self, profile):
+        ydl = YoutubeDL(dict(self.profiles[profile]))
+        for ie_key in WARM_EXTRACTORS:
+            try:
+                ydl.get_info_extractor(ie_key) # Instancia y cachea el extractor
+            except Exception:
+                pass
+        return ydl
+
+    def _acquire(self, profile):
+        idle = self._idle[profile]
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created[profile] < self.size
+            if can_create:
+                self._created[profile] += 1
+        if can_create:
+            try:
+                return self._build(profile)
+            except Exception:
+                with self._lock:
+                    self._created[profile] -= 1
+                raise
+        self.waits += 1
+        return idle.get() # Bloquea hasta que otro hilo devuelva una
+
+    @contextmanager
+    def get(self, profile="track"):
+        """Saca una instancia YoutubeDL del perfil indicado."""
+        if profile not in self._idle:
+            raise KeyError(f"Perfil de YoutubeDL desconocido: {profile}")
+        ydl = self._acquire(profile)
+        self.checkouts += 1
+        try:
+            yield ydl
+        finally:
+            self._idle[profile].put(ydl)
+
+    def warm_up(self, per_profile=1):
+        """Crea y prepara instancias por adelantado (bloqueante, llamar en un executor)."""
+        t0 = time.perf_counter()
+        for profile in self.profiles:
+            with self._lock:
+                missing = max(0, min(per_profile, self.size) - self._created[profile])
+                self._created[profile] += missing
+            for built in range(missing):
+                try:
+                    ydl = self._build(profile)
+                except Exception:
+                    with self._lock: # Las que no se llegaron a crear vuelven a estar disponibles
+                        self._created[profile] -= missing - built
+                    raise
+                self._idle[profile].put(ydl)
+        print(f"[YDL_POOL] Warm-up completado en {time.perf_counter() - t0:.2f}s ({', '.join(self.profiles)})")
+
+    def close(self):
+        """Cierra todas las instancias (guarda cookies, etc.)."""
+        for idle in self._idle.values():
+            while True:
+                try:
+                    ydl = idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    ydl.close()
+                except Exception:
+                    pass
+
+    def stats(self):
+        return {
+            "created": dict(self._created),
+            "idle": {name: q.qsize() for name, q in self._idle.items()},
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+        }